@@ -0,0 +1,124 @@
+"""Temps jusqu'à la première réponse d'un serveur qui vient de démarrer, avec et sans préchauffage des workers.
+
+    python -m benchmarks.cold_start                 # 5 démarrages dans chaque mode
+    python -m benchmarks.cold_start --starts 10 --output cold_start.json
+
+Chaque démarrage lance un nouveau processus Python qui sert trip_planner.wsgi avec wsgiref
+(la même application WSGI qu'un worker de production, sans les vérifications système de
+runserver), avec WARMUP_ENABLED désactivé puis activé. Le processus affiche une ligne quand il
+écoute ; le benchmark envoie alors deux fois POST /api/trips/create/ sur le trajet court.
+Le routage est hors ligne (ni MAP_API_KEY, ni matrice des trajets), sur un fichier SQLite migré
+et un répertoire var créés dans un répertoire temporaire : chaque démarrage est à froid.
+
+    ready     lancement -> écoute (interpréteur, django.setup(), préchauffage)
+    first     latence de la première requête
+    second    latence de la deuxième requête (régime établi)
+    ttfr      lancement -> première réponse reçue
+
+Les médianes de --starts démarrages sont affichées.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.run import LANES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD = {**LANES['short'], 'current_cycle_hours': 10}
+MEASURES = ['ready', 'first', 'second', 'ttfr']
+
+
+def serve(port):
+    """Processus serveur : charge l'application WSGI et la sert jusqu'à son arrêt."""
+    from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+    from trip_planner.wsgi import application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = make_server('127.0.0.1', port, application, handler_class=QuietHandler)
+    print(f"listening on {server.server_port}", flush=True)
+    server.serve_forever()
+
+
+def environment(directory, warmup):
+    return {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'trip_planner.settings',
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'benchmarks'),
+        'SQLITE_PATH': os.path.join(directory, 'cold_start.sqlite3'),
+        'VAR_DIR': os.path.join(directory, 'var'),
+        'LANE_MATRIX_PATH': os.path.join(directory, 'no-lane-matrix'),
+        'MAP_API_KEY': '',
+        'WARMUP_ENABLED': 'True' if warmup else 'False',
+        'PYTHONPATH': ROOT,
+    }
+
+
+def create_trip(port):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/api/trips/create/', data=json.dumps(PAYLOAD).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+        if response.status != 201:
+            raise RuntimeError(f"Unexpected status {response.status}")
+    return time.perf_counter() - started
+
+
+def start(warmup):
+    """Un démarrage à froid dans un nouveau répertoire temporaire ; retourne {mesure: secondes}."""
+    with tempfile.TemporaryDirectory() as directory:
+        env = environment(directory, warmup)
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'], cwd=ROOT,
+                       env={**env, 'WARMUP_ENABLED': 'False'}, check=True)
+
+        spawned = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-m', 'benchmarks.cold_start', '--serve', '0'], cwd=ROOT, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            line = process.stdout.readline()
+            if not line.startswith('listening'):
+                raise RuntimeError("The server did not start")
+            ready = time.perf_counter() - spawned
+            port = int(line.split()[-1])
+            first = create_trip(port)
+            ttfr = time.perf_counter() - spawned
+            second = create_trip(port)
+        finally:
+            process.terminate()
+            process.wait()
+    return {'ready': ready, 'first': first, 'second': second, 'ttfr': ttfr}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--starts', type=int, default=5, help="Starts in each mode.")
+    parser.add_argument('--output', help="Writes the results to this JSON file.")
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve is not None:
+        serve(args.serve)
+        return
+
+    results = {}
+    for mode, warmup in (('cold', False), ('warm-up', True)):
+        starts = [start(warmup) for _ in range(args.starts)]
+        results[mode] = {measure: statistics.median(run[measure] for run in starts) * 1000 for measure in MEASURES}
+        print(f"{mode:>8}: " + '  '.join(f"{measure} {results[mode][measure]:>7.1f} ms" for measure in MEASURES))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'starts': args.starts, 'medians_ms': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Créations de trajets par seconde sur une base SQLite fichier, pour plusieurs nombres de clients simultanés.
+
+    python -m benchmarks.concurrent_writes                        # 1, 8 et 32 clients
+    python -m benchmarks.concurrent_writes --queue                # via la file d'écriture du processus
+    python -m benchmarks.concurrent_writes --profile default      # sans le profil WAL/busy timeout
+
+Chaque client est un thread d'un même processus (comme les threads d'un worker du serveur)
+qui enregistre en boucle des trajets planifiés avec TripCreateView._save_trip : le trajet,
+ses entrées de log et son index d'itinéraire dans une transaction. La planification, le
+calcul d'itinéraire et les boîtes de l'index sont calculés une fois au préalable : seul le
+chemin d'écriture est mesuré. La base est un nouveau fichier dans un répertoire temporaire.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.run import LANES, LaneBenchmark, setup_django
+
+
+def setup_database(path, profile, queue):
+    setup_django()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    # Les connexions ne sont pas encore ouvertes : la base et ses options peuvent encore changer
+    database = settings.DATABASES['default']
+    database['NAME'] = path
+    if profile == 'default':
+        database['OPTIONS'] = {}
+    settings.DB_WRITES['QUEUE'] = queue
+    call_command('migrate', verbosity=0)
+
+
+def model_copy(instance, **values):
+    """Copie non enregistrée d'une instance de modèle (clé primaire exclue)."""
+    fields = {field.attname: getattr(instance, field.attname)
+              for field in instance._meta.concrete_fields if not field.primary_key}
+    return type(instance)(**{**fields, **values})
+
+
+def run_level(clients, duration, trip, entries):
+    """Enregistre des trajets depuis `clients` threads pendant `duration` secondes ; retourne les statistiques."""
+    from django.db import OperationalError, connection
+
+    from trips.route_index import route_boxes
+    from trips.views import TripCreateView
+    from trips.write_queue import run_write
+
+    view = TripCreateView()
+    boxes = route_boxes(trip)
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        try:
+            while time.perf_counter() < deadline:
+                new_trip = model_copy(trip)
+                new_entries = [model_copy(entry, trip_id=None) for entry in entries]
+                for entry in new_entries:
+                    entry.trip = new_trip
+                started = time.perf_counter()
+                try:
+                    run_write(view._save_trip, new_trip, new_entries, boxes)
+                except OperationalError as e:  # "database is locked" au-delà du délai d'attente
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'clients': clients,
+        'creates': len(latencies),
+        'creates_per_second': len(latencies) / elapsed,
+        'errors': len(errors),
+        'error_messages': sorted(set(errors)),
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=5, help="Seconds per number of clients.")
+    parser.add_argument('--lane', choices=list(LANES), default='medium', help="Lane of the saved trips.")
+    parser.add_argument('--profile', choices=['tuned', 'default'], default='tuned',
+                        help="tuned: OPTIONS of settings.DATABASES; default: SQLite defaults.")
+    parser.add_argument('--queue', action='store_true', help="Serialize the writes with the in-process queue.")
+    parser.add_argument('--output', help="Writes the results to this JSON file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup_database(os.path.join(directory, 'bench.sqlite3'), args.profile, args.queue)
+        benchmark = LaneBenchmark(args.lane)
+        print(f"{args.profile} profile{' + write queue' if args.queue else ''}, {args.lane} lane "
+              f"({len(benchmark.entries)} log entries per trip), {args.duration:g} s per level")
+        results = []
+        for clients in args.clients:
+            result = run_level(clients, args.duration, benchmark.trip, benchmark.entries)
+            results.append(result)
+            print(f"  {clients:>3} clients: {result['creates_per_second']:>8.1f} creates/s  "
+                  f"p50 {result['p50_ms'] or 0:>8.1f} ms  p99 {result['p99_ms'] or 0:>8.1f} ms  "
+                  f"{result['errors']} errors {', '.join(result['error_messages'])}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'profile': args.profile, 'queue': args.queue, 'lane': args.lane, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
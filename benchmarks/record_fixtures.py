@@ -0,0 +1,89 @@
+"""Enregistre les fixtures d'itinéraires des benchmarks (benchmarks/fixtures/<trajet>.json).
+
+Chaque fixture contient les deux réponses directions d'OpenRouteService d'un trajet
+(position -> chargement, chargement -> livraison), au format JSON brut d'ORS lu par
+trips.routing.parse_route : les benchmarks tournent hors ligne sur le code de production.
+
+    python -m benchmarks.record_fixtures                       # graphe routier fourni
+    python -m benchmarks.record_fixtures --source ors --api-key KEY
+
+Les itinéraires du graphe routier n'ont un point que toutes les quelques miles ; ils sont
+densifiés à --spacing miles pour que le décodage et les calculs de distance portent sur
+des polylignes de la taille de celles d'ORS.
+"""
+import argparse
+import json
+import math
+import os
+
+import polyline
+
+from benchmarks.run import FIXTURES_DIR, LANES, setup_django
+
+
+def densify(coords, spacing):
+    """Insère des points tous les `spacing` miles ; retourne (points, nouvel indice de chaque point d'origine)."""
+    from trips.geo import haversine_miles
+
+    points, index_map = [coords[0]], [0]
+    for (lat_a, lon_a), (lat_b, lon_b) in zip(coords, coords[1:]):
+        count = max(1, math.ceil(haversine_miles(lat_a, lon_a, lat_b, lon_b) / spacing))
+        for k in range(1, count + 1):
+            points.append((lat_a + (lat_b - lat_a) * k / count, lon_a + (lon_b - lon_a) * k / count))
+        index_map.append(len(points) - 1)
+    return points, index_map
+
+
+def graph_directions(start_coords, end_coords, spacing):
+    """Itinéraire du graphe routier au format d'une réponse directions d'ORS (durées en secondes, comme ORS)."""
+    from trips.road_graph import get_road_graph
+
+    distance, duration, geometry, segments = get_road_graph().route(start_coords, end_coords)
+    points, index_map = densify(polyline.decode(geometry), spacing)
+    return {
+        'routes': [{
+            'summary': {'distance': distance, 'duration': duration * 3600},
+            'geometry': polyline.encode(points),
+            'segments': [{
+                'distance': segment['distance'],
+                'duration': segment['duration'] * 3600,
+                'steps': [{
+                    'distance': step['distance'],
+                    'duration': step['duration'] * 3600,
+                    'instruction': step['instruction'],
+                    'name': step['name'],
+                    'way_points': [index_map[i] for i in step['way_points']],
+                } for step in segment['steps']],
+            } for segment in segments],
+        }],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', choices=['graph', 'ors'], default='graph')
+    parser.add_argument('--api-key', default=os.environ.get('MAP_API_KEY'))
+    parser.add_argument('--spacing', type=float, default=0.25, help="Miles between points of densified graph routes.")
+    args = parser.parse_args()
+    setup_django()
+
+    from trips.gazetteer import location_coords
+    from trips.routing import request_directions
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, lane in LANES.items():
+        legs = {}
+        for leg, (origin, destination) in (('to_pickup', ('current_location', 'pickup_location')),
+                                           ('to_dropoff', ('pickup_location', 'dropoff_location'))):
+            start, end = location_coords(lane[origin]), location_coords(lane[destination])
+            legs[leg] = (request_directions(start, end, args.api_key) if args.source == 'ors'
+                         else graph_directions(start, end, args.spacing))
+        path = os.path.join(FIXTURES_DIR, f"{name}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'lane': lane, 'source': 'openrouteservice' if args.source == 'ors' else 'road_graph', **legs}, f)
+        points = sum(len(polyline.decode(legs[leg]['routes'][0]['geometry'])) for leg in legs)
+        print(f"{path}: {points} points")
+
+
+if __name__ == '__main__':
+    main()
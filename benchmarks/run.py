@@ -0,0 +1,247 @@
+"""Microbenchmarks de la chaîne de planification, sur des fixtures d'itinéraires enregistrées (sans réseau).
+
+    python -m benchmarks.run                                    # tous les trajets et étapes
+    python -m benchmarks.run --lane coast_to_coast --stage generate_eld_logs
+    python -m benchmarks.run --output before.json               # enregistre les résultats
+    python -m benchmarks.run --compare before.json --threshold 1.25
+
+Chaque étape de la chaîne est chronométrée seule sur les trajets court, moyen et
+coast-to-coast de benchmarks/fixtures (voir record_fixtures.py) : une étape tourne en
+boucles d'au moins --min-time secondes, --repeat fois, et la boucle la plus rapide donne
+son temps par appel (l'estimation la moins bruitée). Avec --compare, l'exécution échoue
+(code de sortie 1) quand une étape est plus lente que la référence de plus de --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+LANES = {
+    'short': {'current_location': 'Fort Worth, TX', 'pickup_location': 'Dallas, TX',
+              'dropoff_location': 'Houston, TX'},
+    'medium': {'current_location': 'Chicago, IL', 'pickup_location': 'Omaha, NE',
+               'dropoff_location': 'Denver, CO'},
+    'coast_to_coast': {'current_location': 'New York, NY', 'pickup_location': 'Chicago, IL',
+                       'dropoff_location': 'Los Angeles, CA'},
+}
+STAGES = ['polyline_decode', 'cumulative_distances', 'interpolate_coords', 'generate_eld_logs', 'add_log_entry',
+          'get_summary', 'trip_serializer', 'trip_serializer_packed']
+START_TIME = datetime(2025, 3, 22, 6, tzinfo=timezone.utc)
+INTERPOLATIONS = 1000
+CURRENT_CYCLE_HOURS = 10
+
+
+def setup_django():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trip_planner.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmarks')
+    import django
+    django.setup()
+
+
+def measure(func, min_time, repeat):
+    """Chronomètre func : boucles d'au moins min_time secondes, répétées ; retourne les temps par appel en ms."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed * 2 >= min_time else max(2, int(min_time / max(elapsed, 1e-9)))
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+    timings.sort()
+    return {
+        'min_ms': timings[0] * 1000,
+        'median_ms': timings[len(timings) // 2] * 1000,
+        'loops': loops,
+        'repeat': repeat,
+    }
+
+
+class LaneBenchmark:
+    """Entrées d'un trajet, construites une fois depuis sa fixture, et les étapes chronométrées."""
+
+    def __init__(self, name):
+        import polyline
+
+        from trips.models import Trip
+        from trips.planner import EldLogPlannerMixin, pack_floats
+        from trips.routing import parse_route
+
+        with open(os.path.join(FIXTURES_DIR, f"{name}.json"), encoding='utf-8') as f:
+            fixture = json.load(f)
+        self.name = name
+        self.planner = EldLogPlannerMixin()
+        distance_to_pickup, duration_to_pickup, geometry_to_pickup, segments_to_pickup = parse_route(fixture['to_pickup'])
+        distance_to_dropoff, duration_to_dropoff, geometry_to_dropoff, segments_to_dropoff = parse_route(fixture['to_dropoff'])
+        self.geometries = [geometry_to_pickup, geometry_to_dropoff]
+        self.coords = [polyline.decode(geometry) for geometry in self.geometries]
+        self.route_coords = self.coords[0] + self.coords[1]
+        self.route_distances = self.planner.calculate_route_distances(
+            self.coords[0], self.coords[1], distance_to_pickup, distance_to_dropoff
+        )
+        self.distances = (distance_to_pickup, distance_to_dropoff)
+        self.trip = Trip(
+            **fixture['lane'],
+            current_cycle_hours=CURRENT_CYCLE_HOURS,
+            start_time=START_TIME,
+            distance=distance_to_pickup + distance_to_dropoff,
+            estimated_duration=duration_to_pickup + duration_to_dropoff,
+            route_geometry_to_pickup=geometry_to_pickup,
+            route_geometry_to_dropoff=geometry_to_dropoff,
+            distance_to_pickup=distance_to_pickup,
+            distance_to_dropoff=distance_to_dropoff,
+            route_segments_to_pickup=segments_to_pickup,
+            route_segments_to_dropoff=segments_to_dropoff,
+            route_distances=pack_floats(self.route_distances),
+        )
+        self.points = len(self.route_coords)
+        self.entries = self.generate_eld_logs()
+
+    def polyline_decode(self):
+        import polyline
+        return [polyline.decode(geometry) for geometry in self.geometries]
+
+    def cumulative_distances(self):
+        return [self.planner.calculate_cumulative_distances(coords) for coords in self.coords]
+
+    def interpolate_coords(self):
+        total = self.route_distances[-1]
+        for k in range(INTERPOLATIONS):
+            self.planner.interpolate_coords(self.route_coords, self.route_distances, total * k / INTERPOLATIONS)
+
+    def generate_eld_logs(self):
+        return self.planner.generate_eld_logs(self.trip, *self.distances, CURRENT_CYCLE_HOURS, persist=False)
+
+    def add_log_entry(self):
+        """Rejoue les entrées planifiées du trajet (la vérification des chevauchements fait croître le coût avec leur nombre)."""
+        log_entries = []
+        for entry in self.entries:
+            start = datetime.combine(entry.date, entry.start_time, tzinfo=timezone.utc)
+            end = datetime.combine(entry.date, entry.end_time, tzinfo=timezone.utc)
+            if end <= start:
+                end = datetime.combine(entry.date + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+            self.planner.add_log_entry(log_entries, self.trip, start, end, entry.duty_status, entry.location,
+                                       entry.distance, entry.latitude, entry.longitude)
+
+    def save(self):
+        """Enregistre le trajet et ses logs, et une copie aux logs compactés, pour les étapes qui les relisent."""
+        from trips.models import LogEntry, Trip
+        from trips.packed_logs import pack_logs
+
+        self.trip.save()
+        for entry in self.entries:
+            entry.trip = self.trip
+        LogEntry.objects.bulk_create(self.entries)
+        self.packed_trip = Trip.objects.get(pk=self.trip.pk)
+        self.packed_trip.pk = None
+        self.packed_trip._state.adding = True
+        self.packed_trip.packed_logs = pack_logs(self.entries)
+        self.packed_trip.save()
+
+    def get_summary(self):
+        from trips.serializers import TripSerializer
+        return TripSerializer().get_summary(self.trip)
+
+    def trip_serializer(self):
+        from trips.serializers import TripSerializer
+        return TripSerializer(self.trip).data
+
+    def trip_serializer_packed(self):
+        from trips.serializers import TripSerializer
+        return TripSerializer(self.packed_trip).data
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Affiche les rapports à la référence ; retourne les étapes plus lentes que threshold fois la référence."""
+    regressions = []
+    for key, result in results.items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        ratio = result['min_ms'] / before['min_ms']
+        flag = 'REGRESSION' if ratio > threshold else ''
+        print(f"  {key:<38} {before['min_ms']:>10.3f} -> {result['min_ms']:>10.3f} ms  x{ratio:.2f} {flag}")
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lane', action='append', choices=list(LANES), help="Lanes to run (all by default).")
+    parser.add_argument('--stage', action='append', choices=STAGES, help="Stages to run (all by default).")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help="Minimum duration of a timed loop, in seconds.")
+    parser.add_argument('--output', help="Writes the results to this JSON file.")
+    parser.add_argument('--compare', help="Baseline results (JSON) to compare with.")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Fails when a stage takes more than this times its baseline time.")
+    args = parser.parse_args()
+    setup_django()
+
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    # Base SQLite de test en mémoire, pour les étapes qui relisent les logs enregistrés
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    databases = runner.setup_databases()
+    results = {}
+    try:
+        for lane in args.lane or list(LANES):
+            benchmark = LaneBenchmark(lane)
+            benchmark.save()
+            print(f"{lane}: {benchmark.points} points, {benchmark.distances[0] + benchmark.distances[1]:.0f} miles, "
+                  f"{len(benchmark.entries)} log entries")
+            for stage in args.stage or STAGES:
+                result = measure(getattr(benchmark, stage), args.min_time, args.repeat)
+                results[f"{lane}/{stage}"] = result
+                print(f"  {stage:<24} {result['min_ms']:>10.3f} ms  (median {result['median_ms']:.3f}, "
+                      f"{result['loops']} loops x {result['repeat']})")
+    finally:
+        runner.teardown_databases(databases)
+        teardown_test_environment()
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit')}), threshold x{args.threshold}:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than x{args.threshold}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Remplaçant local de l'API directions d'OpenRouteService, pour les tests de charge.
+
+    python -m loadtest.ors_stub --port 8081 --latency 300 --jitter 150 --error-rate 0.01 --throttle-rate 0.02
+
+L'application s'y branche avec ORS_BASE_URL=http://127.0.0.1:8081 (et une MAP_API_KEY
+quelconque). Les requêtes des tronçons enregistrés dans benchmarks/fixtures (ou dans les
+répertoires --fixtures, même format) reçoivent la réponse enregistrée ; les autres tronçons
+sont calculés sur le graphe routier fourni et mis au format ORS, densifiés à l'espacement
+des points d'ORS.
+
+Chaque réponse est retardée de --latency ms (+/- --jitter, uniforme). Une part des requêtes
+échoue avec une 500 (--error-rate) ou une 429 avec en-tête Retry-After (--throttle-rate) ;
+--per-minute répond aussi 429 au-delà d'un quota par minute, comme le vrai service. Les
+réponses servies par statut sont affichées à l'arrêt (Ctrl+C ou SIGTERM).
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.run import FIXTURES_DIR, setup_django
+
+# Écart maximal entre les points demandés et ceux d'un trajet enregistré pour le rejouer
+MATCH_MILES = 1.0
+LEGS = (('to_pickup', 'current_location', 'pickup_location'), ('to_dropoff', 'pickup_location', 'dropoff_location'))
+
+
+def load_recorded_legs(directories):
+    """[(start_coords, end_coords, response)] des tronçons enregistrés dans les répertoires de fixtures."""
+    from trips.gazetteer import location_coords
+
+    legs = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                fixture = json.load(f)
+            for leg, origin, destination in LEGS:
+                legs.append((location_coords(fixture['lane'][origin]), location_coords(fixture['lane'][destination]),
+                             fixture[leg]))
+    return legs
+
+
+class DirectionsStub:
+    """Choisit la réponse de chaque requête directions : échec injecté, tronçon enregistré ou itinéraire du graphe routier."""
+
+    def __init__(self, legs, latency, jitter, error_rate, throttle_rate, retry_after, per_minute, spacing, seed=None):
+        self.legs = legs
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.per_minute = per_minute
+        self.spacing = spacing
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = (0, 0)  # (minute, requêtes servies pendant cette minute)
+        self.served = Counter()
+
+    def delay(self):
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def over_quota(self):
+        if not self.per_minute:
+            return False
+        minute = int(time.time() // 60)
+        with self.lock:
+            count = self.window[1] + 1 if self.window[0] == minute else 1
+            self.window = (minute, count)
+            return count > self.per_minute
+
+    def respond(self, body):
+        """(status, headers, payload) pour le corps d'une requête directions."""
+        with self.lock:
+            draw = self.random.random()
+        if self.over_quota() or draw < self.throttle_rate:
+            return 429, {'Retry-After': str(self.retry_after)}, {'error': 'Rate Limit Exceeded'}
+        if draw < self.throttle_rate + self.error_rate:
+            return 500, {}, {'error': {'code': 2099, 'message': 'Injected failure (loadtest stub).'}}
+        try:
+            (start_lon, start_lat), (end_lon, end_lat) = body['coordinates'][:2]
+        except (KeyError, TypeError, ValueError):
+            return 400, {}, {'error': {'code': 2003, 'message': "Parameter 'coordinates' is invalid."}}
+        return 200, {}, self.directions((start_lat, start_lon), (end_lat, end_lon))
+
+    def directions(self, start, end):
+        from trips.geo import haversine_miles
+
+        for recorded_start, recorded_end, response in self.legs:
+            if (haversine_miles(*start, *recorded_start) <= MATCH_MILES
+                    and haversine_miles(*end, *recorded_end) <= MATCH_MILES):
+                return response
+        return self.graph_directions(round(start[0], 5), round(start[1], 5), round(end[0], 5), round(end[1], 5))
+
+    @lru_cache(maxsize=1024)
+    def graph_directions(self, start_lat, start_lon, end_lat, end_lon):
+        from benchmarks.record_fixtures import graph_directions
+        return graph_directions((start_lat, start_lon), (end_lat, end_lon), self.spacing)
+
+
+class DirectionsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        from trips.routing import ORS_DIRECTIONS_PATH
+
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            body = None
+        if self.path.split('?')[0] != ORS_DIRECTIONS_PATH:
+            status, headers, payload = 404, {}, {'error': 'Not Found'}
+        elif not isinstance(body, dict):
+            status, headers, payload = 400, {}, {'error': {'code': 2000, 'message': 'Unable to parse JSON request.'}}
+        else:
+            status, headers, payload = stub.respond(body)
+        time.sleep(stub.delay())
+
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+        with stub.lock:
+            stub.served[status] += 1
+
+    def log_message(self, format, *args):
+        pass  # Une ligne par requête noierait la sortie pendant un test de charge
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fixtures', action='append', help="Directories of recorded legs (benchmarks/fixtures by default).")
+    parser.add_argument('--latency', type=float, default=300, help="Mean response delay, in ms.")
+    parser.add_argument('--jitter', type=float, default=150, help="Maximum deviation from --latency, in ms.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 500.")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests answered with a 429.")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After of the 429 responses, in seconds.")
+    parser.add_argument('--per-minute', type=int, default=0, help="Quota per minute beyond which 429 is returned (0: none).")
+    parser.add_argument('--spacing', type=float, default=0.25, help="Miles between points of road graph routes.")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    setup_django()
+
+    legs = load_recorded_legs(args.fixtures or [FIXTURES_DIR])
+    server = ThreadingHTTPServer((args.host, args.port), DirectionsHandler)
+    server.daemon_threads = True
+    server.stub = DirectionsStub(legs, args.latency, args.jitter, args.error_rate, args.throttle_rate,
+                                 args.retry_after, args.per_minute, args.spacing, args.seed)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"ORS stand-in on http://{args.host}:{args.port} ({len(legs)} recorded legs)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {dict(sorted(server.stub.served.items()))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Générateur de charge HTTP pour l'API des trajets : débit et percentiles de latence par endpoint.
+
+    python -m loadtest.run --url http://127.0.0.1:8000/api/ --concurrency 8 --duration 60
+    python -m loadtest.run --rate 20 --mix create=1,list=1,detail=8 --output results.json
+
+Les workers envoient un mélange pondéré de créations (POST trips/create/), de listes
+(GET trips/) et de détails de trajets (GET trips/<id>/ des trajets créés ou listés jusque-là).
+Les trajets créés suivent un des trajets enregistrés des benchmarks, ou trois villes au hasard
+du graphe routier avec --lanes random (calculés par le remplaçant d'ORS, voir ors_stub.py).
+
+Par défaut chaque worker envoie sa requête suivante dès la réponse à la précédente (boucle
+fermée). Avec --rate, les requêtes sont planifiées à ce débit global et la latence est mesurée
+depuis l'heure prévue : un serveur saturé se voit dans les percentiles au lieu de seulement
+réduire le débit. Les requêtes de la période --warmup ne sont pas comptées.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin
+
+import requests
+
+from benchmarks.run import LANES, git_commit
+
+ENDPOINTS = ('create', 'list', 'detail')
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    """'create=1,list=2,detail=7' -> {'create': 1.0, 'list': 2.0, 'detail': 7.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name.strip()!r} (expected {', '.join(ENDPOINTS)})")
+        try:
+            mix[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight {weight!r}")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("at least one endpoint needs a positive weight")
+    return mix
+
+
+def percentile(sorted_values, p):
+    """Percentile au rang le plus proche d'une liste déjà triée."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+class LoadTest:
+    """État partagé des workers : planning, ids de trajets connus et mesures collectées."""
+
+    def __init__(self, url, mix, lanes, duration, warmup, rate, timeout, seed=None):
+        self.url = url if url.endswith('/') else url + '/'
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.lanes = lanes
+        self.duration = duration
+        self.warmup = warmup
+        self.rate = rate
+        self.timeout = timeout
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.trip_ids = []
+        self.known_ids = set()
+        self.scheduled = 0
+        self.samples = defaultdict(list)  # endpoint -> [(latency_seconds, status)]
+        self.started = self.measure_from = self.stop_at = None
+
+    def next_slot(self):
+        """Heure prévue de la requête suivante avec --rate, sinon maintenant ; None une fois le test fini."""
+        with self.lock:
+            if self.rate:
+                slot = self.started + self.scheduled / self.rate
+                self.scheduled += 1
+            else:
+                slot = time.perf_counter()
+        return slot if slot < self.stop_at else None
+
+    def worker(self, number):
+        rng = random.Random(None if self.seed is None else self.seed + number)
+        session = requests.Session()
+        while True:
+            slot = self.next_slot()
+            if slot is None:
+                return
+            delay = slot - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = rng.choices(self.endpoints, self.weights)[0]
+            with self.lock:
+                trip_id = rng.choice(self.trip_ids) if self.trip_ids else None
+            if endpoint == 'detail' and trip_id is None:
+                endpoint = 'create'  # Aucun trajet connu pour l'instant
+            status = self.send(session, endpoint, trip_id, rng)
+            latency = time.perf_counter() - slot
+            if slot >= self.measure_from:
+                with self.lock:
+                    self.samples[endpoint].append((latency, status))
+
+    def send(self, session, endpoint, trip_id, rng):
+        """Envoie une requête ; retourne son code de statut, ou 'error' si aucune réponse n'a été reçue."""
+        try:
+            if endpoint == 'create':
+                response = session.post(urljoin(self.url, 'trips/create/'), json=self.trip_payload(rng),
+                                         timeout=self.timeout)
+                if response.status_code == 201:
+                    self.remember(response.json().get('id'))
+            elif endpoint == 'list':
+                response = session.get(urljoin(self.url, 'trips/'), timeout=self.timeout)
+                if response.status_code == 200:
+                    payload = response.json()
+                    trips = payload.get('results', []) if isinstance(payload, dict) else payload
+                    for trip in trips[:100]:
+                        self.remember(trip.get('id'))
+            else:
+                response = session.get(urljoin(self.url, f'trips/{trip_id}/'), timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            return 'error'
+        return response.status_code
+
+    def remember(self, trip_id):
+        if trip_id is not None:
+            with self.lock:
+                if trip_id not in self.known_ids:
+                    self.known_ids.add(trip_id)
+                    self.trip_ids.append(trip_id)
+
+    def trip_payload(self, rng):
+        start = datetime.now(timezone.utc) + timedelta(hours=rng.randint(0, 72))
+        return {
+            **rng.choice(self.lanes),
+            'current_cycle_hours': rng.choice([0, 0, 10, 25, 40, 55]),
+            'start_time': start.replace(minute=0, second=0, microsecond=0).isoformat(),
+        }
+
+    def run(self, concurrency):
+        self.started = time.perf_counter()
+        self.measure_from = self.started + self.warmup
+        self.stop_at = self.measure_from + self.duration
+        threads = [threading.Thread(target=self.worker, args=(n,), daemon=True) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Avec --rate, les requêtes en retard sur leur créneau ont pu finir après la fin prévue
+        return max(self.duration, time.perf_counter() - self.measure_from)
+
+    def report(self, elapsed):
+        """{endpoint: stats} de la période mesurée, avec une entrée 'all'."""
+        results = {}
+        everything = []
+        for endpoint in ENDPOINTS:
+            if self.samples.get(endpoint):
+                results[endpoint] = summarize(self.samples[endpoint], elapsed)
+                everything += self.samples[endpoint]
+        if everything:
+            results['all'] = summarize(everything, elapsed)
+        return results
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = defaultdict(int)
+    for _, status in samples:
+        statuses[str(status)] += 1
+    errors = sum(count for status, count in statuses.items() if not status.startswith(('2', '3')))
+    stats = {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput': len(samples) / elapsed,
+        'statuses': dict(sorted(statuses.items())),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+    for p in PERCENTILES:
+        stats[f'p{p}_ms'] = percentile(latencies, p) * 1000
+    return stats
+
+
+def random_lanes(count, seed):
+    """Trajets entre trois villes distinctes tirées au hasard dans le graphe routier."""
+    from trips.constants import CITIES_WITH_COORDS
+
+    rng = random.Random(seed)
+    cities = sorted(CITIES_WITH_COORDS)
+    lanes = []
+    for _ in range(count):
+        current, pickup, dropoff = rng.sample(cities, 3)
+        lanes.append({'current_location': current, 'pickup_location': pickup, 'dropoff_location': dropoff})
+    return lanes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api/', help="Base URL of the API.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Number of concurrent workers.")
+    parser.add_argument('--duration', type=float, default=60, help="Measured duration, in seconds.")
+    parser.add_argument('--warmup', type=float, default=5, help="Unmeasured duration before it, in seconds.")
+    parser.add_argument('--rate', type=float, help="Target requests per second (open loop); as fast as possible if unset.")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('create=1,list=2,detail=7'),
+                        help="Relative weights of the endpoints (default: create=1,list=2,detail=7).")
+    parser.add_argument('--lanes', choices=['recorded', 'random'], default='recorded',
+                        help="Trips on the recorded benchmark lanes, or between random cities.")
+    parser.add_argument('--timeout', type=float, default=60, help="Request timeout, in seconds.")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help="Writes the results to this JSON file.")
+    args = parser.parse_args()
+
+    lanes = list(LANES.values()) if args.lanes == 'recorded' else random_lanes(200, args.seed)
+    test = LoadTest(args.url, args.mix, lanes, args.duration, args.warmup, args.rate, args.timeout, args.seed)
+    print(f"{args.url}: {args.concurrency} workers, {args.warmup:.0f} s warm-up + {args.duration:.0f} s"
+          + (f" at {args.rate:g} req/s" if args.rate else "") + f", mix {args.mix}", flush=True)
+    elapsed = test.run(args.concurrency)
+    results = test.report(elapsed)
+
+    print(f"{'endpoint':<8} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9}")
+    for endpoint, stats in results.items():
+        print(f"{endpoint:<8} {stats['requests']:>8} {stats['errors']:>7} {stats['throughput']:>8.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'config': {key: value for key, value in vars(args).items() if key != 'output'},
+                'duration': elapsed,
+                'results': results,
+            }, f, indent=2)
+    if not results:
+        sys.exit("No request completed during the measured period.")
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'trips.metrics.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,13 +87,31 @@ CORS_ALLOW_ALL_ORIGINS = True
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Profil SQLite pour les écritures concurrentes : journal WAL (les lectures ne bloquent plus l'écrivain),
+# synchronous=NORMAL (sûr en WAL), cache de 64 Mo et attente du verrou jusqu'à SQLITE_BUSY_TIMEOUT secondes.
+# Transactions différées : seules celles qui lisent avant d'écrire prennent d'abord le verrou d'écriture
+# (write_queue.lock_for_write), les lectures n'attendent pas l'écrivain
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+            'init_command': (
+                'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA cache_size=-65536; '
+                'PRAGMA temp_store=MEMORY; PRAGMA mmap_size=268435456'
+            ),
+        },
     }
 }
 
+# Écritures en base : file d'attente en processus qui confie les enregistrements de trajets à un seul
+# thread écrivain (voir trips/write_queue.py) et taille des lots d'insertion des logs
+DB_WRITES = {
+    'QUEUE': os.getenv('DB_WRITE_QUEUE', 'False') == 'True',
+    'BATCH_SIZE': int(os.getenv('DB_BATCH_SIZE', 500)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -130,6 +149,164 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Artefacts générés à l'exécution par l'application trips (matrice de trajets, caches...)
+VAR_DIR = Path(os.getenv('VAR_DIR', BASE_DIR / 'var'))
+
+# Matrice précalculée des trajets entre toutes les villes (voir `python manage.py build_lane_matrix`)
+LANE_MATRIX_PATH = os.getenv('LANE_MATRIX_PATH', str(VAR_DIR / 'lane_matrix.bin'))
+
+# Caches : les itinéraires obtenus d'OpenRouteService sont partagés entre workers par le système de fichiers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'routes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(VAR_DIR / 'route_cache'),
+        'TIMEOUT': int(os.getenv('ROUTE_CACHE_MAX_AGE', 30 * 24 * 3600)),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Données dérivées des routes (points décodés, distances cumulatives, steps), voir trips/route_artifacts.py
+    'route_artifacts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(VAR_DIR / 'route_artifacts'),
+        'TIMEOUT': int(os.getenv('ROUTE_CACHE_MAX_AGE', 30 * 24 * 3600)),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Artefacts de route gardés en mémoire par chaque worker, devant le cache partagé 'route_artifacts'
+ROUTE_ARTIFACTS = {
+    'MEMORY_ENTRIES': int(os.getenv('ROUTE_ARTIFACT_MEMORY_ENTRIES', 256)),
+}
+
+# Fournisseur de routage (OpenRouteService)
+# URL de base de l'API directions, ex. le remplaçant local loadtest/ors_stub.py pour les tests de charge
+ORS_BASE_URL = os.getenv('ORS_BASE_URL', 'https://api.openrouteservice.org')
+ROUTING_TIMEOUT = float(os.getenv('ROUTING_TIMEOUT', 10))  # secondes
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 24 * 3600))  # au-delà, servi périmé et rafraîchi en arrière-plan
+
+# Disjoncteur autour du fournisseur de routage, partagé entre workers (voir trips/circuit_breaker.py)
+CIRCUIT_BREAKER = {
+    'PATH': str(VAR_DIR / 'circuit_breaker.sqlite3'),
+    'FAILURE_RATE': 0.5,
+    'MIN_CALLS': 5,
+    'WINDOW_SECONDS': 60,
+    'OPEN_SECONDS': 30,
+    'SLOW_CALL_SECONDS': 8,
+}
+
+# Quota OpenRouteService partagé entre workers (voir trips/rate_limiter.py). Les traitements par lots
+# n'utilisent que les jetons au-delà de BATCH_RESERVE, réservé aux créations de trajets interactives.
+ROUTING_RATE_LIMIT = {
+    'PATH': str(VAR_DIR / 'routing_quota.sqlite3'),
+    'PER_MINUTE': int(os.getenv('ORS_RATE_PER_MINUTE', 40)),
+    'PER_DAY': int(os.getenv('ORS_QUOTA_PER_DAY', 2000)),
+    'INTERACTIVE_WAIT_SECONDS': 3,
+    'BATCH_WAIT_SECONDS': 120,
+    'BATCH_RESERVE': 0.25,
+}
+
+# Clés Idempotency-Key des créations de trajet (voir trips/idempotency.py) : réponses conservées
+# RETENTION_HOURS heures ; une nouvelle tentative attend la requête d'origine au plus WAIT_SECONDS
+IDEMPOTENCY = {
+    'RETENTION_HOURS': float(os.getenv('IDEMPOTENCY_RETENTION_HOURS', 24)),
+    'WAIT_SECONDS': 30,
+    'LOCK_SECONDS': 120,
+    'POLL_SECONDS': 0.1,
+}
+
+# Plans HOS mémorisés par worker pour les mêmes entrées normalisées (voir trips/plan_memo.py), en LRU
+PLAN_MEMO = {
+    'ENTRIES': int(os.getenv('PLAN_MEMO_ENTRIES', 1024)),
+}
+
+# Coalescence des calculs identiques simultanés (itinéraires, artefacts de route, plans), voir
+# trips/single_flight.py. Les attentes sont bornées : au-delà, l'appelant calcule lui-même.
+SINGLE_FLIGHT = {
+    'PATH': str(VAR_DIR / 'single_flight.sqlite3'),
+    'WAIT_SECONDS': float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', 15)),
+    'LEASE_SECONDS': 30,
+    'POLL_SECONDS': 0.05,
+}
+
+# Gazetteer des lieux des États-Unis, mappé en mémoire, pour résoudre les lieux des trajets
+# (voir `python manage.py build_gazetteer`)
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', str(BASE_DIR / 'trips' / 'data' / 'gazetteer.bin'))
+
+# Relais routiers sur lesquels les ravitaillements, pauses et repos sont nommés (voir trips/truck_stops.py).
+# Désactivé par défaut : les noms finissent dans le champ location des logs ELD, seul un export de relais
+# réels doit être configuré. Le relais doit être à moins de CORRIDOR_MILES de la route et à SNAP_MILES au
+# plus (avant ou après) du mile de l'événement, qui reste celui du plan.
+TRUCK_STOPS = {
+    'PATH': os.getenv('TRUCK_STOPS_PATH') or None,
+    'CORRIDOR_MILES': 3,
+    'SNAP_MILES': float(os.getenv('TRUCK_STOPS_SNAP_MILES', 2)),
+}
+
+# Minutages par étape (en-tête Server-Timing) et métriques Prometheus exposées sur /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Instantanés des métriques de chaque worker, additionnés par /metrics (voir trips/metrics.py). /metrics
+# n'est servi qu'aux adresses ALLOWED_IPS (REMOTE_ADDR : celle du proxy derrière un reverse proxy) ou
+# avec l'en-tête "Authorization: Bearer <TOKEN>".
+METRICS = {
+    'PATH': str(VAR_DIR / 'metrics.sqlite3'),
+    'FLUSH_SECONDS': 5,
+    'ALLOWED_IPS': [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()],
+    'TOKEN': os.getenv('METRICS_TOKEN') or None,
+}
+
+# Journalisation : niveau, format ('plain' ou 'json') et échantillonnage par module des messages DEBUG/INFO,
+# ex. LOG_SAMPLING="trips.planner=0.01" pour ne garder qu'un message sur cent du planificateur
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'trips.structured_logging.SamplingFilter',
+            'rates': os.getenv('LOG_SAMPLING', ''),
+        },
+    },
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        'json': {'()': 'trips.structured_logging.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': os.getenv('LOG_FORMAT', 'plain'),
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        'trips': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Capture des échanges complets avec OpenRouteService, à la demande (staff, en-tête X-Capture-Upstream: 1)
+UPSTREAM_CAPTURE = {
+    'ENABLED': os.getenv('UPSTREAM_CAPTURE_ENABLED', 'False') == 'True',
+    'DIR': os.getenv('UPSTREAM_CAPTURE_DIR', str(VAR_DIR / 'upstream_captures')),
+    'MAX_ENTRIES': int(os.getenv('UPSTREAM_CAPTURE_MAX_ENTRIES', 100)),
+    'MAX_BODY_BYTES': int(os.getenv('UPSTREAM_CAPTURE_MAX_BODY_BYTES', 2 * 1024 * 1024)),
+}
+
+# Profilage cProfile d'une requête à la demande (staff uniquement, en-tête X-Profile: 1 ou ?profile=1)
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', 'False') == 'True',
+    'DIR': os.getenv('PROFILING_DIR', str(VAR_DIR / 'profiles')),
+    'MAX_FILES': int(os.getenv('PROFILING_MAX_FILES', 50)),  # Les plus anciens profils sont supprimés au-delà
+}
+
+# Préchauffage des workers au démarrage (trips/warmup.py) : imports, jeux de données, routage et base
+# de données sont prêts avant la première requête
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'False') == 'True'
+
+# Stockage des logs d'un trajet : 'rows' (une ligne LogEntry par entrée) ou 'packed' (un enregistrement
+# en colonnes packées sur le trajet, voir trips/packed_logs.py)
+LOG_STORAGE = os.getenv('LOG_STORAGE', 'rows')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
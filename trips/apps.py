@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class TripsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trips'
+
+    def ready(self):
+        # Chaque worker mappe la matrice de trajets en mémoire au démarrage (pages partagées entre workers)
+        from .lane_matrix import load_lane_matrix
+        load_lane_matrix()
+        # Préchauffage optionnel : imports, jeux de données et connexions avant la première requête
+        if settings.WARMUP_ENABLED:
+            from .warmup import warm_up
+            warm_up()
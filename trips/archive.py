@@ -0,0 +1,75 @@
+"""Archive des trajets terminés : un blob compressé par trajet au lieu de ses lignes dans les tables actives.
+
+`archive_trips` (voir la commande archive_trips) enregistre la représentation API de chaque
+trajet (champs du trajet, logs et résumé, tels que renvoyés par TripDetailView) en JSON
+compressé par zlib dans ArchivedTrip, puis supprime le trajet, ses entrées de log et ses
+lignes d'index d'itinéraire dans la même transaction. Les tables Trip et LogEntry et leurs
+index ne gardent que les trajets actifs ; les trajets archivés restent servis par l'endpoint
+de détail via `archived_trip_data`, mais n'apparaissent plus dans les listes ni dans les
+requêtes de corridor ou de proximité.
+"""
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import ArchivedTrip, LogEntry, Trip
+from .packed_logs import last_log_date
+from .route_index import unindex_trips
+from .serializers import TripSerializer
+
+COMPRESSION_LEVEL = 6
+
+
+def completed_trips(cutoff):
+    """Trajets dont la dernière entrée de log (ou le départ, sans logs) est antérieure à la date limite cutoff."""
+    rows = Trip.objects.filter(packed_logs__isnull=True).annotate(last_log_date=Max('logs__date')).filter(
+        Q(last_log_date__lt=cutoff.date()) | Q(last_log_date__isnull=True, start_time__lt=cutoff)
+    )
+    # Trajets aux logs packés : sans lignes LogEntry, la date de leur dernière entrée est lue dans l'enregistrement
+    packed = Trip.objects.filter(packed_logs__isnull=False, start_time__lt=cutoff).values_list('id', 'packed_logs')
+    packed_ids = []
+    for trip_id, data in packed.iterator():
+        last_date = last_log_date(data)
+        if last_date is None or last_date < cutoff.date():
+            packed_ids.append(trip_id)
+    return Trip.objects.filter(Q(id__in=rows.values('id')) | Q(id__in=packed_ids))
+
+
+def compress(data):
+    return zlib.compress(json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def decompress(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def archive_trips(trips):
+    """Déplace les trajets dans l'archive, en une transaction.
+
+    Returns:
+        tuple: (trajets archivés, entrées de log supprimées, octets JSON, octets compressés)
+    """
+    archives = []
+    raw_bytes = 0
+    for trip in trips:
+        data = TripSerializer(trip).data
+        raw_bytes += len(json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')))
+        archives.append(ArchivedTrip(id=trip.id, start_time=trip.start_time, log_count=len(data['logs']),
+                                     data=compress(data)))
+    trip_ids = [archive.id for archive in archives]
+
+    with transaction.atomic():
+        ArchivedTrip.objects.bulk_create(archives)
+        unindex_trips(trip_ids)
+        deleted_logs, _ = LogEntry.objects.filter(trip_id__in=trip_ids).delete()
+        Trip.objects.filter(id__in=trip_ids).delete()
+    return len(archives), deleted_logs, raw_bytes, sum(len(archive.data) for archive in archives)
+
+
+def archived_trip_data(trip_id):
+    """Représentation API d'un trajet archivé, ou None si le trajet n'est pas archivé."""
+    blob = ArchivedTrip.objects.filter(id=trip_id).values_list('data', flat=True).first()
+    return decompress(blob) if blob is not None else None
@@ -0,0 +1,153 @@
+"""Disjoncteur partagé par tous les processus workers via un petit fichier SQLite.
+
+closed    -> les appels passent ; quand le taux d'échec (les appels lents comptent comme
+             des échecs) sur la fenêtre glissante dépasse le seuil, il s'ouvre.
+open      -> les appels sont refusés immédiatement pendant ``open_seconds``.
+half_open -> un seul worker est autorisé à sonder ; un succès referme le disjoncteur,
+             un échec le rouvre.
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS breaker (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    opened_at REAL NOT NULL DEFAULT 0,
+    probe_started_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS breaker_call (
+    name TEXT NOT NULL,
+    at REAL NOT NULL,
+    ok INTEGER NOT NULL,
+    latency REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS breaker_call_name_at ON breaker_call (name, at);
+"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, path, failure_rate=0.5, min_calls=5, window_seconds=60,
+                 open_seconds=30, slow_call_seconds=8):
+        self.name = name
+        self.path = str(path)
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def _load(self, connection):
+        row = connection.execute(
+            'SELECT state, opened_at, probe_started_at FROM breaker WHERE name = ?', (self.name,)
+        ).fetchone()
+        return row or (CLOSED, 0.0, 0.0)
+
+    def _save(self, connection, state, opened_at=0.0, probe_started_at=0.0):
+        connection.execute(
+            'INSERT OR REPLACE INTO breaker (name, state, opened_at, probe_started_at) VALUES (?, ?, ?, ?)',
+            (self.name, state, opened_at, probe_started_at)
+        )
+
+    @property
+    def state(self):
+        with closing(self._connect()) as connection:
+            return self._load(connection)[0]
+
+    def allow_request(self):
+        """Retourne True si l'appelant peut appeler le service maintenant."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                state, opened_at, probe_started_at = self._load(connection)
+                if state == CLOSED:
+                    allowed = True
+                elif state == OPEN and now - opened_at < self.open_seconds:
+                    allowed = False
+                elif state == HALF_OPEN and now - probe_started_at < self.slow_call_seconds * 2:
+                    # Une sonde est déjà en cours dans un autre worker
+                    allowed = False
+                else:
+                    self._save(connection, HALF_OPEN, opened_at, now)
+                    allowed = True
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return allowed
+
+    def release_probe(self):
+        """Libère la sonde en cours sans résultat (appel finalement non effectué), pour un autre worker."""
+        with closing(self._connect()) as connection:
+            connection.execute(
+                'UPDATE breaker SET probe_started_at = 0 WHERE name = ? AND state = ?', (self.name, HALF_OPEN)
+            )
+
+    def record(self, ok, latency):
+        """Enregistre le résultat d'un appel au service et met à jour l'état du disjoncteur."""
+        now = time.time()
+        ok = ok and latency < self.slow_call_seconds
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                state, _, _ = self._load(connection)
+                if state == HALF_OPEN:
+                    connection.execute('DELETE FROM breaker_call WHERE name = ?', (self.name,))
+                    if ok:
+                        self._save(connection, CLOSED)
+                    else:
+                        self._save(connection, OPEN, now)
+                else:
+                    connection.execute(
+                        'DELETE FROM breaker_call WHERE name = ? AND at < ?', (self.name, now - self.window_seconds)
+                    )
+                    connection.execute(
+                        'INSERT INTO breaker_call (name, at, ok, latency) VALUES (?, ?, ?, ?)',
+                        (self.name, now, int(ok), latency)
+                    )
+                    calls, failures = connection.execute(
+                        'SELECT COUNT(*), COALESCE(SUM(1 - ok), 0) FROM breaker_call WHERE name = ?', (self.name,)
+                    ).fetchone()
+                    if state == CLOSED and calls >= self.min_calls and failures / calls >= self.failure_rate:
+                        self._save(connection, OPEN, now)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def record_success(self, latency):
+        self.record(True, latency)
+
+    def record_failure(self, latency):
+        self.record(False, latency)
+
+
+_breakers = {}
+
+
+def get_breaker(name):
+    if name not in _breakers:
+        options = dict(getattr(settings, 'CIRCUIT_BREAKER', {}))
+        path = options.pop('PATH', os.path.join(settings.VAR_DIR, 'circuit_breaker.sqlite3'))
+        _breakers[name] = CircuitBreaker(name, path, **{key.lower(): value for key, value in options.items()})
+    return _breakers[name]
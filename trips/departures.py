@@ -0,0 +1,91 @@
+"""Optimisation de l'heure de départ : l'arrivée d'un trajet pour chaque départ candidat d'une fenêtre.
+
+Le départ modifie le planning de deux façons. Le conducteur attend hors service du début de la
+fenêtre jusqu'au départ, et repart avec un cycle remis à zéro (current_cycle_hours = 0) à partir
+de RESTART_HOURS d'attente. Et les entrées de log sont découpées à minuit et vérifiées contre les
+chevauchements jour par jour : un même planning décalé dans le temps ne donne pas toujours les
+mêmes entrées, et la durée d'un départ ne se déduit pas de celle d'un autre.
+
+`evaluate_departures` planifie donc chaque candidat avec l'ordonnanceur (generate_eld_logs),
+sur l'artefact de route du trajet et via le mémo des plannings : la route n'est décodée et
+mesurée qu'une fois par requête, et un candidat dont l'heure de départ a déjà été évaluée (même
+heure un autre jour, requête précédente) est servi par le mémo sans réexécuter l'ordonnanceur.
+"""
+import copy
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from .constants import RESTART_HOURS
+from .plan_memo import anchor_events, memoized_plan
+
+# Durée du plan (départ -> fin de la dernière entrée) et heures par statut de service
+Timeline = namedtuple('Timeline', ['duration', 'hours'])
+
+
+def _entry_bounds(entry):
+    start = datetime.combine(entry.date, entry.start_time)
+    # Une entrée qui se termine à minuit est enregistrée jusqu'à 23:59:59.999999
+    end = (datetime.combine(entry.date + timedelta(days=1), time.min) if entry.end_time == time.max
+           else datetime.combine(entry.date, entry.end_time))
+    return start, end
+
+
+def plan_timeline(entries, start_time):
+    """Timeline des entrées de log planifiées d'un trajet partant à start_time."""
+    hours = {}
+    end = start_time.replace(tzinfo=None)
+    for entry in entries:
+        entry_start, entry_end = _entry_bounds(entry)
+        hours[entry.duty_status] = hours.get(entry.duty_status, 0) + (entry_end - entry_start).total_seconds() / 3600
+        end = max(end, entry_end)
+    return Timeline(end - start_time.replace(tzinfo=None), hours)
+
+
+def cycle_hours_at(departure, window_start, current_cycle_hours):
+    """Heures de cycle au départ : remises à zéro par une attente hors service de RESTART_HOURS depuis le début de la fenêtre."""
+    return 0 if departure - window_start >= timedelta(hours=RESTART_HOURS) else current_cycle_hours
+
+
+def evaluate_departures(planner, trip, departures):
+    """Évalue les départs candidats d'un trajet routé.
+
+    Args:
+        planner (EldLogPlannerMixin): Planificateur du trajet
+        trip (Trip): Trajet non enregistré avec sa route ; start_time est le début de la fenêtre et
+            current_cycle_hours les heures utilisées à ce moment
+        departures (list): Heures de départ candidates, triées
+
+    Returns:
+        tuple: ([dict par candidat] dans l'ordre des départs, nombre d'exécutions de l'ordonnanceur)
+    """
+    window_start = trip.start_time
+    candidates = []
+    runs = 0
+    for departure in departures:
+        cycle_hours = cycle_hours_at(departure, window_start, trip.current_cycle_hours)
+        candidate = copy.copy(trip)
+        candidate.start_time = departure
+        candidate.current_cycle_hours = cycle_hours
+
+        def plan(candidate=candidate, cycle_hours=cycle_hours):
+            nonlocal runs
+            runs += 1
+            return planner.generate_eld_logs(candidate, candidate.distance_to_pickup, candidate.distance_to_dropoff,
+                                             cycle_hours, persist=False)
+
+        events = memoized_plan(candidate, cycle_hours, plan)
+        timeline = plan_timeline(anchor_events(events, candidate), departure)
+        candidates.append({
+            'departure': departure,
+            'arrival': departure + timeline.duration,
+            'duration_hours': timeline.duration.total_seconds() / 3600,
+            'driving_hours': timeline.hours.get('DRIVING', 0),
+            'rest_hours': timeline.hours.get('OFF_DUTY', 0) + timeline.hours.get('SLEEPER_BERTH', 0),
+            'cycle_hours_at_departure': cycle_hours,
+        })
+    return candidates, runs
+
+
+def best_departures(candidates, count):
+    """Les count candidats qui arrivent les premiers ; à égalité le trajet le plus court, puis le départ le plus tardif."""
+    return sorted(candidates, key=lambda c: (c['arrival'], c['duration_hours'], -c['departure'].timestamp()))[:count]
@@ -0,0 +1,269 @@
+"""Gazetteer des lieux des États-Unis ("Ville, ST"), mappé en mémoire depuis un fichier binaire compact.
+
+Le fichier (settings.GAZETTEER_PATH, construit par `python manage.py build_gazetteer`)
+contient tout ce qu'il faut pour répondre aux requêtes sur place : les workers partagent ses
+pages via le cache de pages du système, et rien n'est lu ni indexé au démarrage :
+
+    header    <8sIIIIII  magic, version, count, names_len, keys_len, trigram_count, postings_count
+    records   count x <ffIIIHH  latitude, longitude, population, name_offset, key_offset,
+                                name_len, key_len -- triés par clé normalisée
+    names     noms affichés en UTF-8 ("St. Louis, MO")
+    keys      clés normalisées en ASCII ("st louis mo"), pour les recherches exactes et par préfixe
+    trigrams  trigram_count x <3sxI  trigramme, premier posting -- triés par trigramme
+    postings  postings_count x <I  index d'enregistrements, groupés par trigramme
+
+Le fichier n'est ouvert qu'à la première utilisation.
+"""
+import heapq
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from collections import Counter, namedtuple
+
+from django.conf import settings
+
+from .constants import CITIES_WITH_COORDS
+
+MAGIC = b'TTPGAZ01'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIII')
+RECORD = struct.Struct('<ffIIIHH')
+TRIGRAM = struct.Struct('<3sxI')
+POSTING = struct.Struct('<I')
+
+# Les trigrammes très fréquents ("  s", "on ") n'aident pas à départager les candidats
+MAX_POSTINGS_PER_TRIGRAM = 1500
+FUZZY_CANDIDATES = 64
+# Fin de clé "<nom> <état>" : code d'État à deux lettres
+STATE_SUFFIX = re.compile(r'[a-z]{2}')
+
+Place = namedtuple('Place', ['name', 'latitude', 'longitude', 'population'])
+
+
+class AmbiguousPlace(LookupError):
+    """Un nom correspond aussi bien à plusieurs lieux ("Portland" sans État)."""
+
+    def __init__(self, text, candidates):
+        super().__init__(f"Ambiguous place name '{text}'")
+        self.candidates = candidates
+
+_gazetteer = None
+_missing = False
+
+
+def normalize(text):
+    """Forme ASCII en minuscules d'un nom de lieu, sans ponctuation ("St. Louis, MO" -> "st louis mo")."""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def write_gazetteer(path, places):
+    """Écrit [Place] dans path de façon atomique ; à clé égale, le lieu le plus peuplé l'emporte."""
+    by_key = {}
+    for place in places:
+        key = normalize(place.name)
+        if key and (key not in by_key or place.population > by_key[key].population):
+            by_key[key] = place
+    keys = sorted(by_key)
+
+    names, key_blob, records = bytearray(), bytearray(), []
+    postings_by_trigram = {}
+    for index, key in enumerate(keys):
+        place = by_key[key]
+        name = place.name.encode('utf-8')
+        records.append(RECORD.pack(place.latitude, place.longitude, place.population,
+                                   len(names), len(key_blob), len(name), len(key)))
+        names += name
+        key_blob += key.encode('ascii')
+        for trigram in trigrams(key):
+            postings_by_trigram.setdefault(trigram.encode('ascii'), []).append(index)
+
+    trigram_table, postings = [], []
+    for trigram in sorted(postings_by_trigram):
+        trigram_table.append(TRIGRAM.pack(trigram, len(postings)))
+        postings.extend(postings_by_trigram[trigram])
+
+    padding = b'\0' * (-(HEADER.size + RECORD.size * len(records) + len(names) + len(key_blob)) % 4)
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(names), len(key_blob),
+                            len(trigram_table), len(postings)))
+        f.writelines(records)
+        f.write(names)
+        f.write(key_blob)
+        f.write(padding)
+        f.writelines(trigram_table)
+        f.write(struct.pack(f'<{len(postings)}I', *postings))
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class Gazetteer:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, names_len, keys_len, self.trigram_count, self.postings_count = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a gazetteer file (version {VERSION})")
+        self._records = HEADER.size
+        self._names = self._records + RECORD.size * self.count
+        self._keys = self._names + names_len
+        self._trigrams = self._keys + keys_len + (-(self._keys + keys_len) % 4)
+        self._postings = self._trigrams + TRIGRAM.size * self.trigram_count
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._mm, self._records + RECORD.size * index)
+
+    def _key(self, index):
+        _, _, _, _, key_offset, _, key_len = self._record(index)
+        start = self._keys + key_offset
+        return self._mm[start:start + key_len].decode('ascii')
+
+    def place(self, index):
+        latitude, longitude, population, name_offset, _, name_len, _ = self._record(index)
+        start = self._names + name_offset
+        # Coordonnées stockées en float32 : arrondies à 5 décimales (~1 m)
+        return Place(self._mm[start:start + name_len].decode('utf-8'), round(latitude, 5), round(longitude, 5),
+                     population)
+
+    def _bisect(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, name):
+        """Recherche exacte, insensible à la casse, aux accents et à la ponctuation. Retourne un Place ou None."""
+        key = normalize(name)
+        index = self._bisect(key)
+        if index < self.count and self._key(index) == key:
+            return self.place(index)
+        return None
+
+    def prefix(self, text, limit=10, scan=2000):
+        """Lieux dont le nom normalisé commence par text, les plus peuplés d'abord."""
+        key = normalize(text)
+        if not key:
+            return []
+        first = self._bisect(key)
+        last = min(self._bisect(key + '\x7f'), first + scan)
+        best = heapq.nlargest(limit, range(first, last), key=lambda i: self._record(i)[2])
+        return [self.place(i) for i in best]
+
+    def namesakes(self, text, limit=10, scan=2000):
+        """Lieux nommés exactement text, quel que soit l'État ("Portland" -> Portland, OR, Portland, ME...), les plus peuplés d'abord."""
+        key = normalize(text)
+        if not key:
+            return []
+        first = self._bisect(key + ' ')
+        last = min(self._bisect(key + ' \x7f'), first + scan)
+        # Seules les clés "<nom> <état>" comptent, pas "portland heights or"
+        found = [i for i in range(first, last) if STATE_SUFFIX.fullmatch(self._key(i)[len(key) + 1:])]
+        best = heapq.nlargest(limit, found, key=lambda i: self._record(i)[2])
+        return [self.place(i) for i in best]
+
+    def _trigram(self, index):
+        offset = self._trigrams + TRIGRAM.size * index
+        return self._mm[offset:offset + 3]
+
+    def _trigram_postings(self, trigram):
+        """Index des enregistrements qui contiennent trigram (dichotomie dans la table des trigrammes)."""
+        low, high = 0, self.trigram_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._trigram(middle) < trigram:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.trigram_count or self._trigram(low) != trigram:
+            return ()
+        start = TRIGRAM.unpack_from(self._mm, self._trigrams + TRIGRAM.size * low)[1]
+        end = (TRIGRAM.unpack_from(self._mm, self._trigrams + TRIGRAM.size * (low + 1))[1]
+               if low + 1 < self.trigram_count else self.postings_count)
+        offset = self._postings + POSTING.size * start
+        return memoryview(self._mm)[offset:offset + POSTING.size * (end - start)].cast('I')
+
+    def search(self, text, limit=10):
+        """Recherche approximative par similarité de trigrammes. Retourne [(similarité, Place)], les meilleurs d'abord."""
+        key = normalize(text)
+        if not key:
+            return []
+        query = trigrams(key)
+        shared = Counter()
+        for trigram in query:
+            postings = self._trigram_postings(trigram.encode('ascii'))
+            if len(postings) <= MAX_POSTINGS_PER_TRIGRAM:
+                shared.update(postings)
+
+        scored = []
+        for index, _ in shared.most_common(FUZZY_CANDIDATES):
+            candidate = trigrams(self._key(index))
+            common = len(query & candidate)
+            similarity = common / (len(query) + len(candidate) - common)
+            scored.append((similarity, self._record(index)[2], index))
+        scored.sort(reverse=True)
+        return [(round(similarity, 3), self.place(index)) for similarity, _, index in scored[:limit]]
+
+    def resolve(self, text, min_similarity=0.5, limit=10):
+        """Lieu d'un nom saisi par l'utilisateur : correspondance exacte, puis le seul lieu de ce nom, puis
+        la meilleure correspondance approximative. Retourne None si rien ne correspond.
+
+        Raises:
+            AmbiguousPlace: le nom est partagé par des lieux de plusieurs États et aucun État n'est donné,
+                ou plusieurs correspondances approximatives sont à égalité. Rien n'est choisi au hasard.
+        """
+        place = self.lookup(text)
+        if place is not None:
+            return place
+        namesakes = self.namesakes(text, limit)
+        if len(namesakes) > 1:
+            raise AmbiguousPlace(text, namesakes)
+        if namesakes:
+            return namesakes[0]
+        matches = [(similarity, place) for similarity, place in self.search(text, limit)
+                   if similarity >= min_similarity]
+        if not matches:
+            return None
+        best = [place for similarity, place in matches if similarity == matches[0][0]]
+        if len(best) > 1:
+            raise AmbiguousPlace(text, best)
+        return best[0]
+
+
+def get_gazetteer():
+    """Retourne le Gazetteer partagé, ouvert à la première utilisation, ou None si le fichier est absent."""
+    global _gazetteer, _missing
+    if _gazetteer is None and not _missing:
+        path = settings.GAZETTEER_PATH
+        if os.path.exists(path):
+            _gazetteer = Gazetteer(path)
+        else:
+            _missing = True
+    return _gazetteer
+
+
+def location_coords(name):
+    """(lat, lon) d'un lieu de trajet : clé de CITIES_WITH_COORDS ou nom exact d'un lieu du gazetteer."""
+    if name in CITIES_WITH_COORDS:
+        return CITIES_WITH_COORDS[name]
+    gazetteer = get_gazetteer()
+    place = gazetteer.lookup(name) if gazetteer else None
+    if place is None:
+        raise KeyError(name)
+    return place.latitude, place.longitude
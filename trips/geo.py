@@ -0,0 +1,69 @@
+"""Calculs géographiques légers : distances orthodromiques, projection sur un segment et grille lat/lon."""
+import math
+
+EARTH_RADIUS_MILES = 3958.7613
+# Miles par degré de latitude (et de longitude à l'équateur)
+MILES_PER_DEGREE = 69.17
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en miles : à 0.5 % près de la géodésique, pour un calcul bien moins coûteux."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def project_on_segment(lat, lon, start, end):
+    """Projette un point sur le segment start-end, en approximation équirectangulaire locale.
+
+    Returns:
+        tuple: (fraction du segment dans [0, 1], distance au segment en miles)
+    """
+    scale = math.cos(math.radians(start[0]))
+    dx, dy = (end[1] - start[1]) * scale, end[0] - start[0]
+    px, py = (lon - start[1]) * scale, lat - start[0]
+    length = dx * dx + dy * dy
+    fraction = min(1.0, max(0.0, (px * dx + py * dy) / length)) if length else 0.0
+    return fraction, math.hypot(px - fraction * dx, py - fraction * dy) * MILES_PER_DEGREE
+
+
+# Grille de cellules de GRID_CELL_DEGREES de côté, numérotées ligne par ligne : les cellules
+# d'une même ligne sont consécutives, une zone se lit donc en une plage d'index par ligne.
+GRID_CELL_DEGREES = 0.1
+GRID_COLUMNS = round(360 / GRID_CELL_DEGREES)
+
+
+def grid_cell(lat, lon):
+    """Cellule (entier) de la grille globale contenant (lat, lon), ou None sans coordonnées."""
+    if lat is None or lon is None:
+        return None
+    row = math.floor((min(lat, 89.999999) + 90) / GRID_CELL_DEGREES)
+    column = math.floor((lon + 180) / GRID_CELL_DEGREES) % GRID_COLUMNS
+    return row * GRID_COLUMNS + column
+
+
+def grid_cell_ranges(lat, lon, radius_miles):
+    """Plages [(première cellule, dernière cellule)] couvrant le carré de demi-côté radius_miles autour de (lat, lon)."""
+    dlat = radius_miles / MILES_PER_DEGREE
+    dlon = min(radius_miles / (MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)), 180)
+    first_row = grid_cell(max(lat - dlat, -90), 0) // GRID_COLUMNS
+    last_row = grid_cell(min(lat + dlat, 90), 0) // GRID_COLUMNS
+    first_column = math.floor((lon - dlon + 180) / GRID_CELL_DEGREES)
+    last_column = math.floor((lon + dlon + 180) / GRID_CELL_DEGREES)
+    if last_column - first_column + 1 >= GRID_COLUMNS:
+        column_ranges = [(0, GRID_COLUMNS - 1)]
+    elif first_column < 0:
+        # La zone franchit l'antiméridien : deux plages par ligne
+        column_ranges = [(first_column % GRID_COLUMNS, GRID_COLUMNS - 1), (0, last_column)]
+    elif last_column >= GRID_COLUMNS:
+        column_ranges = [(first_column, GRID_COLUMNS - 1), (0, last_column % GRID_COLUMNS)]
+    else:
+        column_ranges = [(first_column, last_column)]
+    return [
+        (row * GRID_COLUMNS + first, row * GRID_COLUMNS + last)
+        for row in range(first_row, last_row + 1)
+        for first, last in column_ranges
+    ]
@@ -0,0 +1,49 @@
+"""Géocodage inverse des coordonnées des entrées de log vers le lieu connu le plus proche, entièrement en mémoire."""
+from .constants import CITIES_WITH_COORDS
+from .road_graph import get_road_graph
+from .spatial import KDTree
+
+_geocoder = None
+
+
+class ReverseGeocoder:
+    def __init__(self, places):
+        """
+        Args:
+            places (dict): {"City, ST": (lat, lon)}
+        """
+        self.names = list(places)
+        self.tree = KDTree([places[name] for name in self.names])
+
+    def nearest(self, latitude, longitude):
+        """Retourne (nom du lieu, distance en miles) du lieu le plus proche."""
+        index, distance = self.tree.nearest(latitude, longitude)
+        return (self.names[index], distance) if index is not None else (None, None)
+
+    def nearest_many(self, points):
+        """Recherche groupée pour [(lat, lon)] ; un point sans coordonnées donne None.
+
+        Des entrées de log consécutives sont souvent à la même position (un arrêt coupé à minuit,
+        un repos après une pause) : un point répété reprend la réponse précédente.
+        """
+        names = []
+        previous, previous_name = None, None
+        for point in points:
+            if point is None or None in point:
+                names.append(None)
+                continue
+            if point != previous:
+                previous, previous_name = point, self.nearest(*point)[0]
+            names.append(previous_name)
+        return names
+
+
+def get_reverse_geocoder():
+    global _geocoder
+    if _geocoder is None:
+        # Villes connues et jonctions autoroutières du graphe routier (aussi des villes "Ville, ST")
+        graph = get_road_graph()
+        places = dict(zip(graph.names, graph.coords))
+        places.update(CITIES_WITH_COORDS)
+        _geocoder = ReverseGeocoder(places)
+    return _geocoder
@@ -0,0 +1,105 @@
+"""Clés d'idempotence pour la création de trajets (en-tête Idempotency-Key de POST /api/trips/create/).
+
+Un client qui réessaie une création après une réponse perdue renvoie la même Idempotency-Key.
+La première requête réserve la clé en insérant une ligne IdempotencyKey (la clé primaire rend
+la réservation atomique entre les workers), planifie et enregistre le trajet, puis stocke la
+réponse sur la ligne. Jusqu'à l'expiration de la ligne (IDEMPOTENCY['RETENTION_HOURS']) :
+
+    terminée        une nouvelle tentative reçoit la réponse stockée, sans routage ni planification
+    en cours        une nouvelle tentative attend la première requête (jusqu'à WAIT_SECONDS), puis
+                    reçoit sa réponse ; au-delà de l'attente elle reçoit une 409
+    autre corps     une requête qui réutilise la clé avec un autre corps reçoit une 422
+
+Une requête en échec libère sa clé : une nouvelle tentative planifie à nouveau. Une clé encore
+en cours après LOCK_SECONDS (worker tué en pleine requête) peut être réservée à nouveau. Les
+clés expirées sont ignorées et remplacées, et supprimées par lots par `purge_expired_keys`
+(voir la commande purge_idempotency_keys) grâce à l'index sur expires_at.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import compress, decompress
+from .metrics import increment
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HELP = "Trip creations with an Idempotency-Key, by outcome."
+
+
+def request_fingerprint(data):
+    """SHA-256 du JSON canonique du corps d'une requête."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()).hexdigest()
+
+
+def _claim(key, fingerprint, now):
+    """Insère la clé en cours ; retourne True si cette requête la détient."""
+    options = settings.IDEMPOTENCY
+    expires_at = now + timedelta(hours=options['RETENTION_HOURS'])
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, created_at=now, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        pass
+    # Clé expirée, ou restée en cours au-delà de LOCK_SECONDS : reprise si personne ne l'a reprise entre-temps
+    abandoned = now - timedelta(seconds=options['LOCK_SECONDS'])
+    taken = IdempotencyKey.objects.filter(
+        Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=abandoned), key=key
+    )
+    return bool(taken.update(fingerprint=fingerprint, trip_id=None, status_code=None, response=None,
+                             created_at=now, expires_at=expires_at))
+
+
+def claim_key(key, fingerprint):
+    """Réserve une clé d'idempotence pour une requête.
+
+    Returns:
+        IdempotencyKey: None si la requête détient la clé et doit être traitée, sinon la ligne
+        de la requête qui la détient : terminée, ou encore en cours après WAIT_SECONDS.
+    """
+    options = settings.IDEMPOTENCY
+    deadline = time.monotonic() + options['WAIT_SECONDS']
+    while True:
+        if _claim(key, fingerprint, timezone.now()):
+            return None
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is not None and (record.status_code is not None or record.fingerprint != fingerprint
+                                   or time.monotonic() >= deadline):
+            return record
+        # La requête d'origine est en cours (ou vient d'échouer et de libérer la clé)
+        time.sleep(options['POLL_SECONDS'])
+
+
+def complete_key(key, status_code, data, trip_id=None):
+    """Stocke la réponse de la requête qui détient la clé."""
+    IdempotencyKey.objects.filter(key=key).update(status_code=status_code, response=compress(data), trip_id=trip_id)
+    increment('idempotent_requests_total', {'outcome': 'processed'}, help_text=IDEMPOTENCY_HELP)
+
+
+def release_key(key):
+    """Supprime une clé encore en cours, après l'échec de la requête qui la détient."""
+    IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+
+
+def stored_response(record):
+    """(code de statut, corps) stockés sur une clé terminée."""
+    increment('idempotent_requests_total', {'outcome': 'replayed'}, help_text=IDEMPOTENCY_HELP)
+    return record.status_code, decompress(record.response)
+
+
+def purge_expired_keys(batch_size=1000):
+    """Supprime les clés expirées par lots de batch_size ; retourne le nombre supprimé."""
+    deleted = 0
+    now = timezone.now()
+    while True:
+        # Lot par clés primaires : chaque transaction d'écriture reste courte
+        keys = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(key__in=keys).delete()[0]
@@ -0,0 +1,211 @@
+"""Matrice précalculée des trajets entre toutes les villes de CITIES_WITH_COORDS.
+
+La matrice est un unique fichier binaire produit par la commande ``build_lane_matrix``.
+Les workers la mappent en mémoire en lecture seule au démarrage : ses pages sont partagées
+par tous les processus de la machine via le cache de pages du système.
+
+Format du fichier (little endian) :
+    header   : magic (8s), version (I), nombre de villes (I), longueur des noms (I), drapeaux (I)
+    names    : noms des villes en UTF-8 séparés par '\\n', complétés à un multiple de 4 octets
+    records  : count * count entrées (distance_mi f, duration_h f, geom_offset I, geom_length I,
+               steps_offset I, steps_length I)
+    payload  : polylines encodées et segments de route en JSON (format ORS, way_points sur la
+               géométrie simplifiée), adressés par les entrées
+
+Un trajet pas encore calculé a NaN pour distance. FLAG_STANDIN marque une matrice construite
+avec le remplaçant en ligne droite : ses trajets n'ont pas d'étapes et ne sont jamais préférés
+à une vraie route (voir TripRoutingMixin._route_lane).
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TTPLANE1'
+VERSION = 2
+HEADER = struct.Struct('<8sIIII')
+RECORD = struct.Struct('<ffIIII')
+FLAG_STANDIN = 1
+
+# Durée maximale d'une étape générée (graphe routier), en heures. La boucle HOS de
+# generate_eld_logs conduit au plus une heure à la fois : les étapes restent en dessous.
+MAX_STEP_HOURS = 0.75
+
+Lane = namedtuple('Lane', ['distance', 'duration', 'geometry', 'segments'])
+
+_matrix = None
+
+
+class LaneMatrix:
+    """Vue en lecture seule d'un fichier de matrice de trajets mappé en mémoire."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = struct.unpack_from('<8sI', self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self._buffer.close()
+            raise ValueError(f"{self.path} is not a lane matrix file (version {VERSION})")
+        _, _, count, names_length, flags = HEADER.unpack_from(self._buffer, 0)
+        self.standin = bool(flags & FLAG_STANDIN)
+
+        names_start = HEADER.size
+        names = bytes(self._buffer[names_start:names_start + names_length]).decode('utf-8')
+        self.cities = names.split('\n') if names else []
+        self._index = {name: i for i, name in enumerate(self.cities)}
+        self._count = count
+        self._records_start = names_start + _padded(names_length)
+        self._payload_start = self._records_start + count * count * RECORD.size
+
+    def __contains__(self, city):
+        return city in self._index
+
+    def lookup(self, origin, destination):
+        """Retourne le Lane entre deux villes, ou None s'il est inconnu."""
+        i = self._index.get(origin)
+        j = self._index.get(destination)
+        if i is None or j is None:
+            return None
+
+        offset = self._records_start + (i * self._count + j) * RECORD.size
+        distance, duration, geom_offset, geom_length, steps_offset, steps_length = RECORD.unpack_from(
+            self._buffer, offset
+        )
+        if math.isnan(distance):
+            return None
+
+        start = self._payload_start + geom_offset
+        geometry = self._buffer[start:start + geom_length].decode('ascii') if geom_length else None
+        start = self._payload_start + steps_offset
+        segments = json.loads(self._buffer[start:start + steps_length]) if steps_length else []
+        return Lane(distance, duration, geometry, segments)
+
+    def close(self):
+        self._buffer.close()
+
+
+def _padded(length):
+    return (length + 3) & ~3
+
+
+def write_lane_matrix(path, cities, lanes, standin=False):
+    """Écrit un fichier de matrice de trajets de façon atomique.
+
+    Args:
+        path (str): Fichier de destination
+        cities (list): Noms des villes dans l'ordre de l'index de la matrice
+        lanes (dict): {(origine, destination): (distance_mi, duration_h, geometry, route_segments)}
+        standin (bool): Trajets issus du remplaçant en ligne droite (FLAG_STANDIN)
+    """
+    names = '\n'.join(cities).encode('utf-8')
+    records = bytearray()
+    payload = bytearray()
+
+    for origin in cities:
+        for destination in cities:
+            lane = lanes.get((origin, destination))
+            if lane is None:
+                records += RECORD.pack(math.nan, math.nan, 0, 0, 0, 0)
+                continue
+            distance, duration, geometry, segments = lane
+            encoded = geometry.encode('ascii') if geometry else b''
+            steps = json.dumps(segments, ensure_ascii=False, separators=(',', ':')).encode() if segments else b''
+            records += RECORD.pack(distance, duration, len(payload), len(encoded), len(payload) + len(encoded),
+                                   len(steps))
+            payload += encoded + steps
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(cities), len(names), FLAG_STANDIN if standin else 0))
+        f.write(names)
+        f.write(b'\0' * (_padded(len(names)) - len(names)))
+        f.write(records)
+        f.write(payload)
+    # Le remplacement garde en vie l'inode déjà mappé par les workers en cours
+    os.replace(tmp_path, path)
+
+
+def load_lane_matrix(path=None):
+    """Mappe en mémoire la matrice configurée ; retourne None si aucun fichier n'a été construit."""
+    global _matrix
+    path = path or getattr(settings, 'LANE_MATRIX_PATH', None)
+    if not path or not os.path.exists(path):
+        _matrix = None
+        return None
+    if _matrix is not None:
+        _matrix.close()
+    try:
+        _matrix = LaneMatrix(path)
+    except ValueError as e:
+        # Matrice d'une version précédente (sans étapes) : à reconstruire, les trajets passent par le routage
+        logger.warning("Lane matrix ignored: %s; rebuild it with build_lane_matrix", e)
+        _matrix = None
+    return _matrix
+
+
+def get_lane_matrix():
+    return _matrix
+
+
+def simplify_route(coords, segments, tolerance):
+    """Simplifie la géométrie d'une route et reporte les way_points de ses étapes sur les points gardés.
+
+    Returns:
+        tuple: (coordonnées simplifiées, segments aux way_points recalés)
+    """
+    kept = simplify_indexes(coords, tolerance)
+    remapped = []
+    for segment in segments or []:
+        steps = []
+        for step in segment['steps']:
+            start, end = step.get('way_points') or [0, 0]
+            # Début ramené au point gardé précédent, fin au point gardé suivant
+            start = max(bisect_right(kept, start) - 1, 0)
+            end = min(bisect_left(kept, end), len(kept) - 1)
+            steps.append({**step, 'way_points': [start, max(start, end)]})
+        remapped.append({**segment, 'steps': steps})
+    return [coords[i] for i in kept], remapped
+
+
+def simplify_indexes(coords, tolerance):
+    """Index des points gardés par la simplification de Douglas-Peucker (tolérance en degrés)."""
+    if len(coords) < 3:
+        return list(range(len(coords)))
+
+    keep = [False] * len(coords)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        lat1, lon1 = coords[first]
+        lat2, lon2 = coords[last]
+        dlat, dlon = lat2 - lat1, lon2 - lon1
+        norm = math.hypot(dlat, dlon)
+
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            lat, lon = coords[i]
+            if norm == 0:
+                dist = math.hypot(lat - lat1, lon - lon1)
+            else:
+                dist = abs(dlon * (lat - lat1) - dlat * (lon - lon1)) / norm
+            if dist > max_dist:
+                max_dist, index = dist, i
+
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [i for i, kept in enumerate(keep) if kept]
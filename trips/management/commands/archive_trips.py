@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from trips.archive import archive_trips, completed_trips
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the trips completed more than --days days ago into the archive table (one compressed "
+        "blob per trip) and deletes their trips, log entries and route index rows. Archived trips stay "
+        "available through GET /api/trips/<id>/. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=90, help="Age of the last log entry, in days.")
+        parser.add_argument('--batch-size', type=int, default=100, help="Trips archived per transaction.")
+        parser.add_argument('--limit', type=int, help="Archives at most this number of trips.")
+        parser.add_argument('--dry-run', action='store_true', help="Only counts the trips to archive.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        candidates = completed_trips(cutoff).order_by('id')
+        if options['limit']:
+            candidates = candidates[:options['limit']]
+        trip_ids = list(candidates.values_list('id', flat=True))
+        if options['dry_run']:
+            self.stdout.write(f"{len(trip_ids)} trips completed before {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        trips = logs = raw_bytes = compressed_bytes = 0
+        for start in range(0, len(trip_ids), options['batch_size']):
+            batch = completed_trips(cutoff).filter(id__in=trip_ids[start:start + options['batch_size']])
+            # Relu par lot : un trajet modifié entre-temps (replanifié) n'est plus archivé
+            archived = archive_trips(batch)
+            trips += archived[0]
+            logs += archived[1]
+            raw_bytes += archived[2]
+            compressed_bytes += archived[3]
+
+        ratio = f", {raw_bytes / compressed_bytes:.1f}x smaller" if compressed_bytes else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{trips} trips archived ({logs} log entries removed, {raw_bytes} bytes of JSON stored in "
+            f"{compressed_bytes}{ratio})"
+        ))
@@ -0,0 +1,50 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trips.constants import CITIES_WITH_COORDS
+from trips.gazetteer import Place, write_gazetteer
+from trips.geo import haversine_miles
+
+# Colonnes des exports GeoNames "cities" (https://download.geonames.org/export/dump/)
+GEONAMES_NAME, GEONAMES_LAT, GEONAMES_LON, GEONAMES_COUNTRY, GEONAMES_ADMIN1, GEONAMES_POPULATION = 1, 4, 5, 8, 10, 14
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the memory-mapped gazetteer from a GeoNames cities dump (e.g. cities5000.txt, "
+        "tab-separated) and the cities of CITIES_WITH_COORDS, which keep their exact names and "
+        "coordinates so they stay consistent with the lane matrix and the road graph."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help="GeoNames cities*.txt dump; without it only CITIES_WITH_COORDS is written.")
+        parser.add_argument('--country', default='US')
+        parser.add_argument('--min-population', type=int, default=0)
+        parser.add_argument('--output', default=settings.GAZETTEER_PATH)
+
+    def handle(self, *args, **options):
+        places = []
+        if options['source']:
+            csv.field_size_limit(sys.maxsize)
+            with open(options['source'], encoding='utf-8', newline='') as f:
+                for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    population = int(row[GEONAMES_POPULATION] or 0)
+                    if row[GEONAMES_COUNTRY] != options['country'] or population < options['min_population']:
+                        continue
+                    places.append(Place(f"{row[GEONAMES_NAME]}, {row[GEONAMES_ADMIN1]}", float(row[GEONAMES_LAT]),
+                                        float(row[GEONAMES_LON]), population))
+
+        for name, (lat, lon) in CITIES_WITH_COORDS.items():
+            # Population de la localité GeoNames la plus peuplée à proximité, pour le classement
+            state = name.rsplit(', ', 1)[-1]
+            population = max((place.population for place in places
+                              if place.name.endswith(f", {state}")
+                              and haversine_miles(lat, lon, place.latitude, place.longitude) < 15), default=0)
+            # Priorité absolue aux noms des villes connues en cas de doublon
+            places.append(Place(name, lat, lon, population + 1))
+
+        count = write_gazetteer(options['output'], places)
+        self.stdout.write(self.style.SUCCESS(f"{count} places written to {options['output']}"))
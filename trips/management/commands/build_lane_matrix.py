@@ -0,0 +1,137 @@
+import json
+import os
+import time
+
+import polyline
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from geopy.distance import geodesic
+
+from trips.constants import AVERAGE_SPEED, CITIES_WITH_COORDS
+from trips.lane_matrix import simplify_route, write_lane_matrix
+from trips.rate_limiter import BATCH
+from trips.road_graph import get_road_graph
+from trips.routing import fetch_route
+
+# Espacement en miles des points interpolés de la ligne droite de remplacement
+STANDIN_POINT_SPACING = 25
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes HGV distance, duration and simplified geometry for every lane between "
+        "CITIES_WITH_COORDS and writes the memory-mapped lane matrix. Progress is checkpointed, "
+        "so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', choices=['ors', 'graph', 'standin'], default='ors',
+                            help="'ors' calls OpenRouteService, 'graph' uses the bundled offline road graph "
+                                 "(OpenRouteService for the lanes it has no path for, if MAP_API_KEY is set), "
+                                 "'standin' uses a local straight-line stand-in, never preferred over a real route.")
+        parser.add_argument('--output', default=settings.LANE_MATRIX_PATH)
+        parser.add_argument('--rate', type=float, default=40,
+                            help="Maximum routing requests per minute for this run; the shared ORS quota "
+                                 "(ROUTING_RATE_LIMIT) applies on top, at batch priority.")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Stop after computing this many new lanes.")
+        parser.add_argument('--tolerance', type=float, default=0.005,
+                            help="Geometry simplification tolerance, in degrees.")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        checkpoint_path = f"{output}.partial.jsonl"
+        cities = list(CITIES_WITH_COORDS)
+        standin = options['provider'] == 'standin'
+        lanes = self.load_checkpoint(checkpoint_path, standin)
+
+        api_key = os.environ.get('MAP_API_KEY')
+        if options['provider'] == 'ors' and not api_key:
+            raise CommandError("MAP_API_KEY is not set in environment variables")
+
+        pending = [(o, d) for o in cities for d in cities if o != d and (o, d) not in lanes]
+        if options['limit'] is not None:
+            pending = pending[:options['limit']]
+        self.stdout.write(f"{len(lanes)} lanes already computed, {len(pending)} to go")
+
+        min_interval = 60 / options['rate'] if options['rate'] > 0 else 0
+        last_request = 0.0
+        failures = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            for n, (origin, destination) in enumerate(pending, 1):
+                start, end = CITIES_WITH_COORDS[origin], CITIES_WITH_COORDS[destination]
+                route = get_road_graph().route(start, end) if options['provider'] == 'graph' else None
+                if options['provider'] == 'standin':
+                    route = self.standin_route(origin, destination)
+                elif route is None and api_key:
+                    # Fournisseur ORS, ou trajet sans chemin dans le graphe routier
+                    wait = min_interval - (time.monotonic() - last_request)
+                    if wait > 0:
+                        time.sleep(wait)
+                    last_request = time.monotonic()
+                    try:
+                        route = fetch_route(start, end, api_key, priority=BATCH)
+                    except requests.exceptions.RequestException as e:
+                        failures += 1
+                        self.stderr.write(f"{origin} -> {destination}: {e}")
+                        continue
+                if route is None:
+                    failures += 1
+                    self.stderr.write(f"{origin} -> {destination}: no path in the road graph")
+                    continue
+
+                distance, duration, geometry, segments = route
+                if geometry:
+                    coords, segments = simplify_route(polyline.decode(geometry), segments, options['tolerance'])
+                    geometry = polyline.encode(coords)
+
+                lanes[(origin, destination)] = (distance, duration, geometry, segments)
+                checkpoint.write(json.dumps({
+                    'origin': origin, 'destination': destination, 'standin': standin,
+                    'distance': distance, 'duration': duration, 'geometry': geometry, 'segments': segments
+                }) + '\n')
+                checkpoint.flush()
+
+                if n % 500 == 0:
+                    self.stdout.write(f"{n}/{len(pending)} lanes computed")
+
+        write_lane_matrix(output, cities, lanes, standin=standin)
+        expected = len(cities) * (len(cities) - 1)
+        if len(lanes) >= expected:
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output}: {len(lanes)}/{expected} lanes ({failures} failures)"
+        ))
+
+    def load_checkpoint(self, path, standin):
+        lanes = {}
+        if not os.path.exists(path):
+            return lanes
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # Ligne tronquée par une interruption : le lane sera recalculé
+                    continue
+                if row.get('standin', False) != standin or 'segments' not in row:
+                    # Lane d'un autre fournisseur (ou d'une version sans étapes) : recalculé
+                    continue
+                lanes[(row['origin'], row['destination'])] = (row['distance'], row['duration'], row['geometry'],
+                                                              row['segments'])
+        return lanes
+
+    def standin_route(self, origin, destination):
+        start = CITIES_WITH_COORDS[origin]
+        end = CITIES_WITH_COORDS[destination]
+        distance = geodesic(start, end).miles
+        points = max(2, int(distance // STANDIN_POINT_SPACING) + 1)
+        coords = [
+            (start[0] + (end[0] - start[0]) * k / (points - 1), start[1] + (end[1] - start[1]) * k / (points - 1))
+            for k in range(points)
+        ]
+        # Pas d'étapes : le planificateur conduit à la vitesse moyenne, sans nom de route
+        return distance, distance / AVERAGE_SPEED, polyline.encode(coords), []
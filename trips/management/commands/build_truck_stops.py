@@ -0,0 +1,65 @@
+import csv
+import math
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trips.constants import CITIES_WITH_COORDS
+from trips.geo import haversine_miles
+from trips.road_graph import ROAD_DETOUR_FACTOR, get_road_graph
+from trips.truck_stops import REST_AREA, TRUCK_STOP
+
+FIELDS = ['name', 'kind', 'highway', 'latitude', 'longitude']
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the truck stop dataset along the corridors of the bundled road graph: a truck stop "
+        "at every city and a stop every --spacing miles along each highway, every --rest-area-every-th "
+        "one being a rest area without fuel. The names and positions are placeholders on the corridors, "
+        "not surveyed locations: use the file for development only. In production, point "
+        "TRUCK_STOPS['PATH'] to a real export (e.g. OpenStreetMap amenity=fuel with hgv=yes) with the "
+        "same columns, since stop names are written into the ELD logs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=os.path.join(settings.VAR_DIR, 'truck_stops_placeholder.csv'))
+        parser.add_argument('--spacing', type=float, default=12, help="Miles between two stops on a highway.")
+        parser.add_argument('--rest-area-every', type=int, default=4)
+
+    def handle(self, *args, **options):
+        graph = get_road_graph()
+        stops = [
+            {'name': f"Truck Stop {name}", 'kind': TRUCK_STOP, 'highway': '', 'latitude': lat, 'longitude': lon}
+            for name, (lat, lon) in CITIES_WITH_COORDS.items()
+        ]
+
+        for i, edges in enumerate(graph.adjacency):
+            for j, _, _, highway in edges:
+                if j < i:
+                    continue
+                (lat_a, lon_a), (lat_b, lon_b) = graph.coords[i], graph.coords[j]
+                length = haversine_miles(lat_a, lon_a, lat_b, lon_b) * ROAD_DETOUR_FACTOR
+                count = math.floor(length / options['spacing'])
+                for k in range(1, count + 1):
+                    fraction = k / (count + 1)
+                    # Nommé d'après l'extrémité la plus proche, avec la distance qui l'en sépare
+                    near, miles = ((graph.names[i], fraction * length) if fraction <= 0.5
+                                   else (graph.names[j], (1 - fraction) * length))
+                    kind = REST_AREA if len(stops) % options['rest_area_every'] == 0 else TRUCK_STOP
+                    label = 'Rest Area' if kind == REST_AREA else 'Travel Center'
+                    stops.append({
+                        'name': f"{highway} {label}, {miles:.0f} mi from {near}",
+                        'kind': kind,
+                        'highway': highway,
+                        'latitude': round(lat_a + (lat_b - lat_a) * fraction, 5),
+                        'longitude': round(lon_a + (lon_b - lon_a) * fraction, 5),
+                    })
+
+        os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(stops)
+        self.stdout.write(self.style.SUCCESS(f"{len(stops)} stops written to {options['output']}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.models import Trip
+from trips.route_index import index_trip, is_available
+
+
+class Command(BaseCommand):
+    help = "Indexes the stored routes of existing trips in the route R*Tree (SQLite only)."
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError("The route R*Tree is not available (SQLite database with migration 0005 required)")
+        trips = Trip.objects.filter(route_distances__isnull=False).only(
+            'id', 'route_geometry_to_pickup', 'route_geometry_to_dropoff', 'route_distances'
+        )
+        count = chunks = 0
+        for trip in trips.iterator(chunk_size=500):
+            chunks += index_trip(trip)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} trips indexed ({chunks} route chunks)"))
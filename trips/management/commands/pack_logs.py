@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from trips.models import LogEntry, Trip
+from trips.packed_logs import pack_logs, thaw_logs
+from trips.write_queue import lock_for_write
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the log entries of existing trips to the packed columnar storage (see trips/packed_logs.py), "
+        "or back to LogEntry rows with --unpack, e.g. after changing LOG_STORAGE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unpack', action='store_true', help="Converts packed trips back to rows.")
+
+    def handle(self, *args, **options):
+        if options['unpack']:
+            trip_ids = list(Trip.objects.filter(packed_logs__isnull=False).values_list('id', flat=True))
+            for trip_id in trip_ids:
+                thaw_logs(Trip(id=trip_id))
+            self.stdout.write(self.style.SUCCESS(f"{len(trip_ids)} trips converted to log rows"))
+            return
+
+        trip_ids = list(Trip.objects.filter(packed_logs__isnull=True, logs__isnull=False).distinct()
+                        .values_list('id', flat=True))
+        entries = 0
+        for trip_id in trip_ids:
+            # Une transaction par trajet : la conversion peut être interrompue et reprise
+            with transaction.atomic():
+                lock_for_write(Trip, trip_id)
+                logs = list(LogEntry.objects.filter(trip_id=trip_id).order_by('date', 'start_time'))
+                Trip.objects.filter(id=trip_id).update(packed_logs=pack_logs(logs))
+                LogEntry.objects.filter(trip_id=trip_id).delete()
+            entries += len(logs)
+        self.stdout.write(self.style.SUCCESS(f"{len(trip_ids)} trips packed ({entries} log entries)"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the expired Idempotency-Key records of trip creations (see trips/idempotency.py), in "
+        "batches. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Keys deleted per transaction.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        deleted = purge_expired_keys(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} expired idempotency keys deleted"))
@@ -0,0 +1,288 @@
+"""Instrumentation légère des requêtes : minutage par étape, en-tête Server-Timing et métriques Prometheus.
+
+Le code mesuré marque ses étapes avec `stage(name)` (gestionnaire de contexte) ou un
+StageTimer (tours, pour les fonctions longues). Pendant une requête, ServerTimingMiddleware
+collecte les durées des étapes, les renvoie dans l'en-tête Server-Timing et les ajoute aux
+histogrammes du processus ; les compteurs sont incrémentés avec `increment`. Les deux sont
+exposés au format texte de Prometheus par `metrics_view` (/metrics).
+
+Les métriques sont tenues en mémoire par processus, et chaque processus en écrit un instantané
+dans un petit fichier SQLite partagé (METRICS['PATH']) au plus toutes les FLUSH_SECONDS, après une
+requête. /metrics publie la somme des instantanés de tous les workers : quel que soit le worker
+qui répond au scrape, les valeurs couvrent tout le déploiement (celles des autres workers ont au
+plus FLUSH_SECONDS de retard). Les instantanés des processus arrêtés sont gardés, pour que les
+compteurs ne diminuent pas quand un worker redémarre. Un worker forké repart de zéro : les valeurs
+héritées sont publiées par le processus parent.
+
+/metrics n'est servi qu'aux adresses de METRICS['ALLOWED_IPS'] ou avec l'en-tête
+`Authorization: Bearer <METRICS['TOKEN']>`. METRICS_ENABLED=False rend les minuteurs inopérants.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'trip_planner'
+# Bornes des histogrammes (secondes), celles par défaut des clients Prometheus
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_stages = ContextVar('request_stages', default=None)
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_help = {}
+_process = {'pid': None, 'id': None, 'flushed_at': 0.0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_snapshot (
+    process TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    help TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (process, kind, name, labels)
+);
+"""
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _check_process():
+    """Identifie le processus courant (appelé sous _lock) ; un worker forké oublie les valeurs héritées."""
+    pid = os.getpid()
+    if pid != _process['pid']:
+        if _process['pid'] is not None:
+            _histograms.clear()
+            _counters.clear()
+        _process.update(pid=pid, id=f"{pid}-{uuid.uuid4().hex}", flushed_at=0.0)
+
+
+def observe(name, seconds, labels=None, help_text=''):
+    """Ajoute une durée (secondes) à l'histogramme `name`."""
+    key = (name, _labels(labels))
+    with _lock:
+        _check_process()
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            _help.setdefault(name, help_text)
+        values[bisect_left(BUCKETS, seconds)] += 1
+        values[-1] += seconds
+
+
+def increment(name, labels=None, value=1, help_text=''):
+    """Incrémente le compteur `name`."""
+    key = (name, _labels(labels))
+    with _lock:
+        _check_process()
+        _counters[key] = _counters.get(key, 0) + value
+        _help.setdefault(name, help_text)
+
+
+def record(name, seconds):
+    """Ajoute seconds à l'étape `name` de la requête en cours, ou à son histogramme hors requête."""
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+    elif settings.METRICS_ENABLED:
+        observe('stage_seconds', seconds, {'stage': name}, "Duration of instrumented stages.")
+
+
+@contextmanager
+def stage(name):
+    """Minute le bloc comme l'étape `name` (cumulée si le bloc est exécuté plusieurs fois)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Décorateur qui minute chaque appel d'une fonction comme l'étape `name`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageTimer:
+    """Minute les étapes successives d'une fonction longue : chaque lap(name) termine l'étape commencée au précédent."""
+
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        record(name, now - self.last)
+        self.last = now
+
+
+class ServerTimingMiddleware:
+    """Reporte les étapes de chaque requête dans l'en-tête Server-Timing et les histogrammes.
+
+    Le temps passé en base est mesuré comme l'étape 'db' par un wrapper de requêtes : il
+    recouvre les autres étapes, les entrées de Server-Timing ne s'additionnent donc pas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        stages = {}
+        token = _request_stages.set(stages)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self.time_query):
+                response = self.get_response(request)
+        finally:
+            _request_stages.reset(token)
+        total = time.perf_counter() - started
+
+        view = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        observe('request_seconds', total, {'view': view or 'unnamed'}, "Duration of HTTP requests, by view.")
+        for name, seconds in stages.items():
+            observe('stage_seconds', seconds, {'stage': name}, "Duration of instrumented stages.")
+        maybe_flush()
+        response['Server-Timing'] = ', '.join(
+            [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()] + [f"total;dur={total * 1000:.1f}"]
+        )
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        with stage('db'):
+            return execute(sql, params, many, context)
+
+
+def _connect():
+    path = settings.METRICS['PATH']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def flush():
+    """Écrit l'instantané des métriques du processus dans le fichier partagé."""
+    with _lock:
+        _check_process()
+        process = _process['id']
+        rows = [('counter', name, labels, value) for (name, labels), value in _counters.items()]
+        rows += [('histogram', name, labels, list(values)) for (name, labels), values in _histograms.items()]
+        help_texts = dict(_help)
+        _process['flushed_at'] = now = time.time()
+    with closing(_connect()) as connection:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO metric_snapshot (process, kind, name, labels, help, value, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(process, kind, name, json.dumps(labels), help_texts.get(name, ''), json.dumps(value), now)
+                 for kind, name, labels, value in rows]
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+
+def maybe_flush():
+    """Écrit l'instantané du processus si le précédent date de plus de FLUSH_SECONDS."""
+    if time.time() - _process['flushed_at'] >= settings.METRICS['FLUSH_SECONDS']:
+        try:
+            flush()
+        except sqlite3.Error:
+            # Les métriques ne doivent jamais faire échouer une requête : réessayé à la suivante
+            logger.warning("Could not write the metrics snapshot", exc_info=True)
+
+
+def collect():
+    """Somme des instantanés de tous les processus : (compteurs, histogrammes, textes d'aide)."""
+    counters, histograms, help_texts = {}, {}, {}
+    with closing(_connect()) as connection:
+        rows = connection.execute('SELECT kind, name, labels, help, value FROM metric_snapshot').fetchall()
+    for kind, name, labels, help_text, value in rows:
+        key = (name, tuple(tuple(pair) for pair in json.loads(labels)))
+        value = json.loads(value)
+        help_texts.setdefault(name, help_text)
+        if kind == 'counter':
+            counters[key] = counters.get(key, 0) + value
+        else:
+            total = histograms.setdefault(key, [0] * len(value))
+            histograms[key] = [a + b for a, b in zip(total, value)]
+    return counters, histograms, help_texts
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def render():
+    """Métriques de tous les workers au format texte d'exposition de Prometheus."""
+    flush()
+    counters, histograms, help_texts = collect()
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        full_name = f"{PREFIX}_{name}"
+        lines += [f"# HELP {full_name} {help_texts[name]}", f"# TYPE {full_name} counter"]
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        full_name = f"{PREFIX}_{name}"
+        lines += [f"# HELP {full_name} {help_texts[name]}", f"# TYPE {full_name} histogram"]
+        for (histogram, labels), values in sorted(histograms.items()):
+            if histogram != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_allowed(request):
+    """Vrai pour une adresse de METRICS['ALLOWED_IPS'] ou avec le jeton Bearer de METRICS['TOKEN']."""
+    options = settings.METRICS
+    if options['TOKEN'] and constant_time_compare(request.headers.get('Authorization', ''),
+                                                  f"Bearer {options['TOKEN']}"):
+        return True
+    return request.META.get('REMOTE_ADDR') in options['ALLOWED_IPS']
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden("Forbidden\n", content_type='text/plain; charset=utf-8')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='distance_to_dropoff',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='distance_to_pickup',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='route_distances',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='route_geometry_to_dropoff',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='route_geometry_to_pickup',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='route_segments_to_dropoff',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='route_segments_to_pickup',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
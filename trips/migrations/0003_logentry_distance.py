@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0002_trip_route_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='distance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0003_logentry_distance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='place',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
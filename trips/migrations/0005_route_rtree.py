@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# R*Tree des tronçons de route (voir trips/route_index.py). Les colonnes préfixées par "+"
+# sont des colonnes auxiliaires, stockées avec chaque boîte mais non indexées.
+CREATE_RTREE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS trips_route_rtree USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon, +trip_id INTEGER, +start_distance REAL, +end_distance REAL
+)
+"""
+# Les lignes d'un trajet occupent les ids [trip_id * 65536, trip_id * 65536 + 65535]
+CREATE_DELETE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS trips_route_rtree_trip_delete AFTER DELETE ON trips_trip BEGIN
+    DELETE FROM trips_route_rtree WHERE id BETWEEN old.id * 65536 AND old.id * 65536 + 65535;
+END
+"""
+
+
+def create_route_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_RTREE)
+    schema_editor.execute(CREATE_DELETE_TRIGGER)
+
+
+def drop_route_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TRIGGER IF EXISTS trips_route_rtree_trip_delete")
+    schema_editor.execute("DROP TABLE IF EXISTS trips_route_rtree")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0004_logentry_place'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_route_rtree, drop_route_rtree),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:39
+
+from django.db import migrations, models
+
+from trips.geo import grid_cell
+
+
+def fill_cells(apps, schema_editor):
+    LogEntry = apps.get_model('trips', 'LogEntry')
+    entries = LogEntry.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude')
+    batch = []
+    for entry in entries.iterator(chunk_size=2000):
+        entry.cell = grid_cell(entry.latitude, entry.longitude)
+        batch.append(entry)
+        if len(batch) == 2000:
+            LogEntry.objects.bulk_update(batch, ['cell'])
+            batch = []
+    LogEntry.objects.bulk_update(batch, ['cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0005_route_rtree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='cell',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['cell', 'date'], name='trips_logentry_cell_date'),
+        ),
+        migrations.RunPython(fill_cells, migrations.RunPython.noop),
+    ]
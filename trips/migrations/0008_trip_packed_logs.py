@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0007_archivedtrip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='packed_logs',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
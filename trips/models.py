@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils import timezone
 
+from .geo import grid_cell
+
 class Trip(models.Model):
     current_location = models.CharField(max_length=255)
     pickup_location = models.CharField(max_length=255)
@@ -12,10 +14,26 @@ class Trip(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     route_geometry_to_pickup = models.TextField(null=True, blank=True)  # Polyline encodé pour current -> pickup
     route_geometry_to_dropoff = models.TextField(null=True, blank=True)  # Polyline encodé pour pickup -> dropoff
+    # Données de route conservées pour replanifier les logs sans nouvel appel de routage
+    distance_to_pickup = models.FloatField(null=True, blank=True)
+    distance_to_dropoff = models.FloatField(null=True, blank=True)
+    route_segments_to_pickup = models.JSONField(null=True, blank=True)  # Segments/étapes current -> pickup
+    route_segments_to_dropoff = models.JSONField(null=True, blank=True)  # Segments/étapes pickup -> dropoff
+    route_distances = models.BinaryField(null=True, blank=True)  # Distances cumulatives (float64 packés) par point
+    packed_logs = models.BinaryField(null=True, blank=True)  # Logs en colonnes packées (LOG_STORAGE='packed'), voir packed_logs.py
 
     def __str__(self):
         return f"Trip from {self.current_location} to {self.dropoff_location}"
 
+class LogEntryManager(models.Manager):
+    def get_queryset(self):
+        # trip.logs d'un trajet aux logs packés : entrées décodées en lecture seule, sans écriture en base
+        trip = getattr(self, 'instance', None)
+        if trip is not None and trip.packed_logs is not None:
+            from .packed_logs import PackedLogQuerySet, log_entries
+            return PackedLogQuerySet(self.model, log_entries(trip))
+        return super().get_queryset()
+
 class LogEntry(models.Model):
     STATUS_CHOICES = [
         ('OFF_DUTY', 'Off Duty'),
@@ -30,9 +48,49 @@ class LogEntry(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
     location = models.CharField(max_length=255)
+    place = models.CharField(max_length=255, blank=True, default='')  # Ville la plus proche, "Ville, ST"
+    distance = models.FloatField(null=True, blank=True)  # Miles parcourus depuis le départ à la fin de l'entrée
     # To track driver status positions (for map visualization)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    cell = models.IntegerField(null=True, blank=True)  # Cellule de grille de (latitude, longitude), voir geo.grid_cell
+
+    objects = LogEntryManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['cell', 'date'], name='trips_logentry_cell_date')]
+
+    def save(self, *args, **kwargs):
+        # bulk_create ne passe pas par save() : generate_eld_logs renseigne la cellule lui-même
+        self.cell = grid_cell(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.duty_status} on {self.date} from {self.start_time} to {self.end_time}"
+
+class ArchivedTrip(models.Model):
+    # Trajet terminé sorti des tables actives (commande archive_trips) : sa représentation complète
+    # (trajet, logs et résumé, telle que servie par l'API) en JSON compressé zlib
+    id = models.BigIntegerField(primary_key=True)  # Identifiant d'origine du trajet
+    start_time = models.DateTimeField()
+    log_count = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f"Archived trip {self.id} ({self.log_count} logs)"
+
+class IdempotencyKey(models.Model):
+    # En-tête Idempotency-Key d'une création de trajet (voir trips/idempotency.py) : empreinte de la
+    # requête et réponse rejouée aux nouvelles tentatives jusqu'à expires_at. Sans statut, la requête
+    # d'origine est encore en cours.
+    key = models.CharField(max_length=255, primary_key=True)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 du corps JSON canonique de la requête
+    trip_id = models.BigIntegerField(null=True, blank=True)  # Trajet créé
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.BinaryField(null=True, blank=True)  # Corps de la réponse en JSON compressé zlib
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        return f"{self.duty_status} on {self.date} from {self.start_time} to {self.end_time}"
\ No newline at end of file
+        return f"Idempotency key {self.key} (trip {self.trip_id})"
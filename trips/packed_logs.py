@@ -0,0 +1,390 @@
+"""Stockage compact en colonnes des entrées de log d'un trajet (settings.LOG_STORAGE = 'packed').
+
+Au lieu d'une ligne LogEntry par changement de statut, les entrées d'un trajet sont stockées
+dans Trip.packed_logs sous forme de tableaux parallèles, décodés avec array.frombytes :
+
+    en-tête     magic, nombre d'entrées, heure de base (µs depuis l'epoch), taille de la table des chaînes
+    chaînes     liste JSON des lieux et des places distincts
+    statut      uint8    indice dans LogEntry.STATUS_CHOICES
+    début, fin  int64    µs depuis l'heure de base (date + heure naïves de l'entrée)
+    distance    float64  NaN pour None
+    lat, lon    float32  NaN pour None (environ 1 m de précision, arrondi à 5 décimales à la lecture)
+    lieu        uint32   indice dans la table des chaînes
+    place       uint32   indice dans la table des chaînes
+
+Lire un trajet compacté revient à lire une colonne de la ligne du trajet, décodée directement
+au format de l'API (`log_representation`) ou en tuples PackedEntry légers (résumés, fenêtres de
+corridor), sans instancier de modèles LogEntry.
+
+Les lectures n'écrivent jamais : un trajet compacté n'a pas de lignes LogEntry, et `trip.logs`
+sert ses entrées décodées en lecture seule (PackedLogQuerySet, voir LogEntryManager) ; les
+écritures par `trip.logs` lèvent NotSupportedError. La replanification compacte directement
+les nouvelles entrées (`save_logs`).
+Les mises à jour de position, qui modifient les entrées enregistrées, reconvertissent
+explicitement l'enregistrement compacté en lignes (`thaw_logs`) puis le compactent à nouveau
+(`freeze_logs`), dans une transaction. Les trajets compactés n'ont pas de lignes dans l'index
+(cellule, date) : les requêtes de proximité décodent ceux dont la route passe près du point
+(voir proximity.py).
+"""
+import calendar
+import json
+import math
+import operator
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import NotSupportedError, transaction
+
+from .write_queue import lock_for_write
+
+MAGIC = b'PLG1'
+HEADER = struct.Struct('<4sIqI')
+EPOCH = datetime(1970, 1, 1)
+
+# Attributs lus par LogEntrySerializer et summarize_logs
+PackedEntry = namedtuple('PackedEntry', ['trip_id', 'date', 'duty_status', 'start_time', 'end_time', 'location',
+                                         'place', 'distance', 'latitude', 'longitude'])
+
+
+def packed_mode():
+    return settings.LOG_STORAGE == 'packed'
+
+
+def _statuses():
+    from .models import LogEntry
+    return [status for status, _ in LogEntry.STATUS_CHOICES]
+
+
+def _microseconds(moment):
+    return calendar.timegm(moment.timetuple()) * 1_000_000 + moment.microsecond
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def pack_logs(entries):
+    """Compacte des entrées de log (LogEntry ou PackedEntry, triées par date et heure de début) en octets."""
+    statuses = {status: code for code, status in enumerate(_statuses())}
+    strings = {}
+    starts, ends = [], []
+    for entry in entries:
+        start = datetime.combine(entry.date, entry.start_time)
+        end = datetime.combine(entry.date, entry.end_time)
+        if end < start:
+            end += timedelta(days=1)  # Entrée terminée à minuit
+        starts.append(_microseconds(start))
+        ends.append(_microseconds(end))
+    base = min(starts, default=0)
+    locations = [strings.setdefault(entry.location, len(strings)) for entry in entries]
+    places = [strings.setdefault(entry.place or '', len(strings)) for entry in entries]
+    string_table = json.dumps(list(strings), ensure_ascii=False, separators=(',', ':')).encode()
+
+    nan = float('nan')
+    return b''.join([
+        HEADER.pack(MAGIC, len(entries), base, len(string_table)),
+        string_table,
+        _column('B', [statuses[entry.duty_status] for entry in entries]),
+        _column('q', [start - base for start in starts]),
+        _column('q', [end - base for end in ends]),
+        _column('d', [nan if entry.distance is None else entry.distance for entry in entries]),
+        _column('f', [nan if entry.latitude is None else entry.latitude for entry in entries]),
+        _column('f', [nan if entry.longitude is None else entry.longitude for entry in entries]),
+        _column('I', locations),
+        _column('I', places),
+    ])
+
+
+def _columns(data):
+    data = bytes(data)
+    magic, count, base, strings_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a packed log record")
+    offset = HEADER.size
+    strings = json.loads(data[offset:offset + strings_length])
+    offset += strings_length
+    columns = []
+    for typecode in ('B', 'q', 'q', 'd', 'f', 'f', 'I', 'I'):
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(data[offset:offset + size])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        columns.append(column.tolist())
+        offset += size
+    return base, strings, columns
+
+
+def _optional(value, digits=None):
+    if math.isnan(value):
+        return None
+    return round(value, digits) if digits is not None else value
+
+
+def unpack_logs(data, trip_id=None):
+    """[PackedEntry] d'un enregistrement compacté, dans l'ordre (chronologique) de stockage."""
+    base, strings, (status, start, end, distance, lat, lon, location, place) = _columns(data)
+    statuses = _statuses()
+    base_time = EPOCH + timedelta(microseconds=base)
+    entries = []
+    for i in range(len(status)):
+        start_time = base_time + timedelta(microseconds=start[i])
+        end_time = base_time + timedelta(microseconds=end[i])
+        entries.append(PackedEntry(
+            trip_id, start_time.date(), statuses[status[i]], start_time.time(), end_time.time(),
+            strings[location[i]], strings[place[i]], _optional(distance[i]),
+            _optional(lat[i], 5), _optional(lon[i], 5),
+        ))
+    return entries
+
+
+def log_representation(entries):
+    """Sortie de LogEntrySerializer pour des tuples PackedEntry, construite directement."""
+    return [{
+        'date': entry.date.isoformat(),
+        'duty_status': entry.duty_status,
+        'start_time': entry.start_time.isoformat(),
+        'end_time': entry.end_time.isoformat(),
+        'location': entry.location,
+        'place': entry.place,
+        'distance': entry.distance,
+        'latitude': entry.latitude,
+        'longitude': entry.longitude,
+    } for entry in entries]
+
+
+def save_logs(trip, entries):
+    """Remplace les entrées enregistrées d'un trajet sauvegardé par celles planifiées, dans le mode configuré.
+
+    Renseigne trip.packed_logs, que l'appelant sauvegarde (dans la même transaction).
+    """
+    from .models import LogEntry
+
+    LogEntry.objects.filter(trip_id=trip.id).delete()
+    if packed_mode():
+        trip.packed_logs = pack_logs(entries)
+    else:
+        trip.packed_logs = None
+        LogEntry.objects.bulk_create(entries, batch_size=settings.DB_WRITES['BATCH_SIZE'])
+
+
+def freeze_logs(trip):
+    """Compacte les lignes de log d'un trajet (en mode compacté) et les supprime."""
+    from .models import LogEntry
+
+    if not packed_mode():
+        return
+    with transaction.atomic():
+        lock_for_write(type(trip), trip.pk)
+        entries = list(LogEntry.objects.filter(trip_id=trip.id).order_by('date', 'start_time'))
+        trip.packed_logs = pack_logs(entries)
+        trip.save(update_fields=['packed_logs'])
+        LogEntry.objects.filter(trip_id=trip.id).delete()
+
+
+def thaw_logs(trip):
+    """Reconvertit l'enregistrement compacté d'un trajet en lignes LogEntry, pour les mises à jour qui les modifient."""
+    from .geo import grid_cell
+    from .models import LogEntry
+
+    with transaction.atomic():
+        # Relu sous le verrou d'écriture : une autre requête a pu décompacter le trajet entre-temps
+        lock_for_write(type(trip), trip.pk)
+        data = type(trip).objects.filter(pk=trip.pk).values_list('packed_logs', flat=True).first()
+        if data is not None:
+            rows = [LogEntry(cell=grid_cell(entry.latitude, entry.longitude),
+                             **{**entry._asdict(), 'trip_id': trip.pk}) for entry in unpack_logs(data)]
+            LogEntry.objects.bulk_create(rows, batch_size=settings.DB_WRITES['BATCH_SIZE'])
+            type(trip).objects.filter(pk=trip.pk).update(packed_logs=None)
+    trip.packed_logs = None
+
+
+def last_log_date(data):
+    """Date de la dernière entrée d'un enregistrement compacté, ou None sans entrée."""
+    entries = unpack_logs(data)
+    return entries[-1].date if entries else None
+
+
+def log_entries(trip):
+    """LogEntry non enregistrées décodées de l'enregistrement compacté d'un trajet, dans l'ordre chronologique."""
+    from .geo import grid_cell
+    from .models import LogEntry
+
+    return [LogEntry(trip=trip, cell=grid_cell(entry.latitude, entry.longitude),
+                     **{name: value for name, value in entry._asdict().items() if name != 'trip_id'})
+            for entry in unpack_logs(trip.packed_logs, trip.pk)]
+
+
+LOOKUPS = {
+    'exact': operator.eq,
+    'lt': lambda value, bound: value is not None and value < bound,
+    'lte': lambda value, bound: value is not None and value <= bound,
+    'gt': lambda value, bound: value is not None and value > bound,
+    'gte': lambda value, bound: value is not None and value >= bound,
+    'in': lambda value, bounds: value in bounds,
+    'isnull': lambda value, isnull: (value is None) == isnull,
+    'startswith': lambda value, prefix: value is not None and value.startswith(prefix),
+    'contains': lambda value, part: value is not None and part in value,
+}
+
+
+class PackedLogQuerySet:
+    """`trip.logs` d'un trajet compacté : ses entrées décodées, en lecture seule.
+
+    Reprend la partie lecture de l'API des QuerySet (filter, exclude, order_by, get, count, exists,
+    first, last, values, values_list, itération et tranches) sur les LogEntry non enregistrées de
+    `log_entries`, sans requête. filter et exclude acceptent les arguments nommés sur les champs de
+    LogEntry avec les lookups de LOOKUPS. Les écritures lèvent NotSupportedError : les entrées d'un
+    trajet compacté se modifient en le repassant en lignes (`thaw_logs`, puis `freeze_logs`).
+    """
+
+    def __init__(self, model, entries):
+        self.model = model
+        self._entries = entries
+
+    def _clone(self, entries):
+        return type(self)(self.model, entries)
+
+    def _value(self, entry, name):
+        if name in ('pk', 'id'):
+            return entry.pk
+        if name == 'trip':
+            return entry.trip_id
+        field = self.model._meta.get_field(name)
+        return getattr(entry, field.attname)
+
+    def _matches(self, entry, conditions):
+        for key, bound in conditions.items():
+            name, _, lookup = key.partition('__')
+            if lookup not in LOOKUPS and lookup != '':
+                raise NotSupportedError(f"Lookup {key!r} is not supported on packed logs.")
+            if name == 'trip' and hasattr(bound, 'pk'):
+                bound = bound.pk
+            if not LOOKUPS[lookup or 'exact'](self._value(entry, name), bound):
+                return False
+        return True
+
+    # Appelés par le manager de la relation (RelatedManager._apply_rel_filters)
+    def _add_hints(self, **hints):
+        pass
+
+    def using(self, alias):
+        return self
+
+    def all(self):
+        return self._clone(self._entries)
+
+    def none(self):
+        return self._clone([])
+
+    def filter(self, *args, **kwargs):
+        if args:
+            raise NotSupportedError("Q objects are not supported on packed logs.")
+        return self._clone([entry for entry in self._entries if self._matches(entry, kwargs)])
+
+    def exclude(self, *args, **kwargs):
+        if args:
+            raise NotSupportedError("Q objects are not supported on packed logs.")
+        return self._clone([entry for entry in self._entries if not self._matches(entry, kwargs)])
+
+    def order_by(self, *fields):
+        entries = list(self._entries)
+        # Tris stables successifs, du dernier critère au premier ; None avant les autres valeurs
+        for field in reversed(fields):
+            name = field.lstrip('-')
+            entries.sort(key=lambda entry: (self._value(entry, name) is not None, self._value(entry, name)),
+                         reverse=field.startswith('-'))
+        return self._clone(entries)
+
+    def reverse(self):
+        return self._clone(self._entries[::-1])
+
+    def distinct(self, *fields):
+        return self._clone(self._entries)
+
+    def select_related(self, *fields):
+        return self._clone(self._entries)
+
+    def prefetch_related(self, *lookups):
+        return self._clone(self._entries)
+
+    def only(self, *fields):
+        return self._clone(self._entries)
+
+    def defer(self, *fields):
+        return self._clone(self._entries)
+
+    def count(self):
+        return len(self._entries)
+
+    def exists(self):
+        return bool(self._entries)
+
+    def first(self):
+        return self._entries[0] if self._entries else None
+
+    def last(self):
+        return self._entries[-1] if self._entries else None
+
+    def get(self, **kwargs):
+        found = self.filter(**kwargs)._entries
+        if not found:
+            raise self.model.DoesNotExist(f"{self.model._meta.object_name} matching query does not exist.")
+        if len(found) > 1:
+            raise self.model.MultipleObjectsReturned(f"get() returned more than one {self.model._meta.object_name}.")
+        return found[0]
+
+    def values(self, *fields):
+        fields = fields or [field.attname for field in self.model._meta.concrete_fields]
+        return [{name: self._value(entry, name) for name in fields} for entry in self._entries]
+
+    def values_list(self, *fields, flat=False):
+        if flat:
+            return [self._value(entry, fields[0]) for entry in self._entries]
+        return [tuple(self._value(entry, name) for name in fields) for entry in self._entries]
+
+    def iterator(self, chunk_size=None):
+        return iter(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._clone(self._entries[index])
+        return self._entries[index]
+
+    def __or__(self, other):
+        # Une entrée est identifiée par son début : les entrées d'un trajet ne se chevauchent pas
+        keys = {_entry_key(entry) for entry in self._entries}
+        merged = self._entries + [entry for entry in other._entries if _entry_key(entry) not in keys]
+        return self._clone(sorted(merged, key=_entry_key))
+
+    def __and__(self, other):
+        keys = {_entry_key(entry) for entry in other._entries}
+        return self._clone([entry for entry in self._entries if _entry_key(entry) in keys])
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._entries[:20]!r}>"
+
+    def _read_only(self, *args, **kwargs):
+        raise NotSupportedError("The logs of a packed trip are read-only; unpack them with thaw_logs first.")
+
+    create = get_or_create = update_or_create = bulk_create = bulk_update = update = delete = _read_only
+
+
+def _entry_key(entry):
+    return entry.date, entry.start_time
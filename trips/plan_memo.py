@@ -0,0 +1,98 @@
+"""Mémo des plannings HOS des nouveaux trajets, indexé par leurs entrées normalisées.
+
+Le planning d'un nouveau trajet ne dépend que de son itinéraire, de ses trois lieux, de son
+current_cycle_hours et de l'heure de son départ : les dates n'interviennent que par les
+découpages à minuit, qui suivent l'horloge. Deux trajets sur le même itinéraire avec les mêmes
+heures de cycle, partant à 06:00Z des jours différents, ont le même planning décalé de jours
+entiers.
+
+Le mémo garde chaque planning sous forme de PlanEvents relatifs à la date de départ (décalage
+en jours et autres champs de LogEntry) dans un LRU de PLAN_MEMO['ENTRIES'] plannings par
+processus, et dans le cache 'route_artifacts' partagé par les workers. Une correspondance réancre
+les événements sur la date de départ du nouveau trajet (`anchor_events`) au lieu d'exécuter
+l'ordonnanceur. Le cache partagé sert aussi de résultat commun aux créations simultanées du même
+planning dans plusieurs workers (`shared_plan`, voir single_flight.py). Les consultations sont
+comptées dans plan_memo_requests_total (hit, shared, miss) et les évictions dans
+plan_memo_evictions_total.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import increment
+from .models import LogEntry
+from .route_artifacts import artifact_key
+
+PLAN_MEMO_HELP = "Plan memo lookups, by result (hit, shared, miss)."
+
+PlanEvent = namedtuple('PlanEvent', ['day', 'fields'])
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _event_fields():
+    return [field.attname for field in LogEntry._meta.concrete_fields
+            if not field.primary_key and field.attname not in ('trip_id', 'date')]
+
+
+def memo_key(trip, current_cycle_hours):
+    """Entrées normalisées du planning d'un nouveau trajet : itinéraire, lieux, heures de cycle et heure de départ."""
+    start = trip.start_time
+    inputs = json.dumps([artifact_key(trip), trip.current_location, trip.pickup_location, trip.dropoff_location,
+                         float(current_cycle_hours), start.time().isoformat(), str(start.utcoffset())])
+    return 'plan:' + hashlib.blake2b(inputs.encode(), digest_size=16).hexdigest()
+
+
+def plan_events(entries, start_date):
+    """PlanEvents d'entrées de log planifiées, relatifs à la date de départ de leur trajet."""
+    fields = _event_fields()
+    return tuple(PlanEvent((entry.date - start_date).days, tuple(getattr(entry, name) for name in fields))
+                 for entry in entries)
+
+
+def anchor_events(events, trip):
+    """LogEntry non enregistrées du trajet à partir de PlanEvents, datées depuis la date de départ du trajet."""
+    fields = _event_fields()
+    start_date = trip.start_time.date()
+    return [LogEntry(trip=trip, date=start_date + timedelta(days=event.day), **dict(zip(fields, event.fields)))
+            for event in events]
+
+
+def shared_plan(key):
+    """PlanEvents stockés sous key dans le cache partagé par un worker, ou None."""
+    return caches['route_artifacts'].get(key)
+
+
+def memoized_plan(trip, current_cycle_hours, plan):
+    """PlanEvents du planning d'un nouveau trajet, depuis le mémo ou calculés par plan() (qui retourne des LogEntry)."""
+    key = memo_key(trip, current_cycle_hours)
+    with _memo_lock:
+        events = _memo.get(key)
+        if events is not None:
+            _memo.move_to_end(key)
+    if events is not None:
+        increment('plan_memo_requests_total', {'result': 'hit'}, help_text=PLAN_MEMO_HELP)
+        return events
+
+    events = shared_plan(key)
+    if events is not None:
+        increment('plan_memo_requests_total', {'result': 'shared'}, help_text=PLAN_MEMO_HELP)
+    else:
+        increment('plan_memo_requests_total', {'result': 'miss'}, help_text=PLAN_MEMO_HELP)
+        events = plan_events(plan(), trip.start_time.date())
+        caches['route_artifacts'].set(key, events)
+    evicted = 0
+    with _memo_lock:
+        _memo[key] = events
+        while len(_memo) > settings.PLAN_MEMO['ENTRIES']:
+            _memo.popitem(last=False)
+            evicted += 1
+    if evicted:
+        increment('plan_memo_evictions_total', value=evicted, help_text="Plans evicted from the plan memo (LRU).")
+    return events
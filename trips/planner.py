@@ -0,0 +1,1174 @@
+import logging
+import sys
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, time
+
+from django.conf import settings
+from geopy.distance import geodesic
+from django.utils import timezone
+
+from .constants import (
+    AVERAGE_SPEED, MAX_DRIVING_HOURS_PER_WINDOW, MAX_DUTY_HOURS_PER_WINDOW,
+    MAX_DRIVING_HOURS_BEFORE_BREAK, MAX_CYCLE_HOURS, FUELING_INTERVAL,
+    MINIMUM_REST_HOURS, RESTART_HOURS
+)
+from .gazetteer import location_coords
+from .geo import grid_cell, project_on_segment
+from .geocoding import get_reverse_geocoder
+from .metrics import StageTimer, increment, timed
+from .models import LogEntry
+from .route_artifacts import PHASES, get_route_artifact
+from .truck_stops import TRUCK_STOP, get_truck_stops
+
+logger = logging.getLogger(__name__)
+
+
+def pack_floats(values):
+    """Packe une liste de flottants en octets float64 little-endian."""
+    packed = array('d', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_floats(data):
+    values = array('d')
+    values.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tolist()
+
+
+class EldLogPlannerMixin:
+    """Planification HOS des entrées ELD, partagée par la création et la replanification des trajets."""
+
+    def interpolate_coords(self, route_coords, route_distances, target_distance):
+        """Interpole les coordonnées pour une distance donnée le long de la polyline.
+        
+        Args:
+            route_coords (list): Liste de tuples (lat, lon) représentant les points de la polyline.
+            route_distances (list): Liste des distances cumulatives le long de la polyline.
+            target_distance (float): Distance cible en miles.
+            
+        Returns:
+            tuple: (latitude, longitude) interpolée, ou None si l'interpolation n'est pas possible.
+        """
+        if not route_coords or not route_distances or len(route_coords) != len(route_distances):
+            return None
+        
+        if target_distance < 0:
+            return None
+        
+        total_distance = route_distances[-1]
+        if target_distance >= total_distance:
+            return route_coords[-1]  # Retourner le dernier point si la distance dépasse
+        
+        # Trouver les deux points entre lesquels interpoler (recherche dichotomique, distances croissantes)
+        i = bisect_right(route_distances, target_distance) - 1
+        if i < 0:
+            return None
+        if route_distances[i + 1] == route_distances[i]:
+            return route_coords[i]
+        # Calculer la fraction entre les deux points
+        fraction = (target_distance - route_distances[i]) / (route_distances[i + 1] - route_distances[i])
+        # Interpoler la latitude et la longitude
+        lat = route_coords[i][0] + fraction * (route_coords[i + 1][0] - route_coords[i][0])
+        lon = route_coords[i][1] + fraction * (route_coords[i + 1][1] - route_coords[i][1])
+        return (lat, lon)
+
+    @timed('cumulative_distances')
+    def calculate_cumulative_distances(self, coords):
+        """Calcule les distances cumulatives le long d'une liste de coordonnées (latitude, longitude).
+        
+        Args:
+            coords (list): Liste de tuples (lat, lon) représentant les points de la polyline.
+            
+        Returns:
+            list: Liste des distances cumulatives en miles.
+        """
+        if not coords:
+            return []
+        
+        distances = [0.0]  # Distance cumulée commence à 0
+        for i in range(1, len(coords)):
+            point1 = coords[i-1]  # (lat1, lon1)
+            point2 = coords[i]    # (lat2, lon2)
+            dist = geodesic(point1, point2).miles  # Distance en miles
+            distances.append(distances[-1] + dist)  # Ajouter à la distance cumulée
+        return distances
+
+    def calculate_route_distances(self, coords_to_pickup, coords_to_dropoff, distance_to_pickup=None,
+                                  distance_to_dropoff=None):
+        """Calcule les distances cumulatives sur l'ensemble du trajet (current -> pickup -> dropoff).
+
+        Args:
+            coords_to_pickup (list): Points (lat, lon) de la première partie du trajet (peut être vide).
+            coords_to_dropoff (list): Points (lat, lon) de la deuxième partie du trajet.
+            distance_to_pickup (float): Distance routière de la première partie, si connue.
+            distance_to_dropoff (float): Distance routière de la deuxième partie, si connue.
+
+        Returns:
+            list: Distances cumulatives en miles, alignées sur coords_to_pickup + coords_to_dropoff.
+                  Chaque partie est mise à l'échelle de sa distance routière, pour que les distances
+                  du planificateur (somme des steps) et les positions sur la géométrie concordent.
+        """
+        # Calculer les distances cumulatives pour chaque partie du trajet
+        distances_to_pickup = self.scale_distances(self.calculate_cumulative_distances(coords_to_pickup), distance_to_pickup)
+        distances_to_dropoff = self.scale_distances(self.calculate_cumulative_distances(coords_to_dropoff), distance_to_dropoff)
+        
+        # Combiner les distances cumulatives
+        if distances_to_pickup:
+            # Ajuster les distances de la deuxième partie en ajoutant la distance totale de la première partie
+            return distances_to_pickup + [d + distances_to_pickup[-1] for d in distances_to_dropoff]
+        return distances_to_dropoff
+
+    def scale_distances(self, distances, route_distance):
+        """Met les distances cumulatives géodésiques à l'échelle de la distance routière de la partie.
+
+        La géométrie simplifiée coupe les virages : sa longueur est inférieure à la somme des steps
+        sur laquelle le planificateur avance. Sans mise à l'échelle, un événement planifié au mile N
+        serait placé plus loin sur la géométrie. Inchangées si la distance routière est inconnue.
+        """
+        if not distances or not route_distance or not distances[-1]:
+            return distances
+        factor = route_distance / distances[-1]
+        return [d * factor for d in distances]
+
+    def remaining_steps(self, all_steps, distance, route_steps=None):
+        """Retourne les steps restant à parcourir après `distance` miles.
+
+        Le step en cours est réduit à sa partie restante (distance et durée au prorata).
+        Avec les RouteStep de l'artefact de la route (alignés sur all_steps), le step en cours
+        est trouvé par dichotomie sur leurs distances de départ.
+        """
+        if route_steps is not None:
+            index = bisect_right([step.offset for step in route_steps], distance) - 1
+            candidates = range(max(index, 0), len(all_steps))
+            travelled = route_steps[candidates[0]].offset if candidates else 0
+        else:
+            candidates = range(len(all_steps))
+            travelled = 0
+        for index in candidates:
+            step = all_steps[index]
+            if travelled + step['distance'] > distance:
+                remaining = dict(step)
+                fraction = (travelled + step['distance'] - distance) / step['distance']
+                remaining['distance'] = step['distance'] * fraction
+                remaining['duration'] = step['duration'] * fraction
+                return [remaining] + all_steps[index + 1:]
+            travelled += step['distance']
+        return []
+
+    def snap_to_route(self, route_coords, route_distances, latitude, longitude, from_distance=0):
+        """Projette une position GPS sur la route et retourne la distance parcourue correspondante (miles).
+
+        La recherche commence à `from_distance` (dernière position connue) : le camion n'avance
+        que dans un sens, et le coût reste proportionnel à la partie restante du trajet.
+        """
+        first = max(0, bisect_right(route_distances, from_distance) - 1)
+        best_offset, best_distance = None, from_distance
+        for i in range(first, len(route_coords) - 1):
+            fraction, offset = project_on_segment(latitude, longitude, route_coords[i], route_coords[i + 1])
+            if best_offset is None or offset < best_offset:
+                best_offset = offset
+                best_distance = route_distances[i] + fraction * (route_distances[i + 1] - route_distances[i])
+        return max(best_distance, from_distance)
+
+    def place_stops(self, log_entries, route_coords, route_distances):
+        """Nomme les ravitaillements, pauses et repos d'après le relais routier le plus proche.
+
+        Les relais du corridor de la route sont projetés une seule fois ; chaque arrêt est ensuite
+        trouvé par dichotomie. Seul un relais à SNAP_MILES au plus (avant ou après) du mile de l'entrée
+        est retenu : les horaires et la distance de l'entrée restent ceux du plan, le lieu et les
+        coordonnées sont ceux du relais et le lieu indique l'écart (en miles) entre le relais et le
+        mile du plan. Sans jeu de relais configuré, les entrées ne changent pas.
+        """
+        events = [
+            entry for entry in log_entries
+            if entry.location.startswith('Fuel Stop') or entry.duty_status in ('OFF_DUTY', 'SLEEPER_BERTH')
+        ]
+        truck_stops = get_truck_stops()
+        if not events or not route_coords or truck_stops is None:
+            return
+        options = settings.TRUCK_STOPS
+        from_distance = min(entry.distance for entry in events) - options['SNAP_MILES']
+        from_index = max(0, bisect_right(route_distances, from_distance) - 1)
+        route_stops = truck_stops.along_route(
+            route_coords, route_distances, options['CORRIDOR_MILES'], from_index=from_index
+        )
+        for entry in events:
+            # Un ravitaillement exige un relais avec carburant, une pause ou un repos se contente d'une aire
+            kinds = (TRUCK_STOP,) if entry.location.startswith('Fuel Stop') else None
+            found = route_stops.nearest(entry.distance, options['SNAP_MILES'], kinds)
+            if found is None:
+                continue
+            stop_distance, stop = found
+            # Le mile reste celui du plan : l'écart au relais est noté dans le lieu pour que les
+            # coordonnées du log restent justifiables
+            offset = stop_distance - entry.distance
+            label = entry.location.rsplit(' (', 1)[0]
+            entry.location = f"{label} - {stop['name']} ({entry.distance:.1f} miles, stop {offset:+.1f} mi)"
+            entry.latitude, entry.longitude = stop['latitude'], stop['longitude']
+            logger.info("Snapped '%s' at %.1f miles to %s at %.1f miles (%+.1f mi)",
+                        label, entry.distance, stop['name'], stop_distance, offset)
+
+    def generate_eld_logs(self, trip, distance_to_pickup, distance_to_dropoff, current_cycle_hours, persist=True,
+                          resume=None):
+        """Planifie les entrées ELD du trajet selon les règles HOS.
+
+        N'utilise que les données de route enregistrées sur le trajet (géométries, segments,
+        distances cumulatives) : aucun appel réseau, ce qui permet de replanifier un trajet existant.
+
+        Args:
+            resume (dict): État du conducteur en cours de trajet pour ne planifier que la suite :
+                'time', 'distance' (miles parcourus), 'window_start' (début de la fenêtre de 14h ou None),
+                'window_driving_hours', 'driving_since_break' et 'pickup_completed'.
+                current_cycle_hours est alors le cycle déjà consommé à cet instant.
+
+        Returns:
+            list: Les LogEntry générées (enregistrées en base uniquement si persist est vrai).
+        """
+        timer = StageTimer()
+        current_time = resume['time'] if resume else trip.start_time
+        last_entry_end_time = current_time  # Suivi de la fin de la dernière entrée pour éviter les retours en arrière
+        current_distance = resume['distance'] if resume else 0
+        
+        # Points, distances cumulatives et steps de la route : partagés par les trajets de la même route
+        # (voir route_artifacts.py), calculés seulement pour une route encore inconnue
+        artifact = get_route_artifact(trip)
+        all_coords, all_distances = artifact.coords, artifact.distances
+        
+        # Message de débogage pour vérifier le premier point (location_coords n'est appelé que si DEBUG est actif)
+        if all_coords and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Premier point de la route : %s (devrait être proche de %s)", all_coords[0], location_coords(trip.current_location))
+        
+        timer.lap('decode')
+
+        # Création d'une liste combinée de tous les steps du trajet pour une approche plus granulaire
+        legs = (f"Conduite de {trip.current_location} à {trip.pickup_location}",
+                f"Conduite de {trip.pickup_location} à {trip.dropoff_location}")
+        point_count = len(all_coords)
+        all_steps = [{
+            'distance': step.distance,
+            'duration': step.duration,
+            'instruction': step.instruction,
+            'name': step.name,
+            'phase': PHASES[step.phase],
+            'description': f"{legs[step.phase]}: {step.instruction} sur {step.name}",
+            'start_coords': all_coords[step.start] if step.start < point_count else None,
+            'end_coords': all_coords[step.end] if step.end < point_count else None
+        } for step in artifact.steps]
+        
+        if resume:
+            all_steps = self.remaining_steps(all_steps, current_distance, artifact.steps)
+        timer.lap('steps')
+
+        # Utilisation des steps pour une approche plus granulaire
+        total_on_duty_hours = current_cycle_hours
+        # En reprise, les ravitaillements des milles déjà parcourus sont considérés comme faits
+        fueling_stops_made = set(range(FUELING_INTERVAL, int(current_distance) + 1, FUELING_INTERVAL))
+        log_entries = []
+
+        if resume:
+            trip_state = {"last_duty_start_time": resume.get('window_start')}
+            resumed_counters = (resume.get('window_driving_hours', 0), resume.get('driving_since_break', 0))
+            in_initial_driving_phase = distance_to_pickup > 0 and not resume.get('pickup_completed')
+            pickup_completed = not in_initial_driving_phase
+        else:
+            # Ajouter un événement initial pour marquer le début du trajet
+            initial_end_time = current_time + timedelta(seconds=1)  # 15 minutes pour le départ
+            initial_coords = location_coords(trip.current_location)  # Coordonnées de New York, NY
+            initial_latitude = initial_coords[0]  # 40.7128
+            initial_longitude = initial_coords[1]  # -74.0060
+            logger.debug("Adding initial entry: DRIVING from %s to %s at 0 miles", current_time, initial_end_time)
+            self.add_log_entry(
+                log_entries,
+                trip,
+                current_time,
+                initial_end_time,
+                'DRIVING',
+                f"Départ de {trip.current_location}",
+                0,  # Distance = 0 miles
+                initial_latitude,
+                initial_longitude
+            )
+            last_entry_end_time = initial_end_time
+            current_time = initial_end_time
+            # total_on_duty_hours += 0.25  # Ajouter 15 minutes (0.25 heures) au total des heures de service
+
+            trip_state = {"last_duty_start_time": None}
+            resumed_counters = None
+            in_initial_driving_phase = distance_to_pickup > 0
+            pickup_completed = False
+        driving_buffer_start = None
+        driving_buffer_minutes = 0
+
+        total_distance = distance_to_pickup + distance_to_dropoff
+        
+        # Initialisation du compteur pour suivre la progression dans les steps
+        current_step_index = 0
+        
+        # Boucle principale utilisant les steps granulaires au lieu des segments complets
+        while current_distance < total_distance:
+            if not trip_state["last_duty_start_time"]:
+                trip_state["last_duty_start_time"] = current_time
+            
+            window_start = trip_state["last_duty_start_time"]
+            window_driving_hours = 0
+            driving_since_last_break = 0
+            if resumed_counters:
+                # Première fenêtre d'une reprise : compteurs HOS transmis par le conducteur
+                window_driving_hours, driving_since_last_break = resumed_counters
+                resumed_counters = None
+
+            while window_driving_hours < MAX_DRIVING_HOURS_PER_WINDOW and current_distance < total_distance:
+                time_in_window = (current_time - window_start).total_seconds() / 3600
+                if time_in_window >= MAX_DUTY_HOURS_PER_WINDOW:
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
+                                    else "Driving")
+                        # S'assurer que le start_time est >= last_entry_end_time
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
+                    # S'assurer que le start_time est >= last_entry_end_time
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: SLEEPER_BERTH from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "10h Rest after 14h Service", current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    trip_state["last_duty_start_time"] = None
+                    break
+
+                remaining_cycle_hours = MAX_CYCLE_HOURS - total_on_duty_hours
+                if remaining_cycle_hours <= 0:
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
+                                    else "Driving")
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    end_time = current_time + timedelta(hours=RESTART_HOURS)
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    total_on_duty_hours = 0
+                    trip_state["last_duty_start_time"] = None
+                    break
+
+                if in_initial_driving_phase and current_distance >= distance_to_pickup and not pickup_completed:
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', f"Conduite de {trip.current_location} à {trip.pickup_location}", current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+                        
+                    current_distance = distance_to_pickup
+
+                    pickup_end_time = current_time + timedelta(hours=1)
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Utiliser les coordonnées exactes de pickup_location (Chicago, IL) au lieu d'interpoler
+                    pickup_coords = location_coords(trip.pickup_location)  # (41.8781, -87.6298) pour Chicago, IL
+                    latitude = pickup_coords[0]  # 41.8781
+                    longitude = pickup_coords[1]  # -87.6298
+                    logger.debug("Adding entry: ON_DUTY_NOT_DRIVING from %s to %s at %s miles", current_time, pickup_end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, pickup_end_time, 'ON_DUTY_NOT_DRIVING', f"Pickup at {trip.pickup_location}", current_distance, latitude, longitude)
+                    last_entry_end_time = pickup_end_time
+                    current_time = pickup_end_time
+                    total_on_duty_hours += 1
+                    pickup_completed = True
+                    in_initial_driving_phase = False
+
+                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                        end_time = current_time + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+
+                    time_in_window = (current_time - window_start).total_seconds() / 3600
+                    if time_in_window >= MAX_DUTY_HOURS_PER_WINDOW:
+                        end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: SLEEPER_BERTH from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "10h Rest after 14h Service", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        trip_state["last_duty_start_time"] = None
+                        break
+
+                    continue
+
+                if driving_since_last_break >= MAX_DRIVING_HOURS_BEFORE_BREAK:
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
+                                    else "Driving")
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    end_time = current_time + timedelta(minutes=30)
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "30min Break", current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    driving_since_last_break = 0
+                    total_on_duty_hours += 0.5
+                    
+                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                        end_time = current_time + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+                    
+                    continue
+
+                # Calcul du prochain arrêt de ravitaillement
+                next_fueling_mile = (int(current_distance // FUELING_INTERVAL) + 1) * FUELING_INTERVAL
+                logger.debug("Distance actuelle: %s, Prochain ravitaillement: %s, Différence: %s", current_distance, next_fueling_mile, next_fueling_mile - current_distance)
+                if next_fueling_mile not in fueling_stops_made and current_distance + 60 >= next_fueling_mile:
+                    minutes_to_fuel = (next_fueling_mile - current_distance) / (AVERAGE_SPEED / 60)
+                    hours_to_fuel = minutes_to_fuel / 60
+                    
+                    if total_on_duty_hours + hours_to_fuel >= MAX_CYCLE_HOURS:
+                        minutes_to_cycle_limit = (MAX_CYCLE_HOURS - total_on_duty_hours) * 60
+                        if minutes_to_cycle_limit <= 0:
+                            if driving_buffer_minutes > 0:
+                                buffer_end_time = current_time
+                                location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
+                                            else "Conduite")
+                                if driving_buffer_start < last_entry_end_time:
+                                    driving_buffer_start = last_entry_end_time
+                                # Interpoler les coordonnées pour la distance actuelle
+                                coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                                latitude = coords[0] if coords else None
+                                longitude = coords[1] if coords else None
+                                logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                                self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                                last_entry_end_time = buffer_end_time
+                                driving_buffer_start = None
+                                driving_buffer_minutes = 0
+
+                            end_time = current_time + timedelta(hours=RESTART_HOURS)
+                            if current_time < last_entry_end_time:
+                                current_time = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                            last_entry_end_time = end_time
+                            current_time = end_time
+                            total_on_duty_hours = 0
+                            trip_state["last_duty_start_time"] = None
+                            break
+                        
+                        if driving_buffer_minutes > 0:
+                            buffer_end_time = current_time
+                            location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
+                                        else "Conduite")
+                            if driving_buffer_start < last_entry_end_time:
+                                driving_buffer_start = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                            last_entry_end_time = buffer_end_time
+                            driving_buffer_start = None
+                            driving_buffer_minutes = 0
+                            
+                        cycle_limit_time = current_time + timedelta(minutes=minutes_to_cycle_limit)
+                        location = (f"Conduite de {trip.current_location} à {trip.pickup_location} jusqu'à limite du cycle" if in_initial_driving_phase
+                                    else "Conduite jusqu'à limite du cycle")
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", current_time, cycle_limit_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, cycle_limit_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = cycle_limit_time
+                        current_time = cycle_limit_time
+                        current_distance += minutes_to_cycle_limit * (AVERAGE_SPEED / 60)
+                        window_driving_hours += minutes_to_cycle_limit / 60
+                        driving_since_last_break += minutes_to_cycle_limit / 60
+                        total_on_duty_hours = MAX_CYCLE_HOURS
+                        
+                        end_time = current_time + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+                    
+                    if window_driving_hours + hours_to_fuel > MAX_DRIVING_HOURS_PER_WINDOW:
+                        hours_to_fuel = MAX_DRIVING_HOURS_PER_WINDOW - window_driving_hours
+                        minutes_to_fuel = hours_to_fuel * 60
+
+                    if driving_since_last_break + (minutes_to_fuel / 60) > MAX_DRIVING_HOURS_BEFORE_BREAK:
+                        minutes_to_break = (MAX_DRIVING_HOURS_BEFORE_BREAK - driving_since_last_break) * 60
+                        hours_to_break = minutes_to_break / 60
+                        end_time = current_time + timedelta(minutes=minutes_to_break)
+                        
+                        if driving_buffer_minutes > 0:
+                            buffer_end_time = current_time
+                            location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
+                                        else "Conduite")
+                            if driving_buffer_start < last_entry_end_time:
+                                driving_buffer_start = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                            last_entry_end_time = buffer_end_time
+                            driving_buffer_start = None
+                            driving_buffer_minutes = 0
+
+                        location = (f"Conduite de {trip.current_location} à {trip.pickup_location} jusqu'à la pause" if in_initial_driving_phase
+                                    else "Conduite jusqu'à la pause")
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        current_distance += minutes_to_break * (AVERAGE_SPEED / 60)
+                        window_driving_hours += hours_to_break
+                        driving_since_last_break += hours_to_break
+                        total_on_duty_hours += hours_to_break
+                        
+                        if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                            end_time = current_time + timedelta(hours=RESTART_HOURS)
+                            if current_time < last_entry_end_time:
+                                current_time = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                            last_entry_end_time = end_time
+                            current_time = end_time
+                            total_on_duty_hours = 0
+                            trip_state["last_duty_start_time"] = None
+                            break
+
+                        end_time = current_time + timedelta(minutes=30)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "30min Break", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        driving_since_last_break = 0
+                        total_on_duty_hours += 0.5
+                        
+                        if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                            end_time = current_time + timedelta(hours=RESTART_HOURS)
+                            if current_time < last_entry_end_time:
+                                current_time = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                            last_entry_end_time = end_time
+                            current_time = end_time
+                            total_on_duty_hours = 0
+                            trip_state["last_duty_start_time"] = None
+                            break
+                            
+                        continue
+
+                    end_time = current_time + timedelta(minutes=minutes_to_fuel)
+                    
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
+                                    else "Driving")
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    location = (f"Driving from {trip.current_location} to {trip.pickup_location} until fuel stop" if in_initial_driving_phase
+                                else "Driving until fuel stop")
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: DRIVING from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    current_distance += minutes_to_fuel * (AVERAGE_SPEED / 60)
+                    window_driving_hours += hours_to_fuel
+                    driving_since_last_break += hours_to_fuel
+                    total_on_duty_hours += hours_to_fuel
+                    
+                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                        end_time = current_time + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+
+                    fueling_stops_made.add(next_fueling_mile)
+                    end_time = current_time + timedelta(minutes=15)
+                    fueling_location = f"Fuel Stop at {next_fueling_mile:.1f} miles"
+                    logger.debug("Adding fuel stop at %.1f miles", next_fueling_mile)
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: ON_DUTY_NOT_DRIVING from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'ON_DUTY_NOT_DRIVING', fueling_location, current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    total_on_duty_hours += 0.25
+                    
+                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                        end_time = current_time + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+
+                    driving_buffer_start = None
+                    driving_buffer_minutes = 0
+                    continue
+
+                next_fueling_mile = (int(current_distance // FUELING_INTERVAL) + 1) * FUELING_INTERVAL
+                if next_fueling_mile not in fueling_stops_made and current_distance >= next_fueling_mile - 5:
+                    logger.debug("Fuel stop required at %s miles (current distance: %s)", next_fueling_mile, current_distance)
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
+                                    else "Driving")
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    fueling_stops_made.add(next_fueling_mile)
+                    end_time = current_time + timedelta(minutes=15)
+                    fueling_location = f"Fuel Stop at {next_fueling_mile:.1f} miles"
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: ON_DUTY_NOT_DRIVING from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'ON_DUTY_NOT_DRIVING', fueling_location, current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    total_on_duty_hours += 0.25
+                    
+                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                        end_time = current_time + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+                    continue
+                
+                if current_step_index < len(all_steps):
+                    current_step = all_steps[current_step_index]
+                    
+                    max_driving_minutes = min(
+                        (MAX_DRIVING_HOURS_PER_WINDOW - window_driving_hours) * 60,
+                        (MAX_DUTY_HOURS_PER_WINDOW - time_in_window) * 60,
+                        (MAX_CYCLE_HOURS - total_on_duty_hours) * 60,
+                        (MAX_DRIVING_HOURS_BEFORE_BREAK - driving_since_last_break) * 60
+                    )
+                    
+                    step_duration_minutes = current_step['duration'] * 60
+                    driving_minutes = min(max_driving_minutes, step_duration_minutes, 60)
+                    
+                    if driving_minutes <= 0:
+                        break
+                    
+                    proportion = driving_minutes / step_duration_minutes if step_duration_minutes > 0 else 0
+                    distance_covered = current_step['distance'] * proportion
+                    
+                    end_time = current_time + timedelta(minutes=driving_minutes)
+                    current_distance += distance_covered
+                    window_driving_hours += driving_minutes / 60
+                    driving_since_last_break += driving_minutes / 60
+                    total_on_duty_hours += driving_minutes / 60
+                    
+                    if proportion >= 1 or abs(proportion - 1) < 0.001:
+                        current_step_index += 1
+                else:
+                    remaining_distance = total_distance - current_distance
+                    remaining_minutes = min(
+                        (MAX_DRIVING_HOURS_PER_WINDOW - window_driving_hours) * 60,
+                        (MAX_DUTY_HOURS_PER_WINDOW - time_in_window) * 60,
+                        remaining_distance / (AVERAGE_SPEED / 60),
+                        (MAX_CYCLE_HOURS - total_on_duty_hours) * 60,
+                        60
+                    )
+                    
+                    if remaining_minutes <= 0:
+                        break
+                    driving_minutes = remaining_minutes
+                    
+                    end_time = current_time + timedelta(minutes=remaining_minutes)
+                    current_distance += (AVERAGE_SPEED / 60) * remaining_minutes
+                    window_driving_hours += remaining_minutes / 60
+                    driving_since_last_break += remaining_minutes / 60
+                    total_on_duty_hours += remaining_minutes / 60
+
+                if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                    if round(total_on_duty_hours, 2) >= MAX_CYCLE_HOURS:
+                        if driving_buffer_minutes > 0:
+                            buffer_end_time = current_time + timedelta(minutes=1)
+                            location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
+                                        else "Conduite")
+                            if driving_buffer_start < last_entry_end_time:
+                                driving_buffer_start = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                            last_entry_end_time = buffer_end_time
+                            driving_buffer_start = None
+                            driving_buffer_minutes = 0
+
+                        end_time = current_time + timedelta(minutes=1) + timedelta(hours=RESTART_HOURS)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time + timedelta(minutes=1), end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time + timedelta(minutes=1), end_time, 'OFF_DUTY', "Redémarrage de 34 heures", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours = 0
+                        trip_state["last_duty_start_time"] = None
+                        break
+
+                if driving_buffer_start is None:
+                    driving_buffer_start = current_time
+                
+                # driving_minutes vaut aussi pour la conduite hors étapes : l'index d'étape a pu avancer depuis
+                driving_buffer_minutes += driving_minutes
+                
+                if driving_buffer_minutes >= 60:
+                    buffer_end_time = end_time
+                    
+                    if current_step_index > 0 and current_step_index <= len(all_steps):
+                        step_info = all_steps[current_step_index - 1]
+                        road_name = step_info['name'] if step_info['name'] and step_info['name'] != '-' else 'route non nommée'
+                        instruction = step_info['instruction']
+                        
+                        if in_initial_driving_phase and not pickup_completed:
+                            location = f"Driving from {trip.current_location} to {trip.pickup_location}: {instruction} on {road_name}"
+                        else:
+                            location = f"Driving from {trip.pickup_location} to {trip.dropoff_location}: {instruction} on {road_name}"
+                    else:
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase and not pickup_completed
+                                    else f"Driving from {trip.pickup_location} to {trip.dropoff_location}")
+                    
+                    if driving_buffer_start < last_entry_end_time:
+                        driving_buffer_start = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                    last_entry_end_time = buffer_end_time
+                    driving_buffer_start = buffer_end_time
+                    driving_buffer_minutes = 0
+
+                current_time = end_time
+
+                if window_driving_hours >= MAX_DRIVING_HOURS_PER_WINDOW:
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
+                                    else "Driving")
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    time_to_window_end = MAX_DUTY_HOURS_PER_WINDOW - (current_time - window_start).total_seconds() / 3600
+                    if time_to_window_end > 0:
+                        end_time = current_time + timedelta(hours=time_to_window_end)
+                        if current_time < last_entry_end_time:
+                            current_time = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: ON_DUTY_NOT_DRIVING from %s to %s at %s miles", current_time, end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, current_time, end_time, 'ON_DUTY_NOT_DRIVING', "14h Window End", current_distance, latitude, longitude)
+                        last_entry_end_time = end_time
+                        current_time = end_time
+                        total_on_duty_hours += time_to_window_end
+                        
+                        if total_on_duty_hours >= MAX_CYCLE_HOURS:
+                            end_time = current_time + timedelta(hours=RESTART_HOURS)
+                            if current_time < last_entry_end_time:
+                                current_time = last_entry_end_time
+                            # Interpoler les coordonnées pour la distance actuelle
+                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                            latitude = coords[0] if coords else None
+                            longitude = coords[1] if coords else None
+                            logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                            last_entry_end_time = end_time
+                            current_time = end_time
+                            total_on_duty_hours = 0
+                            trip_state["last_duty_start_time"] = None
+                            break
+                    
+                    end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: SLEEPER_BERTH from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "10h Rest after 11h Driving", current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    trip_state["last_duty_start_time"] = None
+                    break
+
+        if current_distance >= total_distance:
+            if total_on_duty_hours + 1 > MAX_CYCLE_HOURS:
+                if driving_buffer_minutes > 0:
+                    buffer_end_time = current_time
+                    if driving_buffer_start < last_entry_end_time:
+                        driving_buffer_start = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', "Conduite", current_distance, latitude, longitude)
+                    last_entry_end_time = buffer_end_time
+                    driving_buffer_start = None
+                    driving_buffer_minutes = 0
+
+                end_time = current_time + timedelta(hours=RESTART_HOURS)
+                if current_time < last_entry_end_time:
+                    current_time = last_entry_end_time
+                # Interpoler les coordonnées pour la distance actuelle
+                coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                latitude = coords[0] if coords else None
+                longitude = coords[1] if coords else None
+                logger.debug("Adding entry: OFF_DUTY from %s to %s at %s miles", current_time, end_time, current_distance)
+                self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
+                last_entry_end_time = end_time
+                current_time = end_time
+                total_on_duty_hours = 0
+                trip_state["last_duty_start_time"] = None
+            
+            if trip_state["last_duty_start_time"]:
+                time_in_window = (current_time - trip_state["last_duty_start_time"]).total_seconds() / 3600
+                if time_in_window + 1 > MAX_DUTY_HOURS_PER_WINDOW:
+                    if driving_buffer_minutes > 0:
+                        buffer_end_time = current_time
+                        if driving_buffer_start < last_entry_end_time:
+                            driving_buffer_start = last_entry_end_time
+                        # Interpoler les coordonnées pour la distance actuelle
+                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                        latitude = coords[0] if coords else None
+                        longitude = coords[1] if coords else None
+                        logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', "Conduite", current_distance, latitude, longitude)
+                        last_entry_end_time = buffer_end_time
+                        driving_buffer_start = None
+                        driving_buffer_minutes = 0
+
+                    end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
+                    if current_time < last_entry_end_time:
+                        current_time = last_entry_end_time
+                    # Interpoler les coordonnées pour la distance actuelle
+                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                    latitude = coords[0] if coords else None
+                    longitude = coords[1] if coords else None
+                    logger.debug("Adding entry: SLEEPER_BERTH from %s to %s at %s miles", current_time, end_time, current_distance)
+                    self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "Repos de 10h avant dépôt", current_distance, latitude, longitude)
+                    last_entry_end_time = end_time
+                    current_time = end_time
+                    trip_state["last_duty_start_time"] = None
+
+            if driving_buffer_minutes > 0:
+                buffer_end_time = current_time
+                if driving_buffer_start < last_entry_end_time:
+                    driving_buffer_start = last_entry_end_time
+                # Interpoler les coordonnées pour la distance actuelle
+                coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+                latitude = coords[0] if coords else None
+                longitude = coords[1] if coords else None
+                logger.debug("Adding entry: DRIVING from %s to %s at %s miles", driving_buffer_start, buffer_end_time, current_distance)
+                self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', "Conduite", current_distance, latitude, longitude)
+                last_entry_end_time = buffer_end_time
+                driving_buffer_start = None
+                driving_buffer_minutes = 0
+
+            dropoff_end_time = current_time + timedelta(hours=1)
+            if current_time < last_entry_end_time:
+                current_time = last_entry_end_time
+            # Interpoler les coordonnées pour la distance actuelle
+            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
+            latitude = coords[0] if coords else None
+            longitude = coords[1] if coords else None
+            logger.debug("Adding entry: ON_DUTY_NOT_DRIVING from %s to %s at %s miles", current_time, dropoff_end_time, current_distance)
+            self.add_log_entry(log_entries, trip, current_time, dropoff_end_time, 'ON_DUTY_NOT_DRIVING', f"Dropoff at {trip.dropoff_location}", current_distance, latitude, longitude)
+            last_entry_end_time = dropoff_end_time
+            total_on_duty_hours += 1
+
+        timer.lap('hos')  # Boucle HOS, appels à add_log_entry compris
+
+        # Placer ravitaillements, pauses et repos sur des relais routiers réels
+        self.place_stops(log_entries, all_coords, all_distances)
+        timer.lap('stops')
+        # Ville la plus proche (un seul passage sur l'index) et cellule de grille de chaque entrée
+        places = get_reverse_geocoder().nearest_many([(entry.latitude, entry.longitude) for entry in log_entries])
+        for entry, place in zip(log_entries, places):
+            entry.place = place or ''
+            entry.cell = grid_cell(entry.latitude, entry.longitude)
+        timer.lap('geocode')
+
+        # Trier les entrées par date et heure de début pour garantir un ordre chronologique
+        log_entries.sort(key=lambda x: (x.date, x.start_time))
+        increment('log_entries_generated_total', value=len(log_entries), help_text="Log entries planned (persisted or not).")
+        if persist:
+            LogEntry.objects.bulk_create(log_entries)
+            timer.lap('bulk_create')
+        return log_entries
+
+
+    @timed('add_log_entry')
+    def add_log_entry(self, log_entries, trip, start_time, end_time, duty_status, location, distance, latitude=None, longitude=None):
+        if start_time >= end_time:
+            return
+
+        # S'assurer que start_time et end_time sont offset-aware
+        if start_time.tzinfo is None:
+            # Si start_time est offset-naive, utiliser le fuseau horaire par défaut (UTC)
+            start_time = timezone.make_aware(start_time, timezone=timezone.utc)
+        if end_time.tzinfo is None:
+            # Si end_time est offset-naive, utiliser le fuseau horaire par défaut (UTC)
+            end_time = timezone.make_aware(end_time, timezone=timezone.utc)
+
+        location_with_distance = f"{location} ({distance:.1f} miles)"
+        current_start = start_time
+
+        while current_start < end_time:
+            # Déterminer la fin de l'entrée actuelle (minuit ou end_time)
+            next_midnight = datetime.combine(current_start.date() + timedelta(days=1), time.min, tzinfo=current_start.tzinfo)
+            current_end = min(end_time, next_midnight)
+
+            # Créer des datetime pour la nouvelle entrée, déjà offset-aware
+            new_start_dt = datetime.combine(current_start.date(), current_start.time(), tzinfo=current_start.tzinfo)
+            new_end_dt = datetime.combine(current_start.date(), current_end.time(), tzinfo=current_start.tzinfo)
+
+            # Vérifier les chevauchements
+            for entry in log_entries:
+                if entry.date == current_start.date():
+                    # Rendre les datetime des entrées existantes offset-aware en utilisant le même tzinfo
+                    entry_start_dt = datetime.combine(entry.date, entry.start_time, tzinfo=current_start.tzinfo)
+                    entry_end_dt = datetime.combine(entry.date, entry.end_time, tzinfo=current_start.tzinfo)
+                    
+                    # Vérifier que tous les datetimes sont offset-aware avant de les comparer
+                    if new_start_dt.tzinfo is None:
+                        new_start_dt = timezone.make_aware(new_start_dt, timezone=timezone.utc)
+                    if new_end_dt.tzinfo is None:
+                        new_end_dt = timezone.make_aware(new_end_dt, timezone=timezone.utc)
+                    if entry_start_dt.tzinfo is None:
+                        entry_start_dt = timezone.make_aware(entry_start_dt, timezone=timezone.utc)
+                    if entry_end_dt.tzinfo is None:
+                        entry_end_dt = timezone.make_aware(entry_end_dt, timezone=timezone.utc)
+                        
+                    if not (new_end_dt <= entry_start_dt or new_start_dt >= entry_end_dt):
+                        logger.warning("Chevauchement détecté : %s (%s - %s) vs %s (%s - %s)", duty_status, new_start_dt, new_end_dt, entry.duty_status, entry_start_dt, entry_end_dt)
+                        return  # Ignorer l'ajout en cas de chevauchement
+                    
+            # Ajuster end_time uniquement pour la sauvegarde dans la base de données
+            adjusted_end_time = current_end.time()
+            if adjusted_end_time == time.min and current_end != end_time:
+                adjusted_end_time = time(23, 59, 59, 999999)
+
+            log_entries.append(LogEntry(
+                trip=trip,
+                date=current_start.date(),
+                duty_status=duty_status,
+                start_time=current_start.time(),
+                end_time=adjusted_end_time,
+                location=location_with_distance,
+                distance=distance,
+                latitude=latitude,
+                longitude=longitude
+            ))
+
+            current_start = current_end
@@ -0,0 +1,125 @@
+"""Profilage à la demande d'une requête de l'API, pour les utilisateurs staff.
+
+Quand settings.PROFILING['ENABLED'] est activé, un utilisateur staff peut envoyer l'en-tête
+`X-Profile: 1` (ou le paramètre `profile=1`) pour exécuter sous cProfile une requête d'une vue
+qui utilise ProfiledViewMixin. Le profil est écrit au format pstats dans PROFILING['DIR'] et
+son nom renvoyé dans l'en-tête de réponse X-Profile ; seuls les PROFILING['MAX_FILES'] profils
+les plus récents sont conservés.
+
+Les profils se lisent avec `python -m pstats <fichier>`, snakeviz, ou par l'endpoint de
+téléchargement (`?summary=1` pour les fonctions au temps cumulé le plus élevé).
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+PROFILE_NAME = re.compile(r'^[\w-]+\.prof$')
+
+# cProfile ne peut pas profiler deux requêtes à la fois dans un même processus
+_profiling_lock = threading.Lock()
+
+
+def profile_requested(request):
+    if not settings.PROFILING['ENABLED'] or not request.user.is_staff:
+        return False
+    return request.headers.get('X-Profile') == '1' or request.query_params.get('profile') == '1'
+
+
+def profile_path(name):
+    """Chemin d'un profil enregistré, ou None si le nom est invalide ou inconnu."""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(settings.PROFILING['DIR'], name)
+    return path if os.path.isfile(path) else None
+
+
+def save_profile(profiler, view_name):
+    """Écrit le profil, supprime les plus anciens au-delà de MAX_FILES et retourne le nom du fichier."""
+    directory = settings.PROFILING['DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{view_name}-{uuid.uuid4().hex[:8]}.prof"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    profiler.dump_stats(tmp_path)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+    for profile in list_profiles()[settings.PROFILING['MAX_FILES']:]:
+        try:
+            os.remove(os.path.join(directory, profile['name']))
+        except FileNotFoundError:
+            pass  # Déjà supprimé par un autre worker
+    return name
+
+
+def list_profiles():
+    """[{'name', 'view', 'size', 'created_at'}] des profils enregistrés, du plus récent au plus ancien."""
+    directory = settings.PROFILING['DIR']
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if not PROFILE_NAME.match(entry.name):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        profiles.append({
+            'name': entry.name,
+            'view': entry.name.split('-', 1)[1].rsplit('-', 1)[0],
+            'size': stat.st_size,
+            'created_at': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        })
+    profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+    return profiles
+
+
+def profile_summary(path, limit=60):
+    """Rapport texte des `limit` fonctions au temps cumulé le plus élevé."""
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+class ProfiledViewMixin:
+    """Exécute le traitement d'une vue DRF (sérialisation comprise) sous cProfile sur demande.
+
+    Le profilage commence après l'authentification : la vérification staff vaut pour tout
+    mode d'authentification de DRF.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.profiler = None
+        if profile_requested(request) and _profiling_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profiler(self):
+        profiler = getattr(self, 'profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self.profiler = None
+            _profiling_lock.release()
+        return profiler
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Une erreur non gérée par DRF ne passe pas par finalize_response
+            self.stop_profiler()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        profiler = self.stop_profiler()
+        if profiler is not None:
+            view_name = request.resolver_match.url_name if request.resolver_match else type(self).__name__
+            response['X-Profile'] = save_profile(profiler, view_name)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,120 @@
+"""Recherches de proximité sur les entrées de log de tous les trajets ("repos à moins de 20 miles de X").
+
+Chaque LogEntry enregistre dans une colonne indexée la cellule d'une grille lat/lon fixe
+(geo.grid_cell), tenue à jour à l'écriture. Une requête traduit la zone de recherche en une
+plage de cellules par ligne de la grille, ne lit que ces lignes de l'index (cell, date), puis
+garde les entrées réellement dans le rayon.
+
+Les candidats sont triés en SQL par un minorant de leur distance (distance plane avec la plus
+petite échelle de longitude de la zone) et lus par paquets, identifiants et coordonnées
+seulement. Le parcours s'arrête dès que le minorant du candidat suivant dépasse le rayon ou la
+limit-ième meilleure distance exacte : mémoire et temps restent proportionnels à la limite
+plutôt qu'aux entrées de la zone. Seules les entrées retournées sont chargées.
+
+Les trajets aux logs packés (voir packed_logs.py) n'ont pas de lignes dans l'index : les candidats
+sont les trajets dont la route passe près du point (index des routes), dont les entrées sont
+décodées puis filtrées de la même façon.
+"""
+import heapq
+import math
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+
+from .geo import MILES_PER_DEGREE, grid_cell_ranges, haversine_miles
+from .models import LogEntry, Trip
+from .packed_logs import unpack_logs
+from .route_index import candidate_chunks, is_available as is_route_index_available
+
+# Colonnes lues par LogEntrySerializer, plus le trajet
+ENTRY_FIELDS = ['trip_id', 'date', 'duty_status', 'start_time', 'end_time', 'location', 'place', 'distance',
+                'latitude', 'longitude']
+CHUNK_SIZE = 500
+# Marge sur la borne inférieure : l'écart entre distance plane et haversine reste sous 0.5 % à 500 miles
+BOUND_MARGIN = 0.99
+
+
+def _distance_bound(latitude, longitude, radius_miles):
+    """Expression SQL (degrés², dans l'ordre des distances) qui ne dépasse jamais le carré de la distance."""
+    dlat = radius_miles / MILES_PER_DEGREE
+    dlon = radius_miles / (MILES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    # Zone à cheval sur l'antiméridien : l'écart de longitude n'y est pas monotone, seule la latitude borne
+    crosses = longitude - dlon < -180 or longitude + dlon > 180
+    scale = 0.0 if crosses else math.cos(math.radians(min(abs(latitude) + dlat, 90))) ** 2
+    lat_delta = F('latitude') - latitude
+    lon_delta = F('longitude') - longitude
+    return ExpressionWrapper(lat_delta * lat_delta + lon_delta * lon_delta * scale, output_field=FloatField())
+
+
+def packed_entries_near(latitude, longitude, radius_miles, duty_statuses=None, date_from=None, date_to=None):
+    """[(distance_miles, LogEntry non enregistrée)] des trajets aux logs packés, dans le rayon.
+
+    Les trajets lus sont ceux dont un tronçon de route recoupe la zone élargie de CORRIDOR_MILES
+    (arrêts recalés sur un relais routier à l'écart de la route), ou tous les trajets packés sans
+    index des routes.
+    """
+    trips = Trip.objects.filter(packed_logs__isnull=False)
+    if is_route_index_available():
+        margin = radius_miles + settings.TRUCK_STOPS['CORRIDOR_MILES']
+        dlat = margin / MILES_PER_DEGREE
+        dlon = min(margin / (MILES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)), 180)
+        trips = trips.filter(id__in=list(candidate_chunks(latitude - dlat, longitude - dlon,
+                                                            latitude + dlat, longitude + dlon)))
+    found = []
+    for trip_id, data in trips.values_list('id', 'packed_logs').iterator():
+        for entry in unpack_logs(data, trip_id):
+            if (entry.latitude is None or (duty_statuses and entry.duty_status not in duty_statuses)
+                    or (date_from and entry.date < date_from) or (date_to and entry.date > date_to)):
+                continue
+            miles = haversine_miles(latitude, longitude, entry.latitude, entry.longitude)
+            if miles <= radius_miles:
+                found.append((miles, LogEntry(**entry._asdict())))
+    return found
+
+
+def entries_near(latitude, longitude, radius_miles, duty_statuses=None, date_from=None, date_to=None, limit=None):
+    """Entrées de log à moins de radius_miles de (latitude, longitude), les plus proches d'abord.
+
+    Args:
+        duty_statuses (list): Statuts à garder (tous si None)
+        date_from, date_to (date): Bornes incluses sur la date de l'entrée
+        limit (int): Nombre maximal d'entrées retournées
+
+    Returns:
+        list: [(distance_miles, LogEntry)], entrées non enregistrées pour les trajets aux logs packés
+    """
+    ranges = grid_cell_ranges(latitude, longitude, radius_miles)
+    entries = LogEntry.objects.filter(reduce(or_, (Q(cell__range=cells) for cells in ranges)))
+    if duty_statuses:
+        entries = entries.filter(duty_status__in=duty_statuses)
+    if date_from:
+        entries = entries.filter(date__gte=date_from)
+    if date_to:
+        entries = entries.filter(date__lte=date_to)
+
+    radius_degrees = radius_miles / (MILES_PER_DEGREE * BOUND_MARGIN)
+    candidates = (entries.annotate(bound=_distance_bound(latitude, longitude, radius_miles))
+                  .filter(bound__lte=radius_degrees ** 2)
+                  .order_by('bound')
+                  .values_list('pk', 'latitude', 'longitude', 'bound'))
+
+    best = []  # Tas des (-distance, pk) des `limit` plus proches
+    for pk, entry_latitude, entry_longitude, bound in candidates.iterator(chunk_size=CHUNK_SIZE):
+        # Candidats triés par borne inférieure : aucun des suivants ne peut être plus proche
+        if limit and len(best) >= limit and math.sqrt(bound) * MILES_PER_DEGREE * BOUND_MARGIN > -best[0][0]:
+            break
+        miles = haversine_miles(latitude, longitude, entry_latitude, entry_longitude)
+        if miles > radius_miles:
+            continue
+        if not limit or len(best) < limit:
+            heapq.heappush(best, (-miles, pk))
+        elif miles < -best[0][0]:
+            heapq.heapreplace(best, (-miles, pk))
+
+    loaded = LogEntry.objects.only(*ENTRY_FIELDS).in_bulk([pk for _, pk in best])
+    found = [(-miles, loaded[pk]) for miles, pk in best]
+    found += packed_entries_near(latitude, longitude, radius_miles, duty_statuses, date_from, date_to)
+    found.sort(key=lambda item: item[0])
+    return found[:limit] if limit else found
@@ -0,0 +1,166 @@
+"""Seau à jetons partagé par tous les processus workers via un petit fichier SQLite.
+
+Chaque appel de routage prend un jeton. Le seau se remplit en continu jusqu'à la limite
+par minute, et un compteur journalier applique le quota du jour, remis à zéro à minuit UTC
+comme celui d'OpenRouteService.
+
+Les traitements par lots (rattrapages, construction de la matrice de trajets) n'obtiennent
+que les jetons au-delà d'une réserve gardée pour les créations de trajets interactives, et
+les attendent plus longtemps.
+"""
+import datetime
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    day_used INTEGER NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _quota_day(now):
+    """Jour du quota (UTC, comme OpenRouteService) d'un timestamp."""
+    return datetime.datetime.fromtimestamp(now, datetime.timezone.utc).date().isoformat()
+
+
+class TokenBucket:
+    def __init__(self, name, path, per_minute=40, per_day=2000, interactive_wait_seconds=3,
+                 batch_wait_seconds=120, batch_reserve=0.25):
+        self.name = name
+        self.path = str(path)
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.wait_seconds = {INTERACTIVE: interactive_wait_seconds, BATCH: batch_wait_seconds}
+        self.batch_reserve = batch_reserve
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def _load(self, connection, now):
+        """Retourne (tokens, day_used, blocked_until) du seau, après remplissage."""
+        today = _quota_day(now)
+        row = connection.execute(
+            'SELECT tokens, updated_at, day, day_used, blocked_until FROM bucket WHERE name = ?', (self.name,)
+        ).fetchone()
+        if row is None:
+            return float(self.per_minute), 0, 0.0
+        tokens, updated_at, day, day_used, blocked_until = row
+        tokens = min(float(self.per_minute), tokens + (now - updated_at) * self.per_minute / 60)
+        if day != today:
+            day_used = 0
+        return tokens, day_used, blocked_until
+
+    def _save(self, connection, now, tokens, day_used, blocked_until):
+        connection.execute(
+            'INSERT OR REPLACE INTO bucket (name, tokens, updated_at, day, day_used, blocked_until) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.name, tokens, now, _quota_day(now), day_used, blocked_until)
+        )
+
+    def _try_acquire(self, priority):
+        """Prend un jeton si possible. Retourne 0 en cas de succès, sinon l'attente en secondes (None : quota épuisé)."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                tokens, day_used, blocked_until = self._load(connection, now)
+                minute_floor, day_floor = 0.0, 0
+                if priority == BATCH:
+                    minute_floor = self.per_minute * self.batch_reserve
+                    day_floor = int(self.per_day * self.batch_reserve)
+
+                if self.per_day - day_used <= day_floor:
+                    wait = None
+                elif now < blocked_until:
+                    wait = blocked_until - now
+                elif tokens - 1 >= minute_floor:
+                    self._save(connection, now, tokens - 1, day_used + 1, blocked_until)
+                    wait = 0
+                else:
+                    wait = (minute_floor + 1 - tokens) * 60 / self.per_minute
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return wait
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """Attend un jeton ; retourne False si aucun n'est disponible dans le délai d'attente de la priorité."""
+        deadline = time.monotonic() + (self.wait_seconds[priority] if timeout is None else timeout)
+        while True:
+            wait = self._try_acquire(priority)
+            if wait == 0:
+                return True
+            if wait is None or time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def penalize(self, retry_after):
+        """Vide le seau après un 429 du service : aucun worker ne rappelle avant retry_after."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                _, day_used, _ = self._load(connection, now)
+                self._save(connection, now, 0.0, day_used, now + retry_after)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def sync_day_remaining(self, remaining):
+        """Aligne le compteur journalier sur le quota annoncé par le service."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                tokens, _, blocked_until = self._load(connection, now)
+                self._save(connection, now, tokens, max(0, self.per_day - remaining), blocked_until)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def remaining(self):
+        now = time.time()
+        with closing(self._connect()) as connection:
+            tokens, day_used, blocked_until = self._load(connection, now)
+        return {
+            'per_minute': self.per_minute,
+            'minute_tokens': round(tokens, 2),
+            'per_day': self.per_day,
+            'day_remaining': max(0, self.per_day - day_used),
+            'blocked_for_seconds': round(max(0.0, blocked_until - now), 2),
+        }
+
+
+_buckets = {}
+
+
+def get_rate_limiter(name):
+    if name not in _buckets:
+        options = dict(getattr(settings, 'ROUTING_RATE_LIMIT', {}))
+        path = options.pop('PATH', os.path.join(settings.VAR_DIR, 'routing_quota.sqlite3'))
+        _buckets[name] = TokenBucket(name, path, **{key.lower(): value for key, value in options.items()})
+    return _buckets[name]
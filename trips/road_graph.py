@@ -0,0 +1,200 @@
+"""Routage hors ligne sur le graphe routier des interstates embarqué (trips/data/road_graph.json).
+
+Le graphe relie toutes les villes de CITIES_WITH_COORDS, plus quelques échangeurs, le long
+des principaux corridors d'interstates. La longueur d'un tronçon est la distance orthodromique
+multipliée par un facteur de détour routier : les itinéraires restent réalistes sans aucun
+appel réseau.
+
+Les requêtes utilisent A* avec repères (ALT) : les temps de trajet minimaux depuis quelques
+repères éloignés les uns des autres sont calculés une fois au chargement et donnent une
+heuristique admissible serrée, qui garde une requête bien en dessous de la milliseconde.
+"""
+import heapq
+import json
+import math
+import os
+from bisect import bisect_left
+
+import polyline
+
+from .constants import CITIES_WITH_COORDS
+from .geo import haversine_miles
+from .lane_matrix import MAX_STEP_HOURS
+
+ROAD_GRAPH_PATH = os.path.join(os.path.dirname(__file__), 'data', 'road_graph.json')
+
+# Rapport distance routière / distance orthodromique sur les corridors d'interstates
+ROAD_DETOUR_FACTOR = 1.08
+# Vitesses moyennes des poids lourds en mph (interstates, routes fédérales et d'État)
+INTERSTATE_SPEED = 58
+HIGHWAY_SPEED = 50
+# Espacement en miles des points générés le long de chaque tronçon pour la géométrie de la route
+GEOMETRY_SPACING = 10
+LANDMARK_COUNT = 4
+
+_graph = None
+
+
+class RoadGraph:
+    def __init__(self, nodes, edges):
+        """
+        Args:
+            nodes (dict): {nom: [lat, lon]}
+            edges (list): Tronçons non orientés [nom_a, nom_b, route]
+        """
+        self.names = list(nodes)
+        self.coords = [tuple(nodes[name]) for name in self.names]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.adjacency = [[] for _ in self.names]
+
+        for a, b, highway in edges:
+            i, j = self.index[a], self.index[b]
+            distance = haversine_miles(*self.coords[i], *self.coords[j]) * ROAD_DETOUR_FACTOR
+            speed = INTERSTATE_SPEED if highway.startswith('I-') else HIGHWAY_SPEED
+            duration = distance / speed
+            self.adjacency[i].append((j, distance, duration, highway))
+            self.adjacency[j].append((i, distance, duration, highway))
+
+        self.max_speed = max(INTERSTATE_SPEED, HIGHWAY_SPEED)
+        self.landmarks = self._select_landmarks(LANDMARK_COUNT)
+
+    @classmethod
+    def from_file(cls, path=ROAD_GRAPH_PATH):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        nodes = dict(CITIES_WITH_COORDS)
+        nodes.update(data['junctions'])
+        return cls(nodes, data['edges'])
+
+    def _dijkstra(self, source):
+        durations = [math.inf] * len(self.names)
+        durations[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > durations[u]:
+                continue
+            for v, _, duration, _ in self.adjacency[u]:
+                nd = d + duration
+                if nd < durations[v]:
+                    durations[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return durations
+
+    def _select_landmarks(self, count):
+        # Sélection "farthest-first" : chaque landmark est le nœud le plus éloigné des précédents
+        landmarks = []
+        closest = [math.inf] * len(self.names)
+        candidate = 0
+        for _ in range(min(count, len(self.names))):
+            durations = self._dijkstra(candidate)
+            landmarks.append(durations)
+            closest = [min(c, d) for c, d in zip(closest, durations)]
+            candidate = max(range(len(closest)), key=lambda n: closest[n] if closest[n] < math.inf else -1)
+        return landmarks
+
+    def _heuristic(self, node, target):
+        (lat1, lon1), (lat2, lon2) = self.coords[node], self.coords[target]
+        bound = haversine_miles(lat1, lon1, lat2, lon2) / self.max_speed
+        for durations in self.landmarks:
+            bound = max(bound, abs(durations[target] - durations[node]))
+        return bound
+
+    def nearest_node(self, lat, lon):
+        return min(range(len(self.names)), key=lambda n: haversine_miles(lat, lon, *self.coords[n]))
+
+    def shortest_path(self, source, target):
+        """A* (ALT) sur le temps de trajet. Retourne la liste des sauts (nœud, route), ou None."""
+        best = {source: 0.0}
+        previous = {source: (None, None)}
+        heap = [(self._heuristic(source, target), 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u == target:
+                path = []
+                while u is not None:
+                    parent, highway = previous[u]
+                    path.append((u, highway))
+                    u = parent
+                return path[::-1]
+            if d > best.get(u, math.inf):
+                continue
+            for v, _, duration, highway in self.adjacency[u]:
+                nd = d + duration
+                if nd < best.get(v, math.inf):
+                    best[v] = nd
+                    previous[v] = (u, highway)
+                    heapq.heappush(heap, (nd + self._heuristic(v, target), nd, v))
+        return None
+
+    def route(self, start_coords, end_coords):
+        """Itinéraire entre deux points [lat, lon], ramenés aux nœuds les plus proches du graphe.
+
+        Returns:
+            tuple: (distance_miles, duration_hours, geometry, route_segments) au format de
+                   trips.routing.parse_route, ou None s'il n'existe aucun chemin.
+        """
+        source = self.nearest_node(*start_coords)
+        target = self.nearest_node(*end_coords)
+        path = self.shortest_path(source, target)
+        if path is None:
+            return None
+
+        # Liste des tronçons (points, nom de route, vitesse) y compris les raccordements aux nœuds
+        legs = []
+        if tuple(start_coords) != self.coords[source]:
+            legs.append((tuple(start_coords), self.coords[source], 'Raccordement', HIGHWAY_SPEED, self.names[source]))
+        for (u, _), (v, highway) in zip(path, path[1:]):
+            speed = INTERSTATE_SPEED if highway.startswith('I-') else HIGHWAY_SPEED
+            legs.append((self.coords[u], self.coords[v], highway, speed, self.names[v]))
+        if tuple(end_coords) != self.coords[target]:
+            legs.append((self.coords[target], tuple(end_coords), 'Raccordement', HIGHWAY_SPEED, 'destination'))
+
+        coords = [tuple(start_coords)]
+        distances = [0.0]
+        runs = []  # [highway, first point index, last point index, duration, destination name]
+        for start, end, highway, speed, towards in legs:
+            length = haversine_miles(*start, *end) * ROAD_DETOUR_FACTOR
+            points = max(1, math.ceil(length / GEOMETRY_SPACING))
+            first_index = len(coords) - 1
+            for k in range(1, points + 1):
+                coords.append((start[0] + (end[0] - start[0]) * k / points,
+                               start[1] + (end[1] - start[1]) * k / points))
+                distances.append(distances[-1] + length / points)
+            if runs and runs[-1][0] == highway:
+                runs[-1][2] = len(coords) - 1
+                runs[-1][3] += length / speed
+                runs[-1][4] = towards
+            else:
+                runs.append([highway, first_index, len(coords) - 1, length / speed, towards])
+
+        steps = []
+        for highway, first, last, duration, towards in runs:
+            run_distance = distances[last] - distances[first]
+            pieces = max(1, math.ceil(duration / MAX_STEP_HOURS))
+            for k in range(pieces):
+                # Découpage en étapes de moins d'une heure, alignées sur les points de la géométrie
+                a = bisect_left(distances, distances[first] + run_distance * k / pieces, first, last)
+                b = last if k == pieces - 1 else bisect_left(distances, distances[first] + run_distance * (k + 1) / pieces, first, last)
+                step_distance = distances[b] - distances[a]
+                if step_distance <= 0:
+                    continue
+                steps.append({
+                    'distance': step_distance,
+                    'duration': duration * step_distance / run_distance if run_distance else 0,
+                    'instruction': f"Continuer vers {towards}",
+                    'name': highway,
+                    'way_points': [a, b]
+                })
+
+        distance = distances[-1]
+        duration = sum(step['duration'] for step in steps)
+        segments = [{'distance': distance, 'duration': duration, 'steps': steps}]
+        return distance, duration, polyline.encode(coords), segments
+
+
+def get_road_graph():
+    global _graph
+    if _graph is None:
+        _graph = RoadGraph.from_file()
+    return _graph
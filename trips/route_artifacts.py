@@ -0,0 +1,188 @@
+"""Données dérivées des itinéraires, mises en cache par un hash du contenu de l'itinéraire.
+
+Planifier un trajet demande plus que son itinéraire enregistré : les points décodés des deux
+tronçons, la distance cumulée de chaque point (une géodésique par segment) et la liste à plat
+des étapes ORS, avec les points de l'itinéraire où chaque étape commence et finit et les miles
+déjà parcourus à son début. Tout cela ne dépend que de l'itinéraire (géométries, distances
+routières et segments), pas du trajet : tous les trajets d'un même itinéraire le partagent.
+
+`get_route_artifact(trip)` le retourne sous forme de RouteArtifact, cherché dans :
+
+    memory     LRU des ROUTE_ARTIFACTS['MEMORY_ENTRIES'] derniers artefacts du processus
+    cache      le cache 'route_artifacts' partagé par les workers, au format compact ci-dessous
+    computed   décodé et mesuré (les distances enregistrées d'un trajet sauvegardé sont reprises),
+               puis stocké dans les deux ; les calculs simultanés d'un même itinéraire sont
+               regroupés (voir single_flight.py)
+
+La clé est un hash BLAKE2 des géométries, distances routières et segments des deux tronçons.
+Format encodé (little-endian) :
+
+    en-tête     magic, nombre de points, points du premier tronçon, nombre d'étapes, taille des chaînes
+    chaînes     liste JSON des [instruction, nom] des étapes
+    coords      float64  lat, lon entrelacées
+    distances   float64  miles cumulés à chaque point
+    phases      uint8    0 vers le chargement, 1 vers la livraison
+    début, fin  uint32   indices des points de l'étape (way_points d'ORS, décalés pour le second tronçon)
+    distance    float64  miles, tels que planifiés par la boucle HOS
+    durée       float64  heures
+    offset      float64  miles parcourus au début de l'étape (somme des distances des étapes précédentes)
+
+L'artefact est partagé entre les requêtes d'un worker : ses tuples ne doivent pas être modifiés.
+"""
+import hashlib
+import json
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from itertools import accumulate
+
+import polyline
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import increment
+from .single_flight import get_single_flight
+
+MAGIC = b'RTA1'
+HEADER = struct.Struct('<4sIIII')
+PHASES = ('pickup', 'dropoff')
+ROUTE_ARTIFACTS_HELP = "Route artifact lookups, by tier (memory, cache, computed)."
+
+RouteArtifact = namedtuple('RouteArtifact', ['coords', 'distances', 'pickup_points', 'steps'])
+RouteStep = namedtuple('RouteStep', ['phase', 'start', 'end', 'distance', 'duration', 'instruction', 'name', 'offset'])
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def artifact_key(trip):
+    """Hash du contenu de l'itinéraire d'un trajet (géométries, distances routières et segments des deux tronçons)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (trip.route_geometry_to_pickup or '', trip.route_geometry_to_dropoff or '',
+                 repr(float(trip.distance_to_pickup or 0)), repr(float(trip.distance_to_dropoff or 0)),
+                 json.dumps([trip.route_segments_to_pickup or [], trip.route_segments_to_dropoff or []],
+                            sort_keys=True, separators=(',', ':'))):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return 'artifact:' + digest.hexdigest()
+
+
+def route_steps(segments_to_pickup, segments_to_dropoff, pickup_points):
+    """Liste à plat des RouteStep des deux tronçons."""
+    steps = []
+    for phase, segments, index_offset in ((0, segments_to_pickup, 0), (1, segments_to_dropoff, pickup_points)):
+        for segment in segments:
+            for step in segment['steps']:
+                start, end = step.get('way_points', [0, 0])
+                steps.append((phase, start + index_offset, end + index_offset, step['distance'], step['duration'],
+                              step['instruction'], step['name']))
+    offsets = accumulate((step[3] for step in steps), initial=0.0)
+    return tuple(RouteStep(*step, offset) for step, offset in zip(steps, offsets))
+
+
+def compute_artifact(trip):
+    from .planner import EldLogPlannerMixin, unpack_floats
+
+    coords_to_pickup = polyline.decode(trip.route_geometry_to_pickup) if trip.route_geometry_to_pickup else []
+    coords_to_dropoff = polyline.decode(trip.route_geometry_to_dropoff) if trip.route_geometry_to_dropoff else []
+    if trip.route_distances:
+        distances = unpack_floats(trip.route_distances)
+    else:
+        distances = EldLogPlannerMixin().calculate_route_distances(
+            coords_to_pickup, coords_to_dropoff, trip.distance_to_pickup, trip.distance_to_dropoff
+        )
+    steps = route_steps(trip.route_segments_to_pickup or [], trip.route_segments_to_dropoff or [],
+                        len(coords_to_pickup))
+    return RouteArtifact(tuple(coords_to_pickup + coords_to_dropoff), tuple(distances), len(coords_to_pickup), steps)
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def encode(artifact):
+    """Octets compacts d'un RouteArtifact."""
+    steps = artifact.steps
+    strings = json.dumps([[step.instruction, step.name] for step in steps], ensure_ascii=False,
+                         separators=(',', ':')).encode()
+    return b''.join([
+        HEADER.pack(MAGIC, len(artifact.coords), artifact.pickup_points, len(steps), len(strings)),
+        strings,
+        _column('d', [value for point in artifact.coords for value in point]),
+        _column('d', artifact.distances),
+        _column('B', [step.phase for step in steps]),
+        _column('I', [step.start for step in steps]),
+        _column('I', [step.end for step in steps]),
+        _column('d', [step.distance for step in steps]),
+        _column('d', [step.duration for step in steps]),
+        _column('d', [step.offset for step in steps]),
+    ])
+
+
+def decode(data):
+    magic, point_count, pickup_points, step_count, strings_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a route artifact")
+    offset = HEADER.size
+    strings = json.loads(data[offset:offset + strings_length])
+    offset += strings_length
+    columns = []
+    for typecode, count in (('d', 2 * point_count), ('d', point_count), ('B', step_count), ('I', step_count),
+                            ('I', step_count), ('d', step_count), ('d', step_count), ('d', step_count)):
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(data[offset:offset + size])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        columns.append(column.tolist())
+        offset += size
+    coords, distances, phase, start, end, distance, duration, offsets = columns
+    steps = tuple(RouteStep(*fields[:5], *strings[i], fields[5])
+                  for i, fields in enumerate(zip(phase, start, end, distance, duration, offsets)))
+    return RouteArtifact(tuple(zip(coords[0::2], coords[1::2])), tuple(distances), pickup_points, steps)
+
+
+def _remember(key, artifact):
+    with _memory_lock:
+        _memory[key] = artifact
+        _memory.move_to_end(key)
+        while len(_memory) > settings.ROUTE_ARTIFACTS['MEMORY_ENTRIES']:
+            _memory.popitem(last=False)
+
+
+def get_route_artifact(trip):
+    """RouteArtifact de l'itinéraire d'un trajet (sauvegardé ou non), depuis la mémoire, le cache partagé ou calculé."""
+    key = artifact_key(trip)
+    with _memory_lock:
+        artifact = _memory.get(key)
+        if artifact is not None:
+            _memory.move_to_end(key)
+    if artifact is not None:
+        increment('route_artifact_requests_total', {'tier': 'memory'}, help_text=ROUTE_ARTIFACTS_HELP)
+        return artifact
+
+    cache = caches['route_artifacts']
+    data = cache.get(key)
+    if data is not None:
+        increment('route_artifact_requests_total', {'tier': 'cache'}, help_text=ROUTE_ARTIFACTS_HELP)
+        artifact = decode(data)
+    else:
+        def compute():
+            increment('route_artifact_requests_total', {'tier': 'computed'}, help_text=ROUTE_ARTIFACTS_HELP)
+            computed = compute_artifact(trip)
+            cache.set(key, encode(computed))
+            return computed
+
+        def lookup():
+            stored = cache.get(key)
+            return decode(stored) if stored is not None else None
+
+        # Trajets simultanés sur une route encore inconnue : les distances ne sont mesurées qu'une fois
+        artifact = get_single_flight().run('route_artifact', key, compute, lookup)
+    _remember(key, artifact)
+    return artifact
@@ -0,0 +1,214 @@
+"""Index R*Tree des boîtes englobantes des tronçons de route, pour trouver les trajets qui traversent une zone.
+
+La route de chaque trajet est découpée en tronçons de quelques points consécutifs ; chaque
+tronçon est enregistré dans la table virtuelle R*Tree de SQLite créée par la migration 0005,
+avec sa boîte englobante et la plage de miles de route qu'il couvre. Les lignes ont pour clé
+trip_id * CHUNKS_PER_TRIP + tronçon : celles d'un trajet sont remplacées ou supprimées par
+une plage de clés primaires.
+
+Une requête lit les tronçons candidats dans le R*Tree, puis vérifie exactement leurs segments
+contre la zone : seules les routes des trajets candidats sont décodées.
+"""
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import chain
+
+import polyline
+from django.db import connection
+
+from .models import LogEntry, Trip
+from .packed_logs import unpack_logs
+from .planner import unpack_floats
+
+TABLE = 'trips_route_rtree'
+CHUNKS_PER_TRIP = 65536
+# Taille d'un tronçon indexé : quelques points, ou quelques dizaines de miles au plus
+CHUNK_POINTS = 16
+CHUNK_MILES = 25
+
+
+_available = None
+
+
+def is_available():
+    """True si la table R*Tree existe (SQLite uniquement) ; vérifié une fois par processus."""
+    global _available
+    if _available is None:
+        _available = connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+    return _available
+
+
+def route_points(trip):
+    """Route décodée d'un trajet (current -> pickup -> dropoff) et ses distances cumulatives, ou ([], [])."""
+    if trip.route_distances is None or not trip.route_geometry_to_dropoff:
+        return [], []
+    coords = polyline.decode(trip.route_geometry_to_pickup) if trip.route_geometry_to_pickup else []
+    coords += polyline.decode(trip.route_geometry_to_dropoff)
+    return coords, unpack_floats(trip.route_distances)
+
+
+def route_chunks(coords, distances):
+    """Découpe une route en plages d'index [(premier point, dernier point)] de segments consécutifs."""
+    chunks = []
+    first = 0
+    points_per_chunk = max(CHUNK_POINTS, math.ceil(len(coords) / CHUNKS_PER_TRIP))
+    for i in range(1, len(coords)):
+        if i - first >= points_per_chunk or distances[i] - distances[first] >= CHUNK_MILES or i == len(coords) - 1:
+            chunks.append((first, i))
+            first = i
+    return chunks
+
+
+def route_boxes(trip):
+    """[(min_lat, max_lat, min_lon, max_lon, start_distance, end_distance)] des tronçons de la route d'un trajet.
+
+    N'utilise que les données de route : calculable avant l'enregistrement du trajet (hors de
+    la transaction d'écriture).
+    """
+    coords, distances = route_points(trip)
+    boxes = []
+    for first, last in route_chunks(coords, distances):
+        lats = [lat for lat, _ in coords[first:last + 1]]
+        lons = [lon for _, lon in coords[first:last + 1]]
+        boxes.append((min(lats), max(lats), min(lons), max(lons), distances[first], distances[last]))
+    return boxes
+
+
+def index_trip(trip, boxes=None):
+    """(Ré)indexe la route d'un trajet, à partir de ses route_boxes si elles sont déjà calculées.
+
+    Sans effet sans données de route ou sur une autre base de données.
+    """
+    if not is_available():
+        return 0
+    if boxes is None:
+        boxes = route_boxes(trip)
+    rows = [(trip.id * CHUNKS_PER_TRIP + n, min_lat, max_lat, min_lon, max_lon, trip.id, start, end)
+            for n, (min_lat, max_lat, min_lon, max_lon, start, end) in enumerate(boxes)]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE id BETWEEN %s AND %s",
+                       [trip.id * CHUNKS_PER_TRIP, (trip.id + 1) * CHUNKS_PER_TRIP - 1])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (id, min_lat, max_lat, min_lon, max_lon, trip_id, start_distance, end_distance) "
+            f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", rows
+        )
+    return len(rows)
+
+
+def unindex_trips(trip_ids):
+    """Retire de l'index les routes des trajets."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE id BETWEEN %s AND %s",
+                           [(trip_id * CHUNKS_PER_TRIP, (trip_id + 1) * CHUNKS_PER_TRIP - 1) for trip_id in trip_ids])
+
+
+def candidate_chunks(min_lat, min_lon, max_lat, max_lon):
+    """{trip_id: [(start_distance, end_distance)]} des tronçons dont la boîte englobante recoupe la zone."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT trip_id, start_distance, end_distance FROM {TABLE} "
+            f"WHERE max_lat >= %s AND min_lat <= %s AND max_lon >= %s AND min_lon <= %s",
+            [min_lat, max_lat, min_lon, max_lon]
+        )
+        chunks = defaultdict(list)
+        for trip_id, start, end in cursor.fetchall():
+            chunks[trip_id].append((start, end))
+    return chunks
+
+
+def point_in_polygon(lat, lon, polygon):
+    inside = False
+    for (lat1, lon1), (lat2, lon2) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+            inside = not inside
+    return inside
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _within_box(a, b, p):
+    return min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[1] <= max(a[1], b[1])
+
+
+def segments_intersect(p1, p2, q1, q2):
+    d1, d2 = _cross(q1, q2, p1), _cross(q1, q2, p2)
+    d3, d4 = _cross(p1, p2, q1), _cross(p1, p2, q2)
+    if d1 * d2 < 0 and d3 * d4 < 0:
+        return True
+    # Cas colinéaires : une extrémité posée sur l'autre segment
+    return ((d1 == 0 and _within_box(q1, q2, p1)) or (d2 == 0 and _within_box(q1, q2, p2))
+            or (d3 == 0 and _within_box(p1, p2, q1)) or (d4 == 0 and _within_box(p1, p2, q2)))
+
+
+def segment_crosses_polygon(start, end, polygon):
+    if point_in_polygon(*start, polygon) or point_in_polygon(*end, polygon):
+        return True
+    return any(segments_intersect(start, end, a, b) for a, b in zip(polygon, polygon[1:] + polygon[:1]))
+
+
+def crossing_intervals(trip, chunks, polygon):
+    """[(from_distance, to_distance)] fusionnés de la route du trajet dans le polygone, parmi les tronçons."""
+    coords, distances = route_points(trip)
+    intervals = []
+    for start_distance, end_distance in sorted(chunks):
+        first = max(0, bisect_left(distances, start_distance - 1e-6))
+        for i in range(first, len(coords) - 1):
+            if distances[i] >= end_distance - 1e-6 and i > first:
+                break
+            if segment_crosses_polygon(coords[i], coords[i + 1], polygon):
+                if intervals and intervals[-1][1] >= distances[i] - 1e-6:
+                    intervals[-1][1] = max(intervals[-1][1], distances[i + 1])
+                else:
+                    intervals.append([distances[i], distances[i + 1]])
+    return [tuple(interval) for interval in intervals]
+
+
+def bbox_polygon(min_lat, min_lon, max_lat, max_lon):
+    return [(min_lat, min_lon), (min_lat, max_lon), (max_lat, max_lon), (max_lat, min_lon)]
+
+
+def trips_crossing(polygon):
+    """{trip_id: [(from_distance, to_distance)]} des trajets dont la route entre dans le polygone [(lat, lon)]."""
+    lats = [lat for lat, _ in polygon]
+    lons = [lon for _, lon in polygon]
+    chunks = candidate_chunks(min(lats), min(lons), max(lats), max(lons))
+    trips = Trip.objects.filter(id__in=list(chunks)).only(
+        'id', 'route_geometry_to_pickup', 'route_geometry_to_dropoff', 'route_distances'
+    )
+    crossing = {}
+    for trip in trips:
+        intervals = crossing_intervals(trip, chunks[trip.id], polygon)
+        if intervals:
+            crossing[trip.id] = intervals
+    return crossing
+
+
+def log_windows(crossing):
+    """{trip_id: [LogEntry]} des entrées de log passées sur les portions traversantes de chaque route.
+
+    Une entrée couvre les miles entre la fin de l'entrée précédente et sa propre fin : les
+    conduites qui recoupent un intervalle et les arrêts situés dedans sont retournés.
+    """
+    windows = defaultdict(list)
+    rows = LogEntry.objects.filter(trip_id__in=list(crossing), distance__isnull=False).order_by(
+        'trip_id', 'date', 'start_time'
+    )
+    # Trajets aux logs packés : décodés en PackedEntry, lus comme des LogEntry
+    packed = Trip.objects.filter(id__in=list(crossing), packed_logs__isnull=False).values_list('id', 'packed_logs')
+    entries = chain(rows, (entry for trip_id, data in packed for entry in unpack_logs(data, trip_id)
+                           if entry.distance is not None))
+    previous_trip, previous_distance = None, 0.0
+    for entry in entries:
+        if entry.trip_id != previous_trip:
+            previous_trip, previous_distance = entry.trip_id, 0.0
+        for start, end in crossing[entry.trip_id]:
+            if previous_distance <= end and entry.distance >= start:
+                windows[entry.trip_id].append(entry)
+                break
+        previous_distance = entry.distance
+    return windows
@@ -0,0 +1,239 @@
+"""Client OpenRouteService : cache partagé des itinéraires, disjoncteur et quota.
+
+Les itinéraires sont mis en cache par trajet (coordonnées arrondies) dans le cache 'routes',
+partagé entre workers. Un appel réel passe par le disjoncteur (trips/circuit_breaker.py) et
+le quota partagé (trips/rate_limiter.py) ; les appels simultanés du même trajet sont
+regroupés (trips/single_flight.py).
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+
+from .circuit_breaker import get_breaker
+from .metrics import increment, stage
+from .rate_limiter import BATCH, INTERACTIVE, get_rate_limiter
+from .single_flight import get_single_flight
+from .upstream_capture import capture_exchange
+
+logger = logging.getLogger(__name__)
+
+ORS_DIRECTIONS_PATH = "/v2/directions/driving-hgv"
+
+ROUTE_CACHE_HELP = "Route cache lookups, by result (hit, stale, miss)."
+ORS_REQUESTS_HELP = "OpenRouteService directions requests, by outcome."
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Levée au lieu d'appeler OpenRouteService tant que son disjoncteur est ouvert."""
+
+
+class RateLimitedError(requests.exceptions.RequestException):
+    """Levée quand aucun jeton du quota OpenRouteService n'a pu être obtenu à temps."""
+
+
+def route_cache_key(start_coords, end_coords):
+    return "route:{:.5f},{:.5f}:{:.5f},{:.5f}".format(*start_coords, *end_coords)
+
+
+def fetch_route(start_coords, end_coords, api_key, priority=INTERACTIVE):
+    """Retourne un itinéraire du cache partagé ou d'OpenRouteService, protégé par le disjoncteur.
+
+    Une entrée récente du cache est retournée telle quelle. Une entrée plus ancienne que
+    ROUTE_CACHE_TTL est servie immédiatement pendant qu'un thread la rafraîchit en arrière-plan
+    (stale-while-revalidate). En cas d'absence, l'appel n'a lieu que si le disjoncteur l'autorise
+    et qu'un jeton du quota est disponible pour la priorité donnée (voir trips/rate_limiter.py) ;
+    sinon CircuitOpenError ou RateLimitedError est levée pour que l'appelant se replie aussitôt.
+    Les absences simultanées du même trajet partagent un seul appel (voir trips/single_flight.py).
+
+    Returns:
+        tuple: (distance_miles, duration_hours, geometry, route_segments)
+    """
+    cache = caches['routes']
+    key = route_cache_key(start_coords, end_coords)
+    cached = cache.get(key)
+    if cached is not None:
+        stale = time.time() - cached['fetched_at'] > settings.ROUTE_CACHE_TTL
+        increment('route_cache_requests_total', {'result': 'stale' if stale else 'hit'}, help_text=ROUTE_CACHE_HELP)
+        if stale:
+            _refresh_in_background(key, start_coords, end_coords, api_key)
+        return tuple(cached['route'])
+
+    increment('route_cache_requests_total', {'result': 'miss'}, help_text=ROUTE_CACHE_HELP)
+
+    def request():
+        route = _guarded_request(start_coords, end_coords, api_key, priority)
+        cache.set(key, {'route': route, 'fetched_at': time.time()})
+        return route
+
+    def lookup():
+        cached = cache.get(key)
+        return tuple(cached['route']) if cached is not None else None
+
+    # Requêtes simultanées du même trajet (même worker ou non) : un seul appel à OpenRouteService
+    return get_single_flight().run('route', key, request, lookup)
+
+
+def _guarded_request(start_coords, end_coords, api_key, priority=INTERACTIVE):
+    breaker = get_breaker('openrouteservice')
+    if not breaker.allow_request():
+        increment('ors_requests_total', {'outcome': 'circuit_open'}, help_text=ORS_REQUESTS_HELP)
+        raise CircuitOpenError("OpenRouteService circuit breaker is open")
+    if not get_rate_limiter('openrouteservice').acquire(priority):
+        # Aucun appel n'est fait : une sonde accordée par le disjoncteur demi-ouvert est rendue
+        breaker.release_probe()
+        increment('ors_requests_total', {'outcome': 'rate_limited'}, help_text=ORS_REQUESTS_HELP)
+        raise RateLimitedError("OpenRouteService quota exhausted")
+
+    started = time.monotonic()
+    try:
+        with stage('ors'):
+            route = request_route(start_coords, end_coords, api_key)
+    except requests.exceptions.RequestException as e:
+        status_code = e.response.status_code if e.response is not None else None
+        if status_code is not None and status_code < 500:
+            # Le service a répondu : un 429 (quota, déjà pris en compte par le limiteur) ou une requête refusée
+            # n'est pas une panne et ne doit pas ouvrir le disjoncteur
+            breaker.record_success(time.monotonic() - started)
+            outcome = 'throttled' if status_code == 429 else 'client_error'
+        else:
+            # Connexion impossible, délai dépassé ou erreur 5xx
+            breaker.record_failure(time.monotonic() - started)
+            outcome = 'failure'
+        increment('ors_requests_total', {'outcome': outcome}, help_text=ORS_REQUESTS_HELP)
+        raise
+    breaker.record_success(time.monotonic() - started)
+    increment('ors_requests_total', {'outcome': 'success'}, help_text=ORS_REQUESTS_HELP)
+    return route
+
+
+def _refresh_in_background(key, start_coords, end_coords, api_key):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            # Un rafraîchissement n'est jamais urgent : il passe après les créations de trajets
+            route = _guarded_request(start_coords, end_coords, api_key, BATCH)
+            caches['routes'].set(key, {'route': route, 'fetched_at': time.time()})
+        except requests.exceptions.RequestException as e:
+            logger.warning("Background refresh of %s failed: %s", key, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, name=f"route-refresh {key}", daemon=True).start()
+
+
+def request_route(start_coords, end_coords, api_key):
+    """Appelle le profil 'driving-hgv' d'OpenRouteService entre deux points (sans cache).
+
+    Args:
+        start_coords (list): [lat, lon] de l'origine
+        end_coords (list): [lat, lon] de la destination
+        api_key (str): Clé d'API OpenRouteService
+
+    Returns:
+        tuple: (distance_miles, duration_hours, geometry, route_segments) où geometry est la
+               polyline encodée et route_segments les segments et étapes extraits.
+
+    Raises:
+        requests.exceptions.RequestException: en cas d'erreur HTTP ou réseau.
+    """
+    return parse_route(request_directions(start_coords, end_coords, api_key))
+
+
+def request_directions(start_coords, end_coords, api_key):
+    """Même appel que request_route, qui retourne le JSON brut d'ORS (tel qu'enregistré par les benchmarks)."""
+    # OpenRouteService attend les coordonnées au format [lon, lat]
+    start = [start_coords[1], start_coords[0]]
+    end = [end_coords[1], end_coords[0]]
+
+    headers = {
+        'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
+        'Authorization': api_key,
+        'Content-Type': 'application/json; charset=utf-8'
+    }
+
+    # Paramètres spécifiques pour les camions
+    body = {
+        "coordinates": [start, end],
+        "profile": "driving-hgv",  # Profil spécifique pour les camions
+        "preference": "recommended",  # Itinéraire recommandé
+        "units": "mi",  # Unités en miles
+        "language": "fr-fr",
+        # Paramètres optionnels pour les camions
+        "options": {
+            "vehicle_type": "hgv",  # Type de véhicule: poids lourd
+            "profile_params": {
+                "restrictions": {
+                    "height": 4.0,  # Hauteur en mètres
+                    "width": 2.55,  # Largeur en mètres
+                    "length": 16.5,  # Longueur en mètres
+                    "weight": 40.0,  # Poids en tonnes
+                    "axleload": 11.5  # Charge par essieu en tonnes
+                }
+            }
+        }
+    }
+
+    logger.debug("ORS directions request %s -> %s", start, end)
+    url = settings.ORS_BASE_URL.rstrip('/') + ORS_DIRECTIONS_PATH
+    response = requests.post(url, json=body, headers=headers, timeout=settings.ROUTING_TIMEOUT)
+    logger.info("ORS directions %s -> %s: %s %s in %.0f ms (%d bytes)", start, end, response.status_code,
+                response.reason, response.elapsed.total_seconds() * 1000, len(response.content))
+    # Requête et réponse complètes uniquement sur demande (voir trips/upstream_capture.py)
+    capture_exchange('openrouteservice', response, body)
+    _observe_quota(response)
+    response.raise_for_status()  # Lève une exception en cas d'erreur HTTP
+
+    return response.json()
+
+
+def _observe_quota(response):
+    """Transmet au limiteur partagé les informations de quota renvoyées par OpenRouteService."""
+    limiter = get_rate_limiter('openrouteservice')
+    if response.status_code == 429:
+        retry_after = response.headers.get('Retry-After', '')
+        limiter.penalize(float(retry_after) if retry_after.isdigit() else 60)
+    remaining = response.headers.get('x-ratelimit-remaining')
+    if remaining is not None and remaining.isdigit():
+        limiter.sync_day_remaining(int(remaining))
+
+
+def parse_route(data):
+    """Extrait distance, durée, géométrie et étapes d'une réponse directions d'ORS."""
+    route = data['routes'][0]
+
+    # Distance déjà en miles vu que précisé dans le corps de la requête
+    distance_miles = route['summary']['distance']
+    duration_hours = route['summary']['duration'] / 3600
+    geometry = route['geometry']  # Polyline encodé
+
+    route_segments = []
+    for segment in route.get('segments', []):
+        steps = []
+        for step in segment.get('steps', []):
+            steps.append({
+                'distance': step['distance'],  # en miles
+                'duration': step['duration'] / 3600,  # conversion en heures
+                'instruction': step['instruction'],
+                'name': step['name'],
+                'way_points': step.get('way_points', [])
+            })
+
+        route_segments.append({
+            'distance': segment['distance'],  # en miles
+            'duration': segment['duration'] / 3600,  # conversion en heures
+            'steps': steps
+        })
+
+    return distance_miles, duration_hours, geometry, route_segments
@@ -1,14 +1,16 @@
 from rest_framework import serializers
+from .metrics import stage
 from .models import Trip, LogEntry
+from .packed_logs import log_representation, unpack_logs
 from datetime import datetime, timedelta
 
 class LogEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = LogEntry
-        fields = ['date', 'duty_status', 'start_time', 'end_time', 'location', 'latitude', 'longitude']
+        fields = ['date', 'duty_status', 'start_time', 'end_time', 'location', 'place', 'distance', 'latitude', 'longitude']
 
 class TripSerializer(serializers.ModelSerializer):
-    logs = LogEntrySerializer(many=True, read_only=True)
+    logs = serializers.SerializerMethodField()
     summary = serializers.SerializerMethodField()
 
     class Meta:
@@ -19,64 +21,85 @@ class TripSerializer(serializers.ModelSerializer):
             'logs', 'summary', 'route_geometry_to_pickup', 'route_geometry_to_dropoff'
         ]
 
+    def to_representation(self, instance):
+        with stage('serialize'):
+            return super().to_representation(instance)
+
+    def get_logs(self, obj):
+        if obj.packed_logs is not None:
+            # Logs packés : décodés directement dans la forme de la réponse, sans instancier de LogEntry
+            return log_representation(unpack_logs(obj.packed_logs, obj.id))
+        return LogEntrySerializer(obj.logs.all(), many=True).data
+
     def get_summary(self, obj):
+        if obj.packed_logs is not None:
+            logs = unpack_logs(obj.packed_logs, obj.id)
+        else:
+            logs = obj.logs.all().order_by('date', 'start_time')
+        return summarize_logs(logs, obj.start_time.tzinfo)
 
-        logs = obj.logs.all().order_by('date', 'start_time')
-        if not logs:
-            return []
 
+def summarize_logs(logs, tzinfo):
+    """Fusionne les entrées de log consécutives de même statut en une chronologie.
 
-        timeline = []
-        current_period = None
+    Fonctionne sur des querysets de LogEntry enregistrées comme sur des entrées non enregistrées
+    (triées par date, start_time).
+    """
+    if not logs:
+        return []
 
-        for log in logs:
-    
-            start_datetime = datetime.combine(log.date, log.start_time, tzinfo=obj.start_time.tzinfo)
-            end_datetime = datetime.combine(log.date, log.end_time, tzinfo=obj.start_time.tzinfo)
-            if end_datetime < start_datetime:
-                end_datetime += timedelta(days=1)
 
-    
-            try:
-                distance_str = log.location.split('(')[-1].replace(' miles)', '')
-                distance = float(distance_str)
-            except (IndexError, ValueError):
-                distance = 0.0
+    timeline = []
+    current_period = None
 
-    
-            if not current_period or current_period['duty_status'] != log.duty_status or current_period['end'] != start_datetime:
-                if current_period:
-            
-                    start_str = current_period['start'].strftime('%Hh%M').replace('h00', 'h')
-                    end_str = current_period['end'].strftime('%Hh%M').replace('h00', 'h')
-                    timeline.append({
-                        "duty_status": current_period['duty_status'],
-                        "start_time": start_str,
-                        "end_time": end_str,
-                        "distance": current_period['distance']
-                    })
+    for log in logs:
 
+        start_datetime = datetime.combine(log.date, log.start_time, tzinfo=tzinfo)
+        end_datetime = datetime.combine(log.date, log.end_time, tzinfo=tzinfo)
+        if end_datetime < start_datetime:
+            end_datetime += timedelta(days=1)
+
+
+        try:
+            distance_str = log.location.split('(')[-1].replace(' miles)', '')
+            distance = float(distance_str)
+        except (IndexError, ValueError):
+            distance = 0.0
+
+
+        if not current_period or current_period['duty_status'] != log.duty_status or current_period['end'] != start_datetime:
+            if current_period:
         
-                current_period = {
-                    'duty_status': log.duty_status,
-                    'start': start_datetime,
-                    'end': end_datetime,
-                    'distance': distance
-                }
-            else:
-        
-                current_period['end'] = end_datetime
-                current_period['distance'] = distance
+                start_str = current_period['start'].strftime('%Hh%M').replace('h00', 'h')
+                end_str = current_period['end'].strftime('%Hh%M').replace('h00', 'h')
+                timeline.append({
+                    "duty_status": current_period['duty_status'],
+                    "start_time": start_str,
+                    "end_time": end_str,
+                    "distance": current_period['distance']
+                })
+
+    
+            current_period = {
+                'duty_status': log.duty_status,
+                'start': start_datetime,
+                'end': end_datetime,
+                'distance': distance
+            }
+        else:
+    
+            current_period['end'] = end_datetime
+            current_period['distance'] = distance
 
 
-        if current_period:
-            start_str = current_period['start'].strftime('%Hh%M').replace('h00', 'h')
-            end_str = current_period['end'].strftime('%Hh%M').replace('h00', 'h')
-            timeline.append({
-                "duty_status": current_period['duty_status'],
-                "start_time": start_str,
-                "end_time": end_str,
-                "distance": current_period['distance']
-            })
+    if current_period:
+        start_str = current_period['start'].strftime('%Hh%M').replace('h00', 'h')
+        end_str = current_period['end'].strftime('%Hh%M').replace('h00', 'h')
+        timeline.append({
+            "duty_status": current_period['duty_status'],
+            "start_time": start_str,
+            "end_time": end_str,
+            "distance": current_period['distance']
+        })
 
-        return timeline
\ No newline at end of file
+    return timeline
\ No newline at end of file
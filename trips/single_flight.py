@@ -0,0 +1,183 @@
+"""Regroupement (single flight) des calculs identiques, dans un worker et entre les workers.
+
+Quand plusieurs requêtes ont besoin du même résultat au même moment (un répartiteur qui
+soumet de nombreux trajets sur un même itinéraire, un client qui réessaie), seule la première
+le calcule :
+
+processus    les appelants d'une même clé attendent le meneur de leur processus (threading.Event)
+             et partagent son résultat.
+inter-       le meneur prend d'abord un bail sur la clé dans une petite table de verrous SQLite
+processus    partagée par tous les workers. Si un autre processus le détient, le meneur attend
+             la libération du bail, puis lit le résultat que ce processus a stocké (`lookup`,
+             en général un cache partagé) au lieu de le recalculer.
+
+Les attentes sont bornées par WAIT_SECONDS : au-delà, ou si le meneur a échoué, l'appelant
+calcule lui-même le résultat. Les baux expirent après LEASE_SECONDS : un worker tué en plein
+calcul ne bloque jamais la clé longtemps. Un bail appartient à un processus : l'identifiant du
+détenteur inclut le pid et est renouvelé dans un worker forké, qui hérite de l'instance créée au
+démarrage (warmup.py). Sans `lookup`, il n'y a pas de résultat partagé à lire et seul le
+regroupement dans le processus s'applique.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from django.conf import settings
+
+from .metrics import increment
+
+SINGLE_FLIGHT_HELP = "Single-flight calls, by kind and result (leader, shared, shared_process, timeout, failed)."
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flight_lease (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    def __init__(self, path, wait_seconds=15, lease_seconds=30, poll_seconds=0.05):
+        self.path = str(path)
+        self.wait_seconds = wait_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._pid = None
+        self._owner = None
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def owner(self):
+        # Identifiant propre au processus : un worker forké hérite de l'instance du processus parent
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid, self._owner = pid, f"{pid}-{uuid.uuid4().hex}"
+        return self._owner
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def acquire(self, key):
+        """Prend le bail de key ; retourne False si un autre processus détient un bail non expiré."""
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT owner, expires_at FROM flight_lease WHERE key = ?', (key,)).fetchone()
+                acquired = row is None or row[1] <= now or row[0] == self.owner
+                if acquired:
+                    connection.execute('INSERT OR REPLACE INTO flight_lease (key, owner, expires_at) VALUES (?, ?, ?)',
+                                       (key, self.owner, now + self.lease_seconds))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return acquired
+
+    def release(self, key):
+        with closing(self._connect()) as connection:
+            connection.execute('DELETE FROM flight_lease WHERE key = ? AND owner = ?', (key, self.owner))
+
+    def is_held(self, key):
+        with closing(self._connect()) as connection:
+            row = connection.execute('SELECT expires_at FROM flight_lease WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def run(self, kind, key, compute, lookup=None):
+        """Retourne compute(), calculé une seule fois pour les appelants simultanés d'une même clé.
+
+        Args:
+            kind (str): Type de calcul, pour les métriques ('route', 'route_artifact', 'plan').
+            key (str): Identité du résultat ; les appelants d'une même clé le partagent.
+            compute (callable): Calcule le résultat. Avec lookup, il doit aussi stocker le résultat
+                là où lookup le lit avant de retourner (le bail est libéré après lui).
+            lookup (callable): Lit un résultat stocké par un autre processus, ou retourne None.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            # Un autre thread du worker calcule déjà ce résultat
+            if flight.done.wait(self.wait_seconds) and not flight.failed:
+                self._count(kind, 'shared')
+                return flight.result
+            self._count(kind, 'timeout' if not flight.done.is_set() else 'failed')
+            return compute()
+
+        try:
+            flight.result = self._lead(kind, key, compute, lookup)
+            return flight.result
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _lead(self, kind, key, compute, lookup):
+        if lookup is None:
+            self._count(kind, 'leader')
+            return compute()
+
+        deadline = time.monotonic() + self.wait_seconds
+        while not self.acquire(key):
+            # Un autre worker calcule ce résultat : attente de la fin de son bail, puis lecture du résultat partagé
+            if time.monotonic() >= deadline:
+                self._count(kind, 'timeout')
+                return compute()
+            time.sleep(self.poll_seconds)
+            if not self.is_held(key):
+                result = lookup()
+                if result is not None:
+                    self._count(kind, 'shared_process')
+                    return result
+
+        try:
+            # Le détenteur précédent du bail a pu terminer entre la lecture du cache par l'appelant et l'acquisition
+            result = lookup()
+            if result is not None:
+                self._count(kind, 'shared_process')
+                return result
+            self._count(kind, 'leader')
+            return compute()
+        finally:
+            self.release(key)
+
+    def _count(self, kind, result):
+        increment('single_flight_total', {'kind': kind, 'result': result}, help_text=SINGLE_FLIGHT_HELP)
+
+
+_single_flight = None
+
+
+def get_single_flight():
+    global _single_flight
+    if _single_flight is None:
+        options = dict(getattr(settings, 'SINGLE_FLIGHT', {}))
+        path = options.pop('PATH', os.path.join(settings.VAR_DIR, 'single_flight.sqlite3'))
+        _single_flight = SingleFlight(path, **{key.lower(): value for key, value in options.items()})
+    return _single_flight
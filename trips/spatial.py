@@ -0,0 +1,110 @@
+"""Index spatiaux en mémoire sur des points (lat, lon)."""
+import math
+from collections import defaultdict
+
+from .geo import EARTH_RADIUS_MILES, MILES_PER_DEGREE, haversine_miles
+
+
+class GridIndex:
+    """Répartit des points dans une grille lat/lon régulière.
+
+    Une recherche par rayon ne parcourt que les quelques cellules qui recouvrent la zone :
+    son coût dépend de la densité locale des points, pas de la taille du jeu de données.
+    """
+
+    def __init__(self, points, cell_degrees=0.5):
+        """
+        Args:
+            points (list): [(lat, lon)] indexés par position
+            cell_degrees (float): Côté d'une cellule de la grille, en degrés
+        """
+        self.points = list(points)
+        self.cell_degrees = cell_degrees
+        self.cells = defaultdict(list)
+        for i, (lat, lon) in enumerate(self.points):
+            self.cells[self._cell(lat, lon)].append(i)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Index des points des cellules qui recouvrent une zone rectangulaire."""
+        (row_a, col_a), (row_b, col_b) = self._cell(min_lat, min_lon), self._cell(max_lat, max_lon)
+        for row in range(row_a, row_b + 1):
+            for col in range(col_a, col_b + 1):
+                yield from self.cells.get((row, col), ())
+
+    def within(self, lat, lon, radius_miles):
+        """Retourne [(distance_miles, index)] des points à moins de radius_miles, les plus proches d'abord."""
+        dlat = radius_miles / MILES_PER_DEGREE
+        dlon = radius_miles / (MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        found = []
+        for i in self.candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            distance = haversine_miles(lat, lon, *self.points[i])
+            if distance <= radius_miles:
+                found.append((distance, i))
+        found.sort()
+        return found
+
+
+def unit_vector(lat, lon):
+    phi, lam = math.radians(lat), math.radians(lon)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+class KDTree:
+    """Arbre 3-d statique sur des points projetés sur la sphère unité.
+
+    Travailler sur des vecteurs unitaires plutôt que sur les lat/lon brutes garde la recherche
+    du plus proche voisin exacte de part et d'autre de l'antiméridien et à toute latitude (la
+    corde croît avec la distance orthodromique). Une requête visite O(log n) nœuds en moyenne.
+    """
+
+    def __init__(self, points):
+        """
+        Args:
+            points (list): [(lat, lon)] indexés par position
+        """
+        self.points = list(points)
+        self.vectors = [unit_vector(lat, lon) for lat, lon in self.points]
+        self.node_point, self.node_axis, self.node_left, self.node_right = [], [], [], []
+        self.root = self._build(list(range(len(self.points))), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return -1
+        axis = depth % 3
+        items.sort(key=lambda i: self.vectors[i][axis])
+        middle = len(items) // 2
+        node = len(self.node_point)
+        self.node_point.append(items[middle])
+        self.node_axis.append(axis)
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_left[node] = self._build(items[:middle], depth + 1)
+        self.node_right[node] = self._build(items[middle + 1:], depth + 1)
+        return node
+
+    def nearest(self, lat, lon):
+        """Retourne (index, distance_miles) du point le plus proche, ou (None, None) si l'arbre est vide."""
+        query = unit_vector(lat, lon)
+        best, best_d2 = None, math.inf
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node < 0 or bound >= best_d2:
+                continue
+            point = self.node_point[node]
+            vector = self.vectors[point]
+            d2 = (query[0] - vector[0]) ** 2 + (query[1] - vector[1]) ** 2 + (query[2] - vector[2]) ** 2
+            if d2 < best_d2:
+                best, best_d2 = point, d2
+            diff = query[self.node_axis[node]] - vector[self.node_axis[node]]
+            near, far = ((self.node_left[node], self.node_right[node]) if diff < 0
+                         else (self.node_right[node], self.node_left[node]))
+            # Le sous-arbre éloigné n'est visité que si le plan de coupe est plus proche que le meilleur point
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        if best is None:
+            return None, None
+        return best, 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(best_d2) / 2))
@@ -0,0 +1,71 @@
+"""Outils de logging configurés depuis settings.LOGGING : échantillonnage par module et sortie JSON.
+
+Les messages utilisent le formatage %-paresseux du module logging (logger.debug("... %s", valeur)) :
+sous le niveau configuré, l'appel retourne avant de construire la moindre chaîne, et un
+SamplingFilter allège encore les enregistrements DEBUG/INFO des modules bavards.
+"""
+import json
+import logging
+import random
+from datetime import datetime, timezone
+
+
+def parse_sampling(value):
+    """Convertit "trips.planner=0.01,trips.routing=0.5" en {'trips.planner': 0.01, 'trips.routing': 0.5}."""
+    rates = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, rate = item.split('=', 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Garde une fraction des enregistrements DEBUG et INFO de chaque logger ; les avertissements
+    et les erreurs passent toujours.
+
+    Le taux d'un enregistrement est celui du plus long préfixe de logger configuré
+    ('trips.planner' avant 'trips'), 1.0 si aucun ne correspond.
+    """
+
+    def __init__(self, rates=None):
+        """
+        Args:
+            rates (dict | str): {nom du logger: fraction gardée}, ou la même chose sous la forme "nom=taux,nom=taux"
+        """
+        super().__init__()
+        if isinstance(rates, str):
+            rates = parse_sampling(rates)
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self._rate_by_logger = {}
+
+    def rate(self, name):
+        rate = self._rate_by_logger.get(name)
+        if rate is None:
+            rate = next((rate for prefix, rate in self.rates if name == prefix or name.startswith(prefix + '.')), 1.0)
+            self._rate_by_logger[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par enregistrement, avec les champs `extra` de l'appel de logging comme clés."""
+
+    RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in self.RECORD_ATTRIBUTES)
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
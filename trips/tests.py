@@ -1,3 +1,1090 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import NotSupportedError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import circuit_breaker, lane_matrix, metrics, plan_memo, rate_limiter, route_artifacts, routing, single_flight
+from .archive import completed_trips
+from .circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from .departures import best_departures, cycle_hours_at, plan_timeline
+from .gazetteer import AmbiguousPlace, get_gazetteer
+from .geo import haversine_miles
+from .idempotency import request_fingerprint
+from .lane_matrix import LaneMatrix, load_lane_matrix, write_lane_matrix
+from .models import ArchivedTrip, IdempotencyKey, LogEntry, Trip
+from .planner import EldLogPlannerMixin
+from .proximity import entries_near
+from .road_graph import get_road_graph
+from .route_index import TABLE as ROUTE_INDEX_TABLE, bbox_polygon, trips_crossing
+from .rate_limiter import BATCH, INTERACTIVE, TokenBucket
+from .single_flight import SingleFlight
+from .spatial import KDTree
+from .structured_logging import SamplingFilter
+from .truck_stops import REST_AREA, TRUCK_STOP, TruckStops
+from .upstream_capture import _captures, capture_exchange
+from .warmup import STEPS as WARMUP_STEPS, warm_up
+
+
+class TempDirMixin:
+    """Fichiers SQLite partagés (disjoncteur, quota...) dans un répertoire temporaire par test."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.tmp = directory.name
+
+    def tmp_path(self, name):
+        return os.path.join(self.tmp, name)
+
+
+TRIP = {
+    'current_location': "New York, NY",
+    'pickup_location': "Chicago, IL",
+    'dropoff_location': "Los Angeles, CA",
+    'current_cycle_hours': 10,
+    'start_time': "2025-03-22T06:00:00Z",
+}
+
+
+def var_settings(directory):
+    """Réglages qui écrivent sous VAR_DIR (caches, fichiers SQLite partagés), redirigés vers directory."""
+    caches = {name: {**options, 'LOCATION': os.path.join(directory, name)} if 'LOCATION' in options else options
+              for name, options in settings.CACHES.items()}
+    return {
+        'VAR_DIR': directory,
+        'CACHES': caches,
+        'LANE_MATRIX_PATH': os.path.join(directory, 'lane_matrix.bin'),
+        'CIRCUIT_BREAKER': {**settings.CIRCUIT_BREAKER, 'PATH': os.path.join(directory, 'circuit_breaker.sqlite3')},
+        'ROUTING_RATE_LIMIT': {**settings.ROUTING_RATE_LIMIT, 'PATH': os.path.join(directory, 'routing_quota.sqlite3')},
+        'SINGLE_FLIGHT': {**settings.SINGLE_FLIGHT, 'PATH': os.path.join(directory, 'single_flight.sqlite3')},
+        'METRICS': {**settings.METRICS, 'PATH': os.path.join(directory, 'metrics.sqlite3')},
+    }
+
+
+class TripApiMixin:
+    """Trajets créés par l'API, routés hors ligne (graphe routier embarqué, sans clé OpenRouteService).
+
+    Les caches et fichiers partagés sont dans un répertoire temporaire par classe ; les caches et les
+    instances des modules (disjoncteurs, quotas, single flight, artefacts de route, mémo des plans)
+    sont remis à zéro à chaque test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(**var_settings(directory))
+        override.enable()
+        cls.addClassCleanup(override.disable)
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (mock.patch.dict(os.environ),
+                        mock.patch.dict(circuit_breaker._breakers, clear=True),
+                        mock.patch.dict(rate_limiter._buckets, clear=True),
+                        mock.patch.object(single_flight, '_single_flight', None),
+                        mock.patch.object(lane_matrix, '_matrix', None),
+                        mock.patch.dict(route_artifacts._memory, clear=True),
+                        mock.patch.dict(plan_memo._memo, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for cache in caches.all():
+            cache.clear()
+        os.environ.pop('MAP_API_KEY', None)
+        self.client = APIClient()
+
+    def create_trip(self, **fields):
+        response = self.client.post('/api/trips/create/', {**TRIP, **fields}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+
+def log_end(logs):
+    """Fin de la dernière entrée d'une liste de logs sérialisés."""
+    last = logs[-1]
+    return datetime.fromisoformat(f"{last['date']}T{last['end_time']}")
+
+
+def ors_response(status_code, headers=None):
+    """requests.Response d'OpenRouteService, sans appel réseau."""
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'Test'
+    response.url = 'https://ors.test/v2/directions/driving-hgv'
+    response.headers.update(headers or {})
+    response._content = b'{}'
+    response.elapsed = timedelta(milliseconds=5)
+    return response
+
+
+class CircuitBreakerTests(TempDirMixin, SimpleTestCase):
+    def breaker(self, **options):
+        return CircuitBreaker('test', self.tmp_path('breaker.sqlite3'), **{'min_calls': 2, **options})
+
+    def test_opens_on_failure_rate(self):
+        breaker = self.breaker()
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = self.breaker(slow_call_seconds=1)
+        breaker.record_success(2)
+        breaker.record_success(2)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_probe(self):
+        breaker = self.breaker(open_seconds=0)
+        breaker.record_failure(0.1)
+        breaker.record_failure(0.1)
+        # Une seule sonde à la fois, tous workers confondus
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker(open_seconds=0).allow_request())
+        breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, OPEN)
+
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+class TokenBucketTests(TempDirMixin, SimpleTestCase):
+    def bucket(self, **options):
+        return TokenBucket('test', self.tmp_path('quota.sqlite3'), **{'per_minute': 4, 'per_day': 100, **options})
+
+    def test_per_minute_limit(self):
+        bucket = self.bucket()
+        for _ in range(4):
+            self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+        self.assertEqual(bucket.remaining()['day_remaining'], 96)
+
+    def test_batch_keeps_a_reserve_for_interactive_calls(self):
+        bucket = self.bucket(batch_reserve=0.5)
+        self.assertTrue(bucket.acquire(BATCH, timeout=0))
+        self.assertTrue(bucket.acquire(BATCH, timeout=0))
+        self.assertFalse(bucket.acquire(BATCH, timeout=0))
+        self.assertTrue(bucket.acquire(INTERACTIVE, timeout=0))
+
+    def test_penalize_blocks_every_worker(self):
+        bucket = self.bucket()
+        bucket.penalize(60)
+        self.assertFalse(self.bucket().acquire(timeout=0))
+        self.assertGreater(bucket.remaining()['blocked_for_seconds'], 59)
+
+    def test_sync_day_remaining(self):
+        bucket = self.bucket()
+        bucket.sync_day_remaining(1)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+
+    def test_day_resets_at_midnight_utc(self):
+        # Fuseau local du serveur différent d'UTC : le jour du quota ne doit pas en dépendre
+        patcher = mock.patch.dict(os.environ, {'TZ': 'America/Chicago'})
+        patcher.start()
+        self.addCleanup(time.tzset)
+        self.addCleanup(patcher.stop)
+        time.tzset()
+        bucket = self.bucket()
+        before_midnight = 1742687940.0  # 2025-03-22 23:59 UTC
+        with mock.patch('trips.rate_limiter.time.time', return_value=before_midnight):
+            bucket.sync_day_remaining(0)
+            self.assertFalse(bucket.acquire(timeout=0))
+        with mock.patch('trips.rate_limiter.time.time', return_value=before_midnight + 120):
+            self.assertEqual(bucket.remaining()['day_remaining'], 100)
+            self.assertTrue(bucket.acquire(timeout=0))
+
+    def test_failed_update_is_rolled_back(self):
+        bucket = self.bucket()
+        self.assertTrue(bucket.acquire(timeout=0))
+        with mock.patch.object(TokenBucket, '_save', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                bucket.penalize(60)
+            with self.assertRaises(RuntimeError):
+                bucket.sync_day_remaining(0)
+        # Aucune transaction laissée ouverte : le seau reste utilisable et inchangé
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertEqual(bucket.remaining()['day_remaining'], 98)
+
+
+class GuardedRequestTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.breaker = CircuitBreaker('openrouteservice', self.tmp_path('breaker.sqlite3'), min_calls=2)
+        self.limiter = TokenBucket('openrouteservice', self.tmp_path('quota.sqlite3'), per_minute=6000)
+        for name, value in (('get_breaker', self.breaker), ('get_rate_limiter', self.limiter)):
+            patcher = mock.patch.object(routing, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, response):
+        with mock.patch.object(routing.requests, 'post', return_value=response), self.assertLogs('trips.routing'):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                routing._guarded_request([40.7, -74.0], [41.9, -87.6], 'key')
+
+    def test_quota_429_does_not_open_the_breaker(self):
+        for _ in range(3):
+            self.request(ors_response(429, {'Retry-After': '0'}))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_client_errors_do_not_open_the_breaker(self):
+        for _ in range(3):
+            self.request(ors_response(400))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_server_errors_open_the_breaker(self):
+        self.request(ors_response(503))
+        self.request(ors_response(502))
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(routing.CircuitOpenError):
+            routing._guarded_request([40.7, -74.0], [41.9, -87.6], 'key')
+
+    def test_connection_errors_open_the_breaker(self):
+        with mock.patch.object(routing.requests, 'post', side_effect=requests.exceptions.ConnectionError):
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    routing._guarded_request([40.7, -74.0], [41.9, -87.6], 'key')
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_rate_limited_probe_is_released(self):
+        self.breaker.open_seconds = 0
+        self.breaker.record_failure(0.1)
+        self.breaker.record_failure(0.1)
+        with mock.patch.object(self.limiter, 'acquire', return_value=False):
+            with self.assertRaises(routing.RateLimitedError):
+                routing._guarded_request([40.7, -74.0], [41.9, -87.6], 'key')
+        # La sonde n'a pas eu lieu : un autre worker peut sonder sans attendre son expiration
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(CircuitBreaker('openrouteservice', self.breaker.path, open_seconds=0).allow_request())
+
+
+class SingleFlightTests(TempDirMixin, SimpleTestCase):
+    """Deux instances sur la même table de baux : deux workers."""
+
+    def flight(self):
+        return SingleFlight(self.tmp_path('single_flight.sqlite3'), wait_seconds=5, poll_seconds=0.01)
+
+    def test_one_owner_per_key(self):
+        first, second = self.flight(), self.flight()
+        self.assertTrue(first.acquire('lane'))
+        self.assertFalse(second.acquire('lane'))
+        self.assertTrue(second.is_held('lane'))
+        second.release('lane')  # Sans effet : le bail ne lui appartient pas
+        self.assertFalse(second.acquire('lane'))
+        first.release('lane')
+        self.assertTrue(second.acquire('lane'))
+        self.assertFalse(first.acquire('lane'))
+
+    def test_forked_worker_gets_its_own_owner(self):
+        parent = self.flight()
+        self.assertTrue(parent.acquire('lane'))
+        owner = parent.owner
+        with mock.patch('trips.single_flight.os.getpid', return_value=os.getpid() + 1):
+            self.assertNotEqual(parent.owner, owner)
+            self.assertFalse(parent.acquire('lane'))
+
+    def test_waiting_worker_reads_the_shared_result(self):
+        first, second = self.flight(), self.flight()
+        shared = {}
+        self.assertTrue(first.acquire('lane'))
+
+        def finish():
+            shared['lane'] = 'route'
+            first.release('lane')
+
+        timer = threading.Timer(0.1, finish)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        compute = mock.Mock(return_value='computed')
+        self.assertEqual(second.run('route', 'lane', compute, lookup=lambda: shared.get('lane')), 'route')
+        compute.assert_not_called()
+
+
+class TripPlanningTests(TripApiMixin, TestCase):
+    def test_trip_shorter_than_one_driving_chunk(self):
+        # Les étapes de la route s'épuisent au milieu d'une itération de conduite
+        trip = self.create_trip(current_location="Fort Worth, TX", pickup_location="Arlington, TX",
+                                dropoff_location="Dallas, TX")
+        driving = [entry for entry in trip['logs'] if entry['duty_status'] == 'DRIVING']
+        self.assertTrue(driving)
+        self.assertAlmostEqual(float(trip['logs'][-1]['distance']), trip['distance'], delta=1)
+
+
+class PlanMemoTests(TripApiMixin, TestCase):
+    def test_plan_computed_by_another_worker_is_shared(self):
+        self.create_trip()
+        (key, events), = plan_memo._memo.items()
+        # Même plan en cours dans un autre worker : bail pris, plan pas encore dans le cache partagé
+        plan_memo._memo.clear()
+        caches['route_artifacts'].delete(key)
+        other = SingleFlight(settings.SINGLE_FLIGHT['PATH'], poll_seconds=0.01)
+        self.assertTrue(other.acquire(key))
+
+        def finish():
+            caches['route_artifacts'].set(key, events)
+            other.release(key)
+
+        timer = threading.Timer(0.2, finish)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with mock.patch.object(EldLogPlannerMixin, 'generate_eld_logs', side_effect=AssertionError("planned twice")):
+            trip = self.create_trip(start_time="2025-03-29T06:00:00Z")
+        self.assertEqual(trip['logs'][0]['date'], '2025-03-29')
+
+    def counter(self, name, labels=None):
+        return metrics._counters.get((name, metrics._labels(labels)), 0)
+
+    def test_hits_misses_and_evictions(self):
+        trip = Trip.objects.get(id=self.create_trip()['id'])
+        requests_total = {result: self.counter('plan_memo_requests_total', {'result': result})
+                          for result in ('hit', 'miss')}
+        evictions = self.counter('plan_memo_evictions_total')
+        plan = mock.Mock(return_value=[])
+        with override_settings(PLAN_MEMO={'ENTRIES': 1}):
+            # Même heure de départ un autre jour : servi par le mémo
+            trip.start_time += timedelta(days=3)
+            events = plan_memo.memoized_plan(trip, trip.current_cycle_hours, plan)
+            plan.assert_not_called()
+            self.assertEqual(plan_memo.anchor_events(events, trip)[0].date, trip.start_time.date())
+            # Autre heure : planifié, et le plan précédent sort du mémo d'une entrée
+            trip.start_time += timedelta(hours=1)
+            plan_memo.memoized_plan(trip, trip.current_cycle_hours, plan)
+            plan.assert_called_once()
+        self.assertEqual(self.counter('plan_memo_requests_total', {'result': 'hit'}), requests_total['hit'] + 1)
+        self.assertEqual(self.counter('plan_memo_requests_total', {'result': 'miss'}), requests_total['miss'] + 1)
+        self.assertEqual(self.counter('plan_memo_evictions_total'), evictions + 1)
+        self.assertEqual(len(plan_memo._memo), 1)
+
+    def test_key_includes_the_utc_offset(self):
+        trip = Trip.objects.get(id=self.create_trip()['id'])
+        key = plan_memo.memo_key(trip, 10)
+        trip.start_time = datetime(2025, 4, 2, 6, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(plan_memo.memo_key(trip, 10), key)
+        # Même heure affichée dans un autre fuseau : un autre instant, donc un autre plan
+        trip.start_time = datetime(2025, 4, 2, 6, 0, tzinfo=dt_timezone(timedelta(hours=-5)))
+        self.assertNotEqual(plan_memo.memo_key(trip, 10), key)
+        self.assertNotEqual(plan_memo.memo_key(trip, 11), plan_memo.memo_key(trip, 10))
+
+
+class TripReplanTests(TripApiMixin, TestCase):
+    def test_preview_keeps_the_saved_logs(self):
+        trip = self.create_trip()
+        response = self.client.post(f"/api/trips/{trip['id']}/replan/",
+                                    {'start_time': "2025-03-22T10:00:00Z"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        preview = response.json()
+        self.assertEqual(preview['logs'][0]['start_time'], '10:00:00')
+        # Même route, sans règle liée à l'heure : l'arrivée est décalée de quatre heures
+        self.assertEqual(log_end(preview['logs']) - log_end(trip['logs']), timedelta(hours=4))
+        saved = self.client.get(f"/api/trips/{trip['id']}/").json()
+        self.assertEqual(saved['logs'], trip['logs'])
+
+    def test_persist_replaces_the_logs(self):
+        trip = self.create_trip()
+        response = self.client.post(f"/api/trips/{trip['id']}/replan/",
+                                    {'current_cycle_hours': 65, 'persist': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        replanned = response.json()
+        self.assertEqual(replanned['current_cycle_hours'], 65)
+        self.assertTrue(any(entry['location'].startswith("Redémarrage de 34 heures") for entry in replanned['logs']))
+        self.assertEqual(self.client.get(f"/api/trips/{trip['id']}/").json()['logs'], replanned['logs'])
+        self.assertEqual(LogEntry.objects.filter(trip_id=trip['id']).count(), len(replanned['logs']))
+
+    def test_invalid_input(self):
+        trip = self.create_trip()
+        for body in ({'current_cycle_hours': 71}, {'start_time': 'tomorrow'}):
+            response = self.client.post(f"/api/trips/{trip['id']}/replan/", body, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_trip_without_route(self):
+        trip = self.create_trip()
+        Trip.objects.filter(pk=trip['id']).update(route_distances=None)
+        response = self.client.post(f"/api/trips/{trip['id']}/replan/", {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TripPositionTests(TripApiMixin, TestCase):
+    """Plan de New York à Chicago : pause à Cleveland (mile 464) de 14:00 à 14:30, puis conduite jusqu'au
+    mile 549 à 15:58. À 15:00 le plan attend le camion vers le mile 480."""
+
+    def post_position(self, trip, **body):
+        # État du conducteur à 15:00 : fenêtre ouverte à 06:00, 8 h de conduite, pause prise à 14:30
+        body = {'timestamp': "2025-03-22T15:00:00Z", 'cycle_hours': 17, 'window_start': "2025-03-22T06:00:00Z",
+                'window_driving_hours': 8, 'driving_since_break': 0.5, **body}
+        response = self.client.post(f"/api/trips/{trip['id']}/position/", body, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        logs = response.json()['logs']
+        cut = next(entry for entry in logs if entry['date'] == '2025-03-22' and entry['end_time'] == '15:00:00')
+        following = logs[logs.index(cut) + 1]
+        self.assertEqual(following['start_time'], '15:00:00')
+        # La suite du plan repart de la position signalée
+        self.assertLessEqual(logs[logs.index(cut) - 1]['distance'], cut['distance'])
+        self.assertLess(cut['distance'], following['distance'])
+        return cut, logs
+
+    def test_delayed_truck_from_coordinates(self):
+        trip = self.create_trip()
+        cut, logs = self.post_position(trip, latitude=41.5, longitude=-81.7)  # Cleveland
+        self.assertEqual(cut['duty_status'], 'DRIVING')
+        self.assertLess(cut['distance'], 480)
+        self.assertTrue(cut['location'].endswith(f"({cut['distance']:.1f} miles)"))
+        self.assertEqual(cut['place'], "Cleveland, OH")
+
+    def test_delayed_truck_from_distance(self):
+        trip = self.create_trip()
+        cut, _ = self.post_position(trip, distance=470)
+        self.assertAlmostEqual(cut['distance'], 470)
+
+    def test_truck_ahead_of_plan(self):
+        trip = self.create_trip()
+        cut, logs = self.post_position(trip, distance=520)
+        self.assertAlmostEqual(cut['distance'], 520)
+        delayed = self.create_trip()
+        _, delayed_logs = self.post_position(delayed, distance=470)
+        self.assertLess(log_end(logs), log_end(delayed_logs))
+
+    def test_elapsed_logs_are_kept(self):
+        trip = self.create_trip()
+        _, logs = self.post_position(trip, distance=470)
+        elapsed = [entry for entry in trip['logs'] if entry['date'] == '2025-03-22' and entry['end_time'] <= '14:30:02']
+        self.assertEqual(logs[:len(elapsed)], elapsed)
+
+    def test_offset_start_time_is_logged_in_utc(self):
+        # 01:00 à New York est 06:00Z : les logs du trajet et de la position sont tous en UTC
+        trip = self.create_trip(start_time="2025-03-22T01:00:00-05:00")
+        self.assertEqual((trip['logs'][0]['date'], trip['logs'][0]['start_time']), ('2025-03-22', '06:00:00'))
+        cut, _ = self.post_position(trip, distance=470, timestamp="2025-03-22T10:00:00-05:00",
+                                    window_start="2025-03-22T01:00:00-05:00")
+        self.assertAlmostEqual(cut['distance'], 470)
+
+    def test_timestamp_before_departure(self):
+        trip = self.create_trip()
+        response = self.client.post(f"/api/trips/{trip['id']}/position/",
+                                    {'timestamp': "2025-03-22T05:00:00Z", 'distance': 0}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class IdempotencyKeyTests(TripApiMixin, TestCase):
+    def post(self, key, **fields):
+        return self.client.post('/api/trips/create/', {**TRIP, **fields}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post('retry-1')
+        self.assertEqual(first.status_code, 201, first.content)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        retry = self.post('retry-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_key_reused_with_another_body(self):
+        self.assertEqual(self.post('retry-2').status_code, 201)
+        response = self.post('retry-2', current_cycle_hours=20)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_original_request_still_in_progress(self):
+        now = timezone.now()
+        IdempotencyKey.objects.create(key='retry-3', fingerprint=request_fingerprint(TRIP), created_at=now,
+                                      expires_at=now + timedelta(hours=1))
+        with self.settings(IDEMPOTENCY={**settings.IDEMPOTENCY, 'WAIT_SECONDS': 0}):
+            response = self.post('retry-3')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Trip.objects.exists())
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self.post('retry-4', dropoff_location="Portland").status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key='retry-4').exists())
+        self.assertEqual(self.post('retry-4', dropoff_location="Portland, OR").status_code, 201)
+
+    def test_key_too_long(self):
+        self.assertEqual(self.post('k' * 256).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(LOG_STORAGE='packed')
+class PackedLogsTests(TripApiMixin, TestCase):
+    def test_reads_leave_the_trip_packed(self):
+        trip = self.create_trip()
+        stored = Trip.objects.get(pk=trip['id'])
+        self.assertIsNotNone(stored.packed_logs)
+        self.assertEqual(self.client.get(f"/api/trips/{trip['id']}/").json()['logs'], trip['logs'])
+        self.assertFalse(LogEntry.objects.filter(trip_id=trip['id']).exists())
+        self.assertEqual(Trip.objects.get(pk=trip['id']).packed_logs, stored.packed_logs)
+
+    def test_trip_logs_reads_the_packed_entries(self):
+        trip = self.create_trip()
+        stored = Trip.objects.get(pk=trip['id'])
+        self.assertEqual(stored.logs.count(), len(trip['logs']))
+        driving = stored.logs.filter(duty_status='DRIVING', date__gte=datetime(2025, 3, 23).date())
+        self.assertEqual(driving.count(), len([entry for entry in trip['logs']
+                                               if entry['duty_status'] == 'DRIVING' and entry['date'] >= '2025-03-23']))
+        latest = stored.logs.exclude(location__startswith='Pickup at').order_by('-date', '-start_time').first()
+        self.assertEqual((latest.date.isoformat(), latest.start_time.isoformat()),
+                         (trip['logs'][-1]['date'], trip['logs'][-1]['start_time']))
+        self.assertEqual(stored.logs.filter(trip=stored).count(), len(trip['logs']))
+        # Lecture seule : rien n'est écrit et le trajet reste packé
+        for write in (lambda: stored.logs.create(date=latest.date, duty_status='OFF_DUTY', start_time=latest.start_time,
+                                                 end_time=latest.end_time, location='x'),
+                      lambda: stored.logs.filter(duty_status='DRIVING').delete(),
+                      lambda: stored.logs.update(place='')):
+            with self.assertRaises(NotSupportedError):
+                write()
+        self.assertFalse(LogEntry.objects.filter(trip_id=trip['id']).exists())
+        self.assertEqual(Trip.objects.get(pk=trip['id']).packed_logs, stored.packed_logs)
+
+    def test_completed_packed_trips_are_archived(self):
+        trip = self.create_trip()
+        last_date = datetime.fromisoformat(trip['logs'][-1]['date']).replace(tzinfo=dt_timezone.utc)
+        self.assertFalse(completed_trips(last_date).filter(pk=trip['id']).exists())
+        self.assertTrue(completed_trips(last_date + timedelta(days=1)).filter(pk=trip['id']).exists())
+
+    def test_packed_entries_are_found_nearby(self):
+        trip = self.create_trip()
+        entry = next(entry for entry in trip['logs'] if entry['duty_status'] == 'SLEEPER_BERTH')
+        found = entries_near(entry['latitude'], entry['longitude'], 1, ['SLEEPER_BERTH'])
+        self.assertIn((trip['id'], entry['start_time']),
+                      [(log.trip_id, log.start_time.isoformat()) for _, log in found])
+
+    def test_round_trip_matches_row_storage(self):
+        packed = self.create_trip()
+        with self.settings(LOG_STORAGE='rows'):
+            rows = self.create_trip()
+        self.assertEqual(len(packed['logs']), len(rows['logs']))
+        for packed_entry, row_entry in zip(packed['logs'], rows['logs']):
+            self.assertEqual({**packed_entry, 'latitude': None, 'longitude': None},
+                             {**row_entry, 'latitude': None, 'longitude': None})
+            # Coordonnées en float32 : environ un mètre de précision
+            self.assertAlmostEqual(packed_entry['latitude'], row_entry['latitude'], places=4)
+            self.assertAlmostEqual(packed_entry['longitude'], row_entry['longitude'], places=4)
+        self.assertEqual(packed['summary'], rows['summary'])
+
+    def test_position_update_packs_the_logs_again(self):
+        trip = self.create_trip()
+        response = self.client.post(f"/api/trips/{trip['id']}/position/",
+                                    {'timestamp': "2025-03-22T15:00:00Z", 'cycle_hours': 17, 'distance': 470},
+                                    format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNotNone(Trip.objects.get(pk=trip['id']).packed_logs)
+        self.assertFalse(LogEntry.objects.filter(trip_id=trip['id']).exists())
+        self.assertEqual(self.client.get(f"/api/trips/{trip['id']}/").json()['logs'], response.json()['logs'])
+        self.assertIn('15:00:00', [entry['end_time'] for entry in response.json()['logs']])
+
+
+class DeparturesTests(TripApiMixin, TestCase):
+    def departures(self, **fields):
+        body = {**TRIP, 'window_start': "2025-03-22T21:00:00Z", 'window_hours': 6, 'step_minutes': 20, **fields}
+        body.pop('start_time')
+        response = self.client.post('/api/trips/departures/', body, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_arrivals_match_the_plan_of_each_departure(self):
+        trip = Trip.objects.get(pk=self.create_trip()['id'])
+        # Premier départ choisi pour que la livraison se termine pile à minuit : les entrées découpées à
+        # minuit diffèrent, le planning d'un départ n'est pas celui d'un autre décalé dans le temps
+        end = log_end(self.client.get(f"/api/trips/{trip.pk}/").json()['logs']).replace(tzinfo=dt_timezone.utc)
+        departure = datetime(2025, 3, 30, tzinfo=dt_timezone.utc) - (end - trip.start_time)
+        result = self.departures(window_start=departure.isoformat(), window_hours=1)
+        planner = EldLogPlannerMixin()
+        for candidate in result['candidates']:
+            trip.start_time = datetime.fromisoformat(candidate['departure'].replace('Z', '+00:00'))
+            entries = planner.generate_eld_logs(trip, trip.distance_to_pickup, trip.distance_to_dropoff,
+                                                TRIP['current_cycle_hours'], persist=False)
+            timeline = plan_timeline(entries, trip.start_time)
+            self.assertEqual(candidate['arrival'].replace('Z', '+00:00'),
+                             (trip.start_time + timeline.duration).isoformat())
+
+    def test_plans_are_memoized(self):
+        first = self.departures()
+        self.assertEqual(first['plans'], len(first['candidates']))
+        # Mêmes heures de départ le lendemain : aucun nouveau planning
+        second = self.departures(window_start="2025-03-23T21:00:00Z")
+        self.assertEqual(second['plans'], 0)
+
+    def test_restart_resets_the_cycle(self):
+        window_start = datetime(2025, 3, 22, 6, tzinfo=dt_timezone.utc)
+        self.assertEqual(cycle_hours_at(window_start + timedelta(hours=33), window_start, 60), 60)
+        self.assertEqual(cycle_hours_at(window_start + timedelta(hours=34), window_start, 60), 0)
+
+    def test_best_departures(self):
+        departure = datetime(2025, 3, 22, 6, tzinfo=dt_timezone.utc)
+        arrival = departure + timedelta(hours=30)
+        candidates = [
+            {'departure': departure, 'arrival': arrival, 'duration_hours': 30},
+            {'departure': departure + timedelta(hours=1), 'arrival': arrival, 'duration_hours': 29},
+            {'departure': departure + timedelta(hours=2), 'arrival': arrival + timedelta(hours=1), 'duration_hours': 29},
+        ]
+        self.assertEqual(best_departures(candidates, 2), candidates[1::-1])
+
+
+class RouteDistancesTests(SimpleTestCase):
+    ROUTE = [(40.0, -100.0 + k / 10) for k in range(11)]
+
+    def test_distances_are_scaled_to_the_road_distance(self):
+        planner = EldLogPlannerMixin()
+        geodesic = planner.calculate_cumulative_distances(self.ROUTE)
+        scaled = planner.calculate_route_distances(self.ROUTE[:6], self.ROUTE[5:], 30, 40)
+        # Chaque partie finit à sa distance routière, et les points restent au prorata de la géométrie
+        self.assertAlmostEqual(scaled[5], 30)
+        self.assertAlmostEqual(scaled[-1], 70)
+        self.assertAlmostEqual(scaled[3] / scaled[5], geodesic[3] / geodesic[5])
+
+    def test_unknown_road_distance_keeps_the_geodesic_distances(self):
+        planner = EldLogPlannerMixin()
+        self.assertEqual(planner.calculate_route_distances(self.ROUTE, [], None, None),
+                         planner.calculate_cumulative_distances(self.ROUTE))
+
+
+class PlaceStopsTests(SimpleTestCase):
+    """Route rectiligne d'environ 53 miles vers l'est, le long du 40e parallèle."""
+    ROUTE = [(40.0, -100.0 + k / 10) for k in range(11)]
+
+    def setUp(self):
+        super().setUp()
+        planner = EldLogPlannerMixin()
+        self.distances = planner.calculate_route_distances(self.ROUTE, [], None, None)
+        self.planner = planner
+
+    def entry(self, distance, location="10h Rest after 11h Driving", duty_status='SLEEPER_BERTH'):
+        latitude, longitude = self.planner.interpolate_coords(self.ROUTE, self.distances, distance)
+        return LogEntry(duty_status=duty_status, location=f"{location} ({distance:.1f} miles)", distance=distance,
+                        latitude=latitude, longitude=longitude)
+
+    def stop_at(self, distance, name, kind=TRUCK_STOP):
+        latitude, longitude = self.planner.interpolate_coords(self.ROUTE, self.distances, distance)
+        return {'name': name, 'kind': kind, 'highway': 'I-80', 'latitude': latitude, 'longitude': longitude}
+
+    def place(self, entries, stops):
+        with mock.patch('trips.planner.get_truck_stops', return_value=TruckStops(stops) if stops else None):
+            self.planner.place_stops(entries, self.ROUTE, self.distances)
+
+    def test_nearest_stop_within_tolerance_either_side(self):
+        rest, fuel = self.entry(20), self.entry(30, "Fuel Stop at 30.0 miles", 'ON_DUTY_NOT_DRIVING')
+        self.place([rest, fuel], [self.stop_at(18.5, "Behind"), self.stop_at(21.5, "Ahead"),
+                                  self.stop_at(29, "Rest Area", REST_AREA), self.stop_at(31.5, "Fuel")])
+        self.assertEqual(rest.location, "10h Rest after 11h Driving - Behind (20.0 miles, stop -1.5 mi)")
+        # Le mile de l'entrée reste celui du plan ; un ravitaillement exige du carburant
+        self.assertEqual(rest.distance, 20)
+        self.assertEqual(fuel.location, "Fuel Stop at 30.0 miles - Fuel (30.0 miles, stop +1.5 mi)")
+
+    def test_stop_beyond_tolerance_is_ignored(self):
+        rest = self.entry(20)
+        self.place([rest], [self.stop_at(25, "Far ahead")])
+        self.assertEqual(rest.location, "10h Rest after 11h Driving (20.0 miles)")
+
+    def test_no_dataset_configured(self):
+        rest = self.entry(20)
+        coordinates = (rest.latitude, rest.longitude)
+        self.place([rest], None)
+        self.assertEqual((rest.location, rest.latitude, rest.longitude),
+                         ("10h Rest after 11h Driving (20.0 miles)", *coordinates))
+
+
+class LocationResolutionTests(TripApiMixin, TestCase):
+    def test_names_shared_by_several_states_are_ambiguous(self):
+        gazetteer = get_gazetteer()
+        for name, expected in (("Portland", "Portland, ME"), ("Springfield", "Springfield, MA"),
+                               ("Kansas City", "Kansas City, KS")):
+            with self.assertRaises(AmbiguousPlace) as raised:
+                gazetteer.resolve(name)
+            self.assertIn(expected, [place.name for place in raised.exception.candidates])
+
+    def test_unique_and_qualified_names_resolve(self):
+        gazetteer = get_gazetteer()
+        self.assertEqual(gazetteer.resolve("portland or").name, "Portland, OR")
+        self.assertEqual(gazetteer.resolve("Amarillo").name, "Amarillo, TX")
+        self.assertEqual(gazetteer.resolve("pitsburg pa").name, "Pittsburgh, PA")
+
+    def test_ambiguous_trip_location_is_rejected(self):
+        response = self.client.post('/api/trips/create/', {**TRIP, 'dropoff_location': "Portland"}, format='json')
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertIn('dropoff_location', body)
+        self.assertEqual(body['candidates'][:2], ["Portland, OR", "Portland, ME"])
+        self.assertFalse(Trip.objects.exists())
+
+
+class EntriesNearTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        trip = Trip.objects.create(current_location="A", pickup_location="B", dropoff_location="C",
+                                   current_cycle_hours=0)
+        # Une entrée tous les 0.1 degré de longitude (environ 5.3 miles) le long du 40e parallèle
+        for k in range(60):
+            LogEntry.objects.create(trip=trip, date=datetime(2025, 3, 22).date(), duty_status='OFF_DUTY',
+                                    start_time='00:00', end_time='01:00', location=f"Stop {k}",
+                                    distance=k, latitude=40.0, longitude=-100.0 + k / 10)
+
+    def test_closest_entries_first_within_limit(self):
+        found = entries_near(40.0, -97.0, 20, limit=3)
+        self.assertEqual([entry.location for _, entry in found], ["Stop 30", "Stop 29", "Stop 31"])
+        self.assertEqual([round(miles, 1) for miles, _ in found], [0.0, 5.3, 5.3])
+
+    def test_radius_without_limit(self):
+        found = entries_near(40.0, -97.0, 12)
+        self.assertEqual(sorted(entry.location for _, entry in found),
+                         sorted(f"Stop {k}" for k in range(28, 33)))
+        self.assertTrue(all(miles <= 12 for miles, _ in found))
+
+
+class MetricsTests(TripApiMixin, TestCase):
+    def test_server_timing_header(self):
+        response = self.client.post('/api/trips/create/', TRIP, format='json')
+        self.assertEqual(response.status_code, 201)
+        stages = dict(item.split(';dur=') for item in response['Server-Timing'].split(', '))
+        self.assertIn('hos', stages)
+        self.assertIn('serialize', stages)
+        self.assertGreaterEqual(float(stages['total']), float(stages['hos']))
+
+    def test_metrics_sum_every_worker(self):
+        metrics.increment('test_worker_calls', {'kind': 'a'}, 2, help_text="Calls, for the tests.")
+        metrics.observe('test_worker_seconds', 0.2, help_text="Durations, for the tests.")
+        # Instantané d'un autre worker dans le fichier partagé
+        with closing(metrics._connect()) as connection:
+            connection.executemany(
+                'INSERT INTO metric_snapshot VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [('other', 'counter', 'test_worker_calls', '[["kind", "a"]]', "Calls, for the tests.", '3', 0),
+                 ('other', 'histogram', 'test_worker_seconds', '[]', "Durations, for the tests.",
+                  str([0] * 11 + [1] + [0] * 2 + [3.0]), 0)]
+            )
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE trip_planner_test_worker_calls counter\ntrip_planner_test_worker_calls{kind="a"} 5\n',
+                      body)
+        self.assertIn('trip_planner_test_worker_seconds_bucket{le="0.25"} 1\n', body)
+        self.assertIn('trip_planner_test_worker_seconds_bucket{le="5.0"} 2\n', body)
+        self.assertIn('trip_planner_test_worker_seconds_sum 3.200000\n', body)
+
+    def test_forked_worker_starts_from_zero(self):
+        metrics.increment('test_inherited_calls')
+        with mock.patch('trips.metrics.os.getpid', return_value=-1):
+            metrics.increment('test_forked_calls')
+            self.assertNotIn(('test_inherited_calls', ()), metrics._counters)
+            self.assertEqual(metrics._counters[('test_forked_calls', ())], 1)
+
+    def test_access_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        with override_settings(METRICS={**settings.METRICS, 'TOKEN': "s3cret"}):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7',
+                                             HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7',
+                                             HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+class LaneMatrixTests(TempDirMixin, SimpleTestCase):
+    CITIES = ["Dallas, TX", "Houston, TX", "Austin, TX"]
+    SEGMENTS = [{'distance': 239.5, 'duration': 13500.0, 'steps': [{'distance': 239.5, 'duration': 13500.0,
+                                                                       'instruction': "Head south", 'way_points': [0, 1]}]}]
+
+    def write(self, standin=False):
+        path = self.tmp_path('lanes.bin')
+        write_lane_matrix(path, self.CITIES, {("Dallas, TX", "Houston, TX"): (239.5, 3.75, '_p~iF~ps|U', self.SEGMENTS)},
+                          standin=standin)
+        matrix = LaneMatrix(path)
+        self.addCleanup(matrix.close)
+        return matrix
+
+    def test_round_trip(self):
+        matrix = self.write()
+        self.assertFalse(matrix.standin)
+        self.assertEqual(matrix.cities, self.CITIES)
+        self.assertIn("Austin, TX", matrix)
+        lane = matrix.lookup("Dallas, TX", "Houston, TX")
+        self.assertEqual((lane.distance, lane.duration, lane.geometry, lane.segments),
+                         (239.5, 3.75, '_p~iF~ps|U', self.SEGMENTS))
+        # Trajet non calculé (NaN) et ville inconnue
+        self.assertIsNone(matrix.lookup("Houston, TX", "Dallas, TX"))
+        self.assertIsNone(matrix.lookup("Dallas, TX", "Paris, TX"))
+
+    def test_standin_flag(self):
+        self.assertTrue(self.write(standin=True).standin)
+
+    def test_file_of_another_version_is_ignored(self):
+        path = self.tmp_path('old.bin')
+        with open(path, 'wb') as f:
+            f.write(b'TTPLANE1' + (1).to_bytes(4, 'little') + bytes(12))
+        with self.assertRaises(ValueError):
+            LaneMatrix(path)
+        with mock.patch.object(lane_matrix, '_matrix', None), self.assertLogs('trips.lane_matrix', 'WARNING'):
+            self.assertIsNone(load_lane_matrix(path))
+
+
+class RoadGraphTests(SimpleTestCase):
+    def test_alt_matches_dijkstra(self):
+        graph = get_road_graph()
+        for source in range(0, len(graph.names), 5):
+            durations = graph._dijkstra(source)
+            for target in range(len(graph.names)):
+                path = graph.shortest_path(source, target)
+                if durations[target] == math.inf:
+                    self.assertIsNone(path)
+                    continue
+                # L'heuristique reste admissible et le chemin trouvé a la durée minimale
+                self.assertLessEqual(graph._heuristic(source, target), durations[target] + 1e-9)
+                total = sum(min(duration for v, _, duration, _ in graph.adjacency[u] if v == w)
+                            for (u, _), (w, _) in zip(path, path[1:]))
+                self.assertAlmostEqual(total, durations[target], places=9)
+
+
+class KDTreeTests(SimpleTestCase):
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(0)
+        # Nuage mondial, plus des points de part et d'autre de l'antiméridien et près des pôles
+        points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(500)]
+        points += [(rng.uniform(-10, 10), rng.choice((-1, 1)) * rng.uniform(179, 180)) for _ in range(20)]
+        points += [(rng.choice((-1, 1)) * rng.uniform(89, 90), rng.uniform(-180, 180)) for _ in range(20)]
+        tree = KDTree(points)
+        queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(300)]
+        queries += [(0.0, 179.9), (0.0, -179.9), (89.9, 0.0), (-89.9, 120.0)]
+        for lat, lon in queries:
+            index, miles = tree.nearest(lat, lon)
+            expected = min(haversine_miles(lat, lon, *point) for point in points)
+            self.assertAlmostEqual(haversine_miles(lat, lon, *points[index]), expected, places=6)
+            self.assertAlmostEqual(miles, expected, places=3)
+
+    def test_empty_tree(self):
+        self.assertEqual(KDTree([]).nearest(40.0, -100.0), (None, None))
+
+
+class RouteIndexTests(TripApiMixin, TestCase):
+    def indexed_chunks(self, trip_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {ROUTE_INDEX_TABLE} WHERE trip_id = %s", [trip_id])
+            return cursor.fetchone()[0]
+
+    def test_trips_crossing_an_area(self):
+        trip = self.create_trip()
+        chicago = trips_crossing(bbox_polygon(41.5, -88.0, 42.2, -87.3))
+        self.assertIn(trip['id'], chicago)
+        # Chicago est le point de ramassage : l'intervalle traversant est autour de la fin de la première partie
+        stored = Trip.objects.get(id=trip['id'])
+        (start, end), = chicago[trip['id']]
+        self.assertLess(start, stored.distance_to_pickup)
+        self.assertGreater(end, stored.distance_to_pickup)
+        self.assertEqual(trips_crossing(bbox_polygon(30.0, -60.0, 31.0, -59.0)), {})
+
+    def test_deleted_trip_leaves_the_index(self):
+        trip = self.create_trip()
+        self.assertGreater(self.indexed_chunks(trip['id']), 0)
+        Trip.objects.filter(id=trip['id']).delete()
+        self.assertEqual(self.indexed_chunks(trip['id']), 0)
+
+
+class ProfilingTests(TripApiMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profiles = os.path.join(settings.VAR_DIR, 'profiles')
+        self.addCleanup(shutil.rmtree, self.profiles, ignore_errors=True)
+        self.enabled = override_settings(PROFILING={'ENABLED': True, 'DIR': self.profiles, 'MAX_FILES': 2})
+        self.enabled.enable()
+        self.addCleanup(self.enabled.disable)
+        self.staff = User.objects.create_user('admin', is_staff=True)
+
+    def profiled_get(self):
+        return self.client.get('/api/trips/', HTTP_X_PROFILE='1')
+
+    def test_only_staff_requests_are_profiled(self):
+        self.assertNotIn('X-Profile', self.profiled_get())
+        self.client.force_authenticate(User.objects.create_user('driver'))
+        self.assertNotIn('X-Profile', self.profiled_get())
+        self.client.force_authenticate(self.staff)
+        name = self.profiled_get()['X-Profile']
+        self.assertTrue(os.path.isfile(os.path.join(self.profiles, name)))
+        self.assertEqual([profile['name'] for profile in self.client.get('/api/profiles/').json()], [name])
+        summary = self.client.get(f'/api/profiles/{name}/', {'summary': '1'})
+        self.assertIn('cumulative', summary.content.decode())
+
+    def test_disabled_by_setting(self):
+        self.client.force_authenticate(self.staff)
+        with override_settings(PROFILING={**settings.PROFILING, 'ENABLED': False}):
+            self.assertNotIn('X-Profile', self.profiled_get())
+
+    def test_only_the_latest_profiles_are_kept(self):
+        self.client.force_authenticate(self.staff)
+        names = []
+        for age in (300, 200, 100):
+            names.append(self.profiled_get()['X-Profile'])
+            # Dates de modification distinctes : la rétention garde les plus récents
+            path = os.path.join(self.profiles, names[-1])
+            os.utime(path, (time.time() - age, time.time() - age))
+        self.assertEqual(sorted(os.listdir(self.profiles)), sorted(names[1:]))
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def record(self, name, level=logging.INFO):
+        return logging.makeLogRecord({'name': name, 'levelno': level})
+
+    def test_rate_of_the_longest_prefix(self):
+        sampling = SamplingFilter("trips=0.5, trips.planner=0.01")
+        self.assertEqual(sampling.rate('trips.planner'), 0.01)
+        self.assertEqual(sampling.rate('trips.planner.hos'), 0.01)
+        self.assertEqual(sampling.rate('trips.routing'), 0.5)
+        self.assertEqual(sampling.rate('tripsplanner'), 1.0)
+        self.assertEqual(sampling.rate('django.request'), 1.0)
+
+    def test_sampled_records(self):
+        sampling = SamplingFilter({'trips.planner': 0.25})
+        with mock.patch('trips.structured_logging.random.random', side_effect=[0.1, 0.3]):
+            self.assertTrue(sampling.filter(self.record('trips.planner')))
+            self.assertFalse(sampling.filter(self.record('trips.planner', logging.DEBUG)))
+        # Avertissements, erreurs et loggers non échantillonnés passent toujours
+        dropped = SamplingFilter({'trips': 0})
+        self.assertFalse(dropped.filter(self.record('trips.planner')))
+        self.assertTrue(dropped.filter(self.record('trips.planner', logging.WARNING)))
+        self.assertTrue(dropped.filter(self.record('django')))
+
+
+class UpstreamCaptureTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        override = override_settings(UPSTREAM_CAPTURE={'ENABLED': True, 'DIR': self.tmp, 'MAX_ENTRIES': 2,
+                                                       'MAX_BODY_BYTES': 10})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def response(self, body):
+        request = requests.Request('POST', 'https://api.openrouteservice.org/v2/directions/driving-hgv',
+                                   headers={'Authorization': "ors-key", 'Accept': 'application/json'}).prepare()
+        response = requests.Response()
+        response.request, response.url, response.status_code = request, request.url, 200
+        response.headers = requests.structures.CaseInsensitiveDict({'Set-Cookie': "session=1",
+                                                                    'X-Ratelimit-Remaining': '39'})
+        response._content = body
+        response.elapsed = timedelta(milliseconds=120)
+        return response
+
+    def test_nothing_is_captured_outside_a_capturing_request(self):
+        self.assertIsNone(capture_exchange('openrouteservice', self.response(b'{}')))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_captures_are_redacted_truncated_and_pruned(self):
+        token = _captures.set([])
+        self.addCleanup(_captures.reset, token)
+        names = [capture_exchange('openrouteservice', self.response(b'{"routes": [1, 2, 3]}'), {'n': n})
+                 for n in range(3)]
+        self.assertEqual(_captures.get(), names)
+        # Seules les MAX_ENTRIES captures les plus récentes restent
+        self.assertEqual(sorted(os.listdir(self.tmp)), names[1:])
+        with open(os.path.join(self.tmp, names[-1]), encoding='utf-8') as f:
+            record = json.load(f)
+        self.assertEqual(record['request_headers']['Authorization'], '<redacted>')
+        self.assertEqual(record['request_headers']['Accept'], 'application/json')
+        self.assertEqual(record['response_headers']['Set-Cookie'], '<redacted>')
+        self.assertEqual((record['request_body'], record['response_body'], record['response_bytes'], record['truncated']),
+                         ({'n': 2}, '{"routes":', 21, True))
+
+
+class ArchiveTests(TripApiMixin, TestCase):
+    def test_archived_trip_is_still_served_by_the_detail_endpoint(self):
+        old = self.create_trip()
+        recent = self.create_trip(start_time=timezone.now().isoformat())
+        detail = self.client.get(f"/api/trips/{old['id']}/").json()
+
+        out = io.StringIO()
+        call_command('archive_trips', days=90, stdout=out)
+        self.assertIn("1 trips archived", out.getvalue())
+        self.assertFalse(Trip.objects.filter(id=old['id']).exists())
+        self.assertFalse(LogEntry.objects.filter(trip_id=old['id']).exists())
+        self.assertTrue(ArchivedTrip.objects.filter(id=old['id']).exists())
+
+        # Plus dans les tables actives : le détail est relu depuis l'archive, à l'identique
+        response = self.client.get(f"/api/trips/{old['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), detail)
+        self.assertEqual([trip['id'] for trip in self.client.get('/api/trips/').json()], [recent['id']])
+        self.assertEqual(self.client.get(f"/api/trips/{recent['id'] + 1}/").status_code, 404)
+
+
+class WarmupTests(TempDirMixin, SimpleTestCase):
+    # Pas de transaction de test : l'étape database ferme la connexion
+    databases = {'default'}
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(**var_settings(self.tmp))
+        override.enable()
+        self.addCleanup(override.disable)
+        for patcher in (mock.patch.dict(circuit_breaker._breakers, clear=True),
+                        mock.patch.dict(rate_limiter._buckets, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_every_step_runs(self):
+        with self.assertLogs('trips.warmup', 'INFO') as logs:
+            timings = warm_up()
+        self.assertEqual(set(timings), {'imports', 'datasets', 'routing', 'plan', 'database'})
+        self.assertFalse([line for line in logs.output if line.startswith('ERROR')])
+        self.assertIn('trip_planner_warmup_seconds_count{step="plan"}', metrics.render())
+
+    def test_failed_step_is_skipped(self):
+        steps = [(name, mock.Mock(side_effect=RuntimeError("boom")) if name == 'plan' else step)
+                 for name, step in WARMUP_STEPS]
+        with mock.patch('trips.warmup.STEPS', steps), self.assertLogs('trips.warmup', 'INFO') as logs:
+            timings = warm_up()
+        self.assertNotIn('plan', timings)
+        self.assertIn('database', timings)
+        self.assertTrue(any("Warm-up step 'plan' failed" in line for line in logs.output))
+
+
+class RouteArtifactTests(TripApiMixin, TestCase):
+    def route_copy(self, trip, **fields):
+        copied = Trip(**{field: getattr(trip, field) for field in (
+            'route_geometry_to_pickup', 'route_geometry_to_dropoff', 'distance_to_pickup', 'distance_to_dropoff',
+            'route_segments_to_pickup', 'route_segments_to_dropoff')})
+        for name, value in fields.items():
+            setattr(copied, name, value)
+        return copied
+
+    def test_key_is_stable_for_equal_content(self):
+        trip = Trip.objects.get(id=self.create_trip()['id'])
+        key = route_artifacts.artifact_key(trip)
+        # Même contenu, dans un autre objet et avec les clés des segments dans un autre ordre
+        reordered = [dict(reversed(list(segment.items()))) for segment in trip.route_segments_to_dropoff]
+        self.assertEqual(route_artifacts.artifact_key(self.route_copy(trip)), key)
+        self.assertEqual(route_artifacts.artifact_key(self.route_copy(trip, route_segments_to_dropoff=reordered)), key)
+        # Contenu différent : autre clé
+        self.assertNotEqual(route_artifacts.artifact_key(
+            self.route_copy(trip, distance_to_dropoff=trip.distance_to_dropoff + 1)), key)
+        self.assertNotEqual(route_artifacts.artifact_key(self.route_copy(trip, route_geometry_to_pickup=None)), key)
+
+    def test_encoded_artifact_round_trip(self):
+        trip = Trip.objects.get(id=self.create_trip()['id'])
+        artifact = route_artifacts.get_route_artifact(trip)
+        self.assertEqual(route_artifacts.decode(route_artifacts.encode(artifact)), artifact)
+
+    def test_trips_of_the_same_route_share_the_artifact(self):
+        first = Trip.objects.get(id=self.create_trip()['id'])
+        second = Trip.objects.get(id=self.create_trip(start_time="2025-03-23T08:00:00Z")['id'])
+        self.assertIs(route_artifacts.get_route_artifact(first), route_artifacts.get_route_artifact(second))
+        # Un autre worker (mémoire vide) lit l'artefact encodé dans le cache partagé
+        route_artifacts._memory.clear()
+        with mock.patch('trips.route_artifacts.compute_artifact') as compute:
+            self.assertEqual(route_artifacts.get_route_artifact(second), route_artifacts.get_route_artifact(first))
+        compute.assert_not_called()
@@ -0,0 +1,88 @@
+"""Relais routiers et aires de repos sur lesquels sont placés ravitaillements, pauses et repos des logs ELD.
+
+Les relais sont lus une fois d'un fichier CSV (settings.TRUCK_STOPS['PATH'], colonnes
+name, kind, highway, latitude, longitude) et répartis dans un GridIndex. Avant de planifier
+un trajet, les relais du corridor de la route sont projetés une fois sur celle-ci ; chaque
+événement trouve ensuite le relais le plus proche de son mile par dichotomie.
+
+Le jeu de données est optionnel : les noms des relais sont écrits dans le champ location des
+logs ELD, seul un export de relais réels doit donc être configuré. Sans TRUCK_STOPS['PATH'],
+les événements gardent leur libellé et leurs coordonnées planifiés.
+"""
+import csv
+import math
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from .geo import MILES_PER_DEGREE, project_on_segment
+from .spatial import GridIndex
+
+TRUCK_STOP = 'truck_stop'  # Carburant et stationnement poids lourds
+REST_AREA = 'rest_area'  # Stationnement uniquement
+
+_truck_stops = None
+
+
+class RouteStops:
+    """Relais d'une route, triés par leur distance le long de celle-ci (miles)."""
+
+    def __init__(self, placed):
+        placed.sort(key=lambda item: item[0])
+        self.distances = [distance for distance, _ in placed]
+        self.stops = [stop for _, stop in placed]
+
+    def __len__(self):
+        return len(self.stops)
+
+    def nearest(self, distance, tolerance, kinds=None):
+        """Retourne (distance le long de la route, relais) du relais le plus proche à moins de tolerance miles, ou None."""
+        first = bisect_left(self.distances, distance - tolerance)
+        last = bisect_right(self.distances, distance + tolerance)
+        found = [i for i in range(first, last) if kinds is None or self.stops[i]['kind'] in kinds]
+        if not found:
+            return None
+        i = min(found, key=lambda i: abs(self.distances[i] - distance))
+        return self.distances[i], self.stops[i]
+
+
+class TruckStops:
+    def __init__(self, stops):
+        self.stops = stops
+        self.index = GridIndex([(stop['latitude'], stop['longitude']) for stop in stops], cell_degrees=0.25)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            stops = [
+                {**row, 'latitude': float(row['latitude']), 'longitude': float(row['longitude'])}
+                for row in csv.DictReader(f)
+            ]
+        return cls(stops)
+
+    def along_route(self, route_coords, route_distances, corridor_miles, from_index=0):
+        """Projette sur la route les relais à moins de corridor_miles de celle-ci (à partir du point from_index)."""
+        margin = corridor_miles / MILES_PER_DEGREE
+        best = {}  # Index du relais -> (écart à la route, distance le long de la route)
+        for i in range(from_index, len(route_coords) - 1):
+            start, end = route_coords[i], route_coords[i + 1]
+            # Un degré de longitude raccourcit avec la latitude : marge élargie en conséquence
+            lon_margin = margin / max(math.cos(math.radians(max(abs(start[0]), abs(end[0])))), 0.01)
+            candidates = self.index.candidates(
+                min(start[0], end[0]) - margin, min(start[1], end[1]) - lon_margin,
+                max(start[0], end[0]) + margin, max(start[1], end[1]) + lon_margin
+            )
+            for n in candidates:
+                stop = self.stops[n]
+                fraction, offset = project_on_segment(stop['latitude'], stop['longitude'], start, end)
+                if offset <= corridor_miles and (n not in best or offset < best[n][0]):
+                    best[n] = (offset, route_distances[i] + fraction * (route_distances[i + 1] - route_distances[i]))
+        return RouteStops([(distance, self.stops[n]) for n, (_, distance) in best.items()])
+
+
+def get_truck_stops():
+    """Le TruckStops configuré, ou None si aucun jeu de données n'est configuré."""
+    global _truck_stops
+    if _truck_stops is None and settings.TRUCK_STOPS['PATH']:
+        _truck_stops = TruckStops.from_file(settings.TRUCK_STOPS['PATH'])
+    return _truck_stops
@@ -0,0 +1,108 @@
+"""Capture sur demande des échanges complets avec les services amont (requêtes et réponses
+OpenRouteService), pour le débogage.
+
+Quand settings.UPSTREAM_CAPTURE['ENABLED'] est activé, un utilisateur staff peut envoyer
+l'en-tête `X-Capture-Upstream: 1` à une vue qui utilise UpstreamCaptureMixin : chaque appel
+amont fait pendant cette requête est écrit en JSON dans UPSTREAM_CAPTURE['DIR'] et les noms
+des fichiers sont renvoyés dans l'en-tête de réponse X-Upstream-Capture.
+
+Le répertoire est un tampon circulaire borné : les corps sont tronqués à MAX_BODY_BYTES et
+seules les MAX_ENTRIES captures les plus récentes sont conservées. Rien n'est écrit pour les
+autres requêtes, les contenus n'arrivent donc jamais dans les logs.
+"""
+import json
+import os
+import time
+import uuid
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# En-têtes jamais enregistrés (clé d'API)
+REDACTED_HEADERS = {'authorization', 'cookie', 'set-cookie'}
+
+_captures = ContextVar('upstream_captures', default=None)
+
+
+def capture_requested(request):
+    if not settings.UPSTREAM_CAPTURE['ENABLED'] or not request.user.is_staff:
+        return False
+    return request.headers.get('X-Capture-Upstream') == '1'
+
+
+def _headers(headers):
+    return {key: '<redacted>' if key.lower() in REDACTED_HEADERS else value for key, value in headers.items()}
+
+
+def capture_exchange(service, response, request_body=None):
+    """Enregistre une requests.Response (et le corps JSON envoyé) si la capture est active pour la requête en cours."""
+    names = _captures.get()
+    if names is None:
+        return None
+    limit = settings.UPSTREAM_CAPTURE['MAX_BODY_BYTES']
+    body = response.content
+    record = {
+        'service': service,
+        'captured_at': time.time(),
+        'method': response.request.method,
+        'url': response.url,
+        'request_headers': _headers(response.request.headers),
+        'request_body': request_body,
+        'status': response.status_code,
+        'elapsed_ms': round(response.elapsed.total_seconds() * 1000, 1),
+        'response_headers': _headers(response.headers),
+        'response_body': body[:limit].decode('utf-8', 'replace'),
+        'response_bytes': len(body),
+        'truncated': len(body) > limit,
+    }
+
+    directory = settings.UPSTREAM_CAPTURE['DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.time_ns()}-{service}-{uuid.uuid4().hex[:8]}.json"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(directory, name))
+    names.append(name)
+    _prune(directory)
+    return name
+
+
+def _prune(directory):
+    # Les noms commencent par l'horodatage en nanosecondes : l'ordre alphabétique est chronologique
+    captures = sorted(name for name in os.listdir(directory) if name.endswith('.json') and not name.startswith('.'))
+    for name in captures[:-settings.UPSTREAM_CAPTURE['MAX_ENTRIES']]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass  # Déjà supprimé par un autre worker
+
+
+class UpstreamCaptureMixin:
+    """Active la capture amont pour les requêtes d'une vue DRF qui la demandent (staff uniquement)."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.capture_token = _captures.set([]) if capture_requested(request) else None
+
+    def stop_capture(self):
+        token = getattr(self, 'capture_token', None)
+        if token is None:
+            return None
+        names = _captures.get()
+        _captures.reset(token)
+        self.capture_token = None
+        return names
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            self.stop_capture()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        names = self.stop_capture()
+        if names is not None:
+            response['X-Upstream-Capture'] = ', '.join(names)
+        return super().finalize_response(request, response, *args, **kwargs)
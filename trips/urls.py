@@ -1,8 +1,20 @@
 from django.urls import path
-from .views import TripCreateView, TripDetailView, TripListView
+from .views import (
+    LogEntryNearbyView, PlaceAutocompleteView, ProfileDownloadView, ProfileListView, RoutingQuotaView, TripCorridorView,
+    TripCreateView, TripDeparturesView, TripDetailView, TripListView, TripPositionView, TripReplanView,
+)
 
 urlpatterns = [
     path('trips/', TripListView.as_view(), name='trip-list'),
     path('trips/create/', TripCreateView.as_view(), name='trip-create'),
+    path('trips/corridor/', TripCorridorView.as_view(), name='trip-corridor'),
+    path('trips/departures/', TripDeparturesView.as_view(), name='trip-departures'),
     path('trips/<int:pk>/', TripDetailView.as_view(), name='trip-detail'),
+    path('trips/<int:pk>/replan/', TripReplanView.as_view(), name='trip-replan'),
+    path('trips/<int:pk>/position/', TripPositionView.as_view(), name='trip-position'),
+    path('logs/nearby/', LogEntryNearbyView.as_view(), name='log-nearby'),
+    path('places/autocomplete/', PlaceAutocompleteView.as_view(), name='place-autocomplete'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:name>/', ProfileDownloadView.as_view(), name='profile-download'),
+    path('routing/quota/', RoutingQuotaView.as_view(), name='routing-quota'),
 ]
\ No newline at end of file
@@ -1,104 +1,176 @@
+import logging
 import os
-import polyline
-from datetime import datetime, timedelta, time
+import requests
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from dotenv import load_dotenv
+from geopy.distance import geodesic
 from .models import Trip, LogEntry
-from .serializers import TripSerializer
-from .constants import (
-    AVERAGE_SPEED, MAX_DRIVING_HOURS_PER_WINDOW, MAX_DUTY_HOURS_PER_WINDOW,
-    MAX_DRIVING_HOURS_BEFORE_BREAK, MAX_CYCLE_HOURS, FUELING_INTERVAL,
-    MINIMUM_REST_HOURS, RESTART_HOURS, CITIES, CITIES_WITH_COORDS
-)
+from .archive import archived_trip_data
+from .serializers import LogEntrySerializer, TripSerializer, summarize_logs
+from .constants import AVERAGE_SPEED, MAX_CYCLE_HOURS, CITIES_WITH_COORDS
+from .departures import best_departures, evaluate_departures
+from .lane_matrix import get_lane_matrix
+from .metrics import increment, stage
+from .packed_logs import freeze_logs, pack_logs, packed_mode, save_logs, thaw_logs
+from .gazetteer import AmbiguousPlace, get_gazetteer, location_coords
+from .geocoding import get_reverse_geocoder
+from .idempotency import (IDEMPOTENCY_HELP, claim_key, complete_key, release_key, request_fingerprint,
+                          stored_response)
+from .planner import EldLogPlannerMixin, pack_floats
+from .plan_memo import anchor_events, memo_key, memoized_plan, shared_plan
+from .route_artifacts import get_route_artifact
+from .single_flight import get_single_flight
+from .profiling import ProfiledViewMixin, list_profiles, profile_path, profile_summary
+from .proximity import entries_near
+from .road_graph import get_road_graph
+from .route_index import (bbox_polygon, index_trip, is_available as is_route_index_available, log_windows, route_boxes,
+                          trips_crossing)
+from .circuit_breaker import get_breaker
+from .rate_limiter import get_rate_limiter
+from .routing import fetch_route
+from .upstream_capture import UpstreamCaptureMixin
+from .write_queue import lock_for_write, run_write
 
 load_dotenv()
 
-class TripListView(generics.ListAPIView):
-    queryset = Trip.objects.all()
-    serializer_class = TripSerializer
+logger = logging.getLogger(__name__)
+
+ROUTING_FALLBACKS_HELP = "Routes computed offline instead of by OpenRouteService, by reason."
+
+
+def parse_utc(value):
+    """Lit une date-heure ISO 8601 d'une requête et la ramène en UTC (UTC si aucun décalage n'est donné).
 
-class TripCreateView(generics.CreateAPIView):
+    Les dates et heures des logs suivent le fuseau du départ du trajet, qui est relu en UTC depuis
+    la base : tous les instants reçus sont ramenés en UTC pour que les logs restent dans un seul fuseau.
+    """
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return moment.astimezone(dt_timezone.utc)
+
+class TripListView(ProfiledViewMixin, generics.ListAPIView):
     queryset = Trip.objects.all()
     serializer_class = TripSerializer
 
-    def perform_create(self, serializer):
-        current_location = self.request.data.get('current_location')
-        pickup_location = self.request.data.get('pickup_location')
-        dropoff_location = self.request.data.get('dropoff_location')
-        current_cycle_hours = float(self.request.data.get('current_cycle_hours', 0))
-        start_time = self.request.data.get('start_time')
+class TripRoutingMixin:
+    """Lecture des lieux d'un trajet et calcul de sa route, partagés par la création de trajets et
+    l'optimisation des heures de départ."""
+
+    def trip_inputs(self, data):
+        """Lit et valide les lieux et les heures de cycle d'une requête.
+
+        Les noms approximatifs sont acceptés : chaque lieu est remplacé par son nom canonique du gazetteer.
+
+        Returns:
+            tuple: (current_location, pickup_location, dropoff_location, current_cycle_hours)
+        """
+        current_location = data.get('current_location')
+        pickup_location = data.get('pickup_location')
+        dropoff_location = data.get('dropoff_location')
+        current_cycle_hours = float(data.get('current_cycle_hours', 0))
 
         if not all([current_location, pickup_location, dropoff_location]):
             raise ValueError("All location fields are required.")
+        current_location = self.resolve_location('current_location', current_location)
+        pickup_location = self.resolve_location('pickup_location', pickup_location)
+        dropoff_location = self.resolve_location('dropoff_location', dropoff_location)
         if not 0 <= current_cycle_hours <= MAX_CYCLE_HOURS:
             raise ValueError(f"current_cycle_hours must be between 0 and {MAX_CYCLE_HOURS}.")
+        return current_location, pickup_location, dropoff_location, current_cycle_hours
 
-        start_time = (datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-                      if start_time else timezone.now())
+    def routed_trip(self, current_location, pickup_location, dropoff_location, fields):
+        """Construit le trajet (non enregistré) avec sa route : géométries, segments et distances cumulatives.
 
-        distance_to_pickup, distance_to_dropoff = self.calculate_distance(
-            current_location, pickup_location, dropoff_location
-        )
-        total_distance = distance_to_pickup + distance_to_dropoff
-        
-        # Utilisation des durées calculées par l'API OpenRouteService
-        estimated_duration = self.duration_to_pickup + self.duration_to_dropoff
-
-        trip = serializer.save(
-            distance=total_distance,
-            estimated_duration=estimated_duration,
-            current_cycle_hours=current_cycle_hours,
-            start_time=start_time,
-            current_location=current_location,
-            pickup_location=pickup_location,
-            dropoff_location=dropoff_location,
-            route_geometry_to_pickup=self.route_geometry_to_pickup,
-            route_geometry_to_dropoff=self.route_geometry_to_dropoff
-        )
+        Args:
+            fields (dict): Autres champs du trajet (current_cycle_hours, start_time...)
 
-        self.generate_eld_logs(trip, distance_to_pickup, distance_to_dropoff, current_cycle_hours)
+        Returns:
+            Trip: Le trajet, prêt à être planifié par generate_eld_logs.
+        """
+        with stage('routing'):
+            distance_to_pickup, distance_to_dropoff = self.calculate_distance(
+                current_location, pickup_location, dropoff_location
+            )
+
+        trip = Trip(**{
+            **fields,
+            'distance': distance_to_pickup + distance_to_dropoff,
+            # Utilisation des durées calculées par l'API OpenRouteService
+            'estimated_duration': self.duration_to_pickup + self.duration_to_dropoff,
+            'current_location': current_location,
+            'pickup_location': pickup_location,
+            'dropoff_location': dropoff_location,
+            'route_geometry_to_pickup': self.route_geometry_to_pickup,
+            'route_geometry_to_dropoff': self.route_geometry_to_dropoff,
+            'distance_to_pickup': distance_to_pickup,
+            'distance_to_dropoff': distance_to_dropoff,
+            'route_segments_to_pickup': self.segments_to_pickup,
+            'route_segments_to_dropoff': self.segments_to_dropoff,
+        })
+        # Distances cumulatives le long de la route, enregistrées pour les replanifications ; l'artefact
+        # de la route (points, distances, steps) est réutilisé par generate_eld_logs
+        with stage('route_distances'):
+            route_distances = get_route_artifact(trip).distances
+            trip.route_distances = pack_floats(route_distances) if route_distances else None
+        return trip
+
+    def resolve_location(self, field, value):
+        """Retourne le nom canonique d'un lieu (clé de CITIES_WITH_COORDS ou lieu du gazetteer).
+
+        La recherche tolère la casse, les accents, la ponctuation et les fautes de frappe.
+
+        Raises:
+            ValidationError: si aucun lieu ne correspond (réponse 400 avec des suggestions), ou si le nom
+                est ambigu (réponse 400 avec les lieux candidats, par exemple "Portland" sans État).
+        """
+        if value in CITIES_WITH_COORDS:
+            return value
+        gazetteer = get_gazetteer()
+        try:
+            place = gazetteer.resolve(value) if gazetteer else None
+        except AmbiguousPlace as e:
+            raise ValidationError({field: [f"Ambiguous location '{value}': specify the state."],
+                                   'candidates': [candidate.name for candidate in e.candidates]})
+        if place is None:
+            suggestions = [match.name for _, match in gazetteer.search(value, limit=5)] if gazetteer else []
+            raise ValidationError({field: [f"Unknown location '{value}'."], 'suggestions': suggestions})
+        return place.name
 
     def calculate_distance(self, current_location, pickup_location, dropoff_location):
-        import os
-        import requests
-        from .constants import CITIES_WITH_COORDS
-        print("here is the details : ")
-       
-        api_key = os.environ.get('MAP_API_KEY')
-        if not api_key:
-            raise ValueError("MAP_API_KEY is not set in environment variables")
-        
-        if current_location not in CITIES_WITH_COORDS:
-            raise ValueError(f"Current location '{current_location}' not found in CITIES_WITH_COORDS")
-        if pickup_location not in CITIES_WITH_COORDS:
-            raise ValueError(f"Pickup location '{pickup_location}' not found in CITIES_WITH_COORDS")
-        if dropoff_location not in CITIES_WITH_COORDS:
-            raise ValueError(f"Dropoff location '{dropoff_location}' not found in CITIES_WITH_COORDS")
+        for location in (current_location, pickup_location, dropoff_location):
+            try:
+                location_coords(location)
+            except KeyError:
+                raise ValueError(f"Location '{location}' not found in CITIES_WITH_COORDS or the gazetteer")
         
         # Initialisation des variables pour stocker les durées
         duration_to_pickup = 0
+        segments_to_pickup = []
         
         if current_location == pickup_location:
             distance_to_pickup = 0
             self.route_geometry_to_pickup = None
         else:
-            current_coords = CITIES_WITH_COORDS[current_location]
-            pickup_coords = CITIES_WITH_COORDS[pickup_location]
-            
             # Récupération de la distance, de la durée et de la géométrie de la route
-            distance_to_pickup, duration_to_pickup, geometry_to_pickup = self._calculate_route_distance(current_coords, pickup_coords, api_key)
+            distance_to_pickup, duration_to_pickup, geometry_to_pickup = self._route_lane(current_location, pickup_location)
             self.route_geometry_to_pickup = geometry_to_pickup
+            segments_to_pickup = self.route_segments
         
-        pickup_coords = CITIES_WITH_COORDS[pickup_location]
-        dropoff_coords = CITIES_WITH_COORDS[dropoff_location]
-        
-        print(f"Pickup coord : {pickup_coords}")
-        print(f"Dropoff coord : {dropoff_coords}")
-        
+        logger.debug("Pickup coord : %s, dropoff coord : %s", location_coords(pickup_location), location_coords(dropoff_location))
+
         # Récupération de la distance et de la durée
-        distance_to_dropoff, duration_to_dropoff, geometry_to_dropoff = self._calculate_route_distance(pickup_coords, dropoff_coords, api_key)
+        distance_to_dropoff, duration_to_dropoff, geometry_to_dropoff = self._route_lane(pickup_location, dropoff_location)
         self.route_geometry_to_dropoff = geometry_to_dropoff
         
         # Stockage des durées dans des attributs de l'instance pour utilisation dans perform_create
@@ -106,16 +178,55 @@ class TripCreateView(generics.CreateAPIView):
         self.duration_to_dropoff = duration_to_dropoff
         
         # Stockage des segments de route pour les deux parties du trajet
-        self.segments_to_pickup = self.route_segments if current_location != pickup_location else []
+        self.segments_to_pickup = segments_to_pickup
         self.segments_to_dropoff = self.route_segments
         
         return distance_to_pickup, distance_to_dropoff
+
+    def _route_lane(self, origin, destination):
+        """Retourne la distance, la durée et la géométrie d'un trajet entre deux villes.
+
+        La matrice de trajets précalculée (voir la commande build_lane_matrix) est consultée
+        en premier ; l'API OpenRouteService n'est appelée que pour les trajets absents. Une matrice
+        construite en lignes droites (stand-in) ne passe jamais avant une vraie route : elle ne sert
+        qu'en dernier recours, quand ni OpenRouteService ni le graphe routier n'ont de chemin.
+
+        Args:
+            origin (str): Ville de départ (clé de CITIES_WITH_COORDS ou lieu du gazetteer)
+            destination (str): Ville d'arrivée (clé de CITIES_WITH_COORDS ou lieu du gazetteer)
+
+        Returns:
+            tuple: (distance_miles, duration_hours, geometry)
+        """
+        matrix = get_lane_matrix()
+        lane = matrix.lookup(origin, destination) if matrix and not matrix.standin else None
+        if lane:
+            increment('route_lane_matrix_hits_total', help_text="Routes served by the precomputed lane matrix.")
+            self.route_segments = lane.segments
+            return lane.distance, lane.duration, lane.geometry
+
+        start_coords, end_coords = location_coords(origin), location_coords(destination)
+        api_key = os.environ.get('MAP_API_KEY')
+        if api_key:
+            lane = self._calculate_route_distance(start_coords, end_coords, api_key)
+        else:
+            # Sans clé API, le moteur de routage hors ligne prend le relais
+            increment('routing_fallbacks_total', {'reason': 'no_api_key'}, help_text=ROUTING_FALLBACKS_HELP)
+            lane = self._offline_route(start_coords, end_coords)
+        if lane[2] is None and matrix and matrix.standin:
+            # Aucune route réelle (ligne droite sans géométrie) : la matrice stand-in fournit au moins la géométrie
+            standin = matrix.lookup(origin, destination)
+            if standin:
+                self.route_segments = standin.segments
+                lane = standin.distance, standin.duration, standin.geometry
+        return tuple(lane)
     
     def _calculate_route_distance(self, start_coords, end_coords, api_key):
         """Calcule la distance et la durée entre deux points en utilisant l'API OpenRouteService.
         
         Utilise le profil 'driving-hgv' pour les camions et prend en compte les restrictions routières.
-        En cas d'échec, utilise geodesic comme solution de secours.
+        Les itinéraires sont mis en cache et l'appel est protégé par un disjoncteur (voir routing.fetch_route).
+        En cas d'échec ou de disjoncteur ouvert, utilise le moteur de routage hors ligne comme solution de secours.
         
         Args:
             start_coords (list): Coordonnées [lat, lon] du point de départ
@@ -126,86 +237,8 @@ class TripCreateView(generics.CreateAPIView):
             tuple: (distance_miles, duration_hours) - Distance en miles et durée en heures
                    basées sur les données réelles de l'API OpenRouteService
         """
-        import requests
-        
-        # OpenRouteService attend les coordonnées au format [lon, lat]
-        start = [start_coords[1], start_coords[0]]
-        end = [end_coords[1], end_coords[0]]
-        print("start : ", start)
-        print("end : ", end)
-        
-        # Configuration de l'API OpenRouteService pour les camions (HGV)
-        url = "https://api.openrouteservice.org/v2/directions/driving-hgv"
-        headers = {
-            'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
-            'Authorization': api_key,
-            'Content-Type': 'application/json; charset=utf-8'
-        }
-        
-        # Paramètres spécifiques pour les camions
-        body = {
-            "coordinates": [start, end],
-            "profile": "driving-hgv",  # Profil spécifique pour les camions
-            "preference": "recommended",  # Itinéraire recommandé
-            "units": "mi",  # Unités en miles
-            "language": "fr-fr",
-            # Paramètres optionnels pour les camions
-            "options": {
-                "vehicle_type": "hgv",  # Type de véhicule: poids lourd
-                "profile_params": {
-                    "restrictions": {
-                        "height": 4.0,  # Hauteur en mètres
-                        "width": 2.55,  # Largeur en mètres
-                        "length": 16.5,  # Longueur en mètres
-                        "weight": 40.0,  # Poids en tonnes
-                        "axleload": 11.5  # Charge par essieu en tonnes
-                    }
-                }
-            }
-        }
-        
         try:
-            # Appel à l'API OpenRouteService
-            print("Req : ", url, body, headers)
-            response = requests.post(url, json=body, headers=headers)
-            print(response.status_code, response.reason)
-            print(response.text)
-            response.raise_for_status()  # Lève une exception en cas d'erreur HTTP
-            
-            # Traitement de la réponse
-            data = response.json()
-            print("response.data : ", data)
-            
-            # Extraction de la distance (déjà en miles vu que précisé dans le corps de la requête)
-            distance_miles = data['routes'][0]['summary']['distance']
-            
-            # Extraction du temps de trajet en heures (conversion de secondes en heures)
-            duration_hours = data['routes'][0]['summary']['duration'] / 3600
-            
-            # Extraction du polyline encodé
-            geometry = data['routes'][0]['geometry']  # Polyline encodé
-            
-            # Extraction des segments de l'itinéraire pour un traitement plus granulaire
-            route_segments = []
-            if 'segments' in data['routes'][0]:
-                for segment in data['routes'][0]['segments']:
-                    # Pour chaque segment, extraire les étapes (steps)
-                    steps = []
-                    if 'steps' in segment:
-                        for step in segment['steps']:
-                            steps.append({
-                                'distance': step['distance'],  # en miles
-                                'duration': step['duration'] / 3600,  # conversion en heures
-                                'instruction': step['instruction'],
-                                'name': step['name'],
-                                'way_points': step.get('way_points', [])
-                            })
-                    
-                    route_segments.append({
-                        'distance': segment['distance'],  # en miles
-                        'duration': segment['duration'] / 3600,  # conversion en heures
-                        'steps': steps
-                    })
+            distance_miles, duration_hours, geometry, route_segments = fetch_route(start_coords, end_coords, api_key)
             
             # Stockage des segments dans des attributs de l'instance pour utilisation dans generate_eld_logs
             self.route_segments = route_segments
@@ -213,1029 +246,512 @@ class TripCreateView(generics.CreateAPIView):
             return distance_miles, duration_hours, geometry
             
         except requests.exceptions.RequestException as e:
-            # En cas d'erreur avec l'API, utiliser geodesic comme solution de secours
-            print(f"Error calculating distance with OpenRouteService: {e}")
-            
-            # Calcul de la distance à vol d'oiseau comme solution de secours
-            from geopy.distance import geodesic
-            distance_miles = geodesic((start_coords[0], start_coords[1]), (end_coords[0], end_coords[1])).miles
-            # Estimation de la durée basée sur la vitesse moyenne en cas d'échec
-            from .constants import AVERAGE_SPEED
-            duration_hours = distance_miles / AVERAGE_SPEED
-            
-            return distance_miles, duration_hours, None
+            # En cas d'erreur avec l'API, utiliser le routage hors ligne comme solution de secours
+            logger.warning("Error calculating distance with OpenRouteService: %s", e)
+            increment('routing_fallbacks_total', {'reason': type(e).__name__}, help_text=ROUTING_FALLBACKS_HELP)
+            return self._offline_route(start_coords, end_coords)
+
+    def _offline_route(self, start_coords, end_coords):
+        """Calcule l'itinéraire sur le graphe routier embarqué (voir trips/road_graph.py).
+
+        Retourne la même forme que _calculate_route_distance ; la distance à vol d'oiseau
+        n'est utilisée qu'en dernier recours si aucun chemin n'existe dans le graphe.
+        """
+        route = get_road_graph().route(start_coords, end_coords)
+        if route:
+            distance_miles, duration_hours, geometry, self.route_segments = route
+            return distance_miles, duration_hours, geometry
+        increment('routing_fallbacks_total', {'reason': 'no_road_graph_path'}, help_text=ROUTING_FALLBACKS_HELP)
+
+        # Calcul de la distance à vol d'oiseau comme solution de secours
+        distance_miles = geodesic((start_coords[0], start_coords[1]), (end_coords[0], end_coords[1])).miles
+        # Estimation de la durée basée sur la vitesse moyenne en cas d'échec
+        duration_hours = distance_miles / AVERAGE_SPEED
+        self.route_segments = []
+
+        return distance_miles, duration_hours, None
+
+class TripCreateView(ProfiledViewMixin, UpstreamCaptureMixin, TripRoutingMixin, EldLogPlannerMixin,
+                     generics.CreateAPIView):
+    queryset = Trip.objects.all()
+    serializer_class = TripSerializer
+
+    def create(self, request, *args, **kwargs):
+        """Crée un trajet. Avec l'en-tête Idempotency-Key, une nouvelle tentative de la même requête
+        reçoit la réponse enregistrée au lieu de créer un doublon (voir trips/idempotency.py).
+
+        Returns:
+            Response: 201 et le trajet créé (ou la réponse rejouée, avec l'en-tête Idempotent-Replayed),
+                      422 si la clé a été utilisée avec un autre corps, 409 si la requête d'origine est
+                      toujours en cours après l'attente.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': "Idempotency-Key ne doit pas dépasser 255 caractères."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request.data)
+        record = claim_key(key, fingerprint)
+        if record is None:
+            try:
+                response = super().create(request, *args, **kwargs)
+            except BaseException:
+                release_key(key)
+                raise
+            if status.is_success(response.status_code):
+                complete_key(key, response.status_code, response.data, response.data.get('id'))
+            else:
+                release_key(key)
+            return response
+
+        if record.fingerprint != fingerprint:
+            increment('idempotent_requests_total', {'outcome': 'mismatch'}, help_text=IDEMPOTENCY_HELP)
+            return Response({'error': "Idempotency-Key déjà utilisée pour une autre requête."},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record.status_code is None:
+            increment('idempotent_requests_total', {'outcome': 'in_progress'}, help_text=IDEMPOTENCY_HELP)
+            return Response({'error': "La requête d'origine de cette Idempotency-Key est toujours en cours."},
+                            status=status.HTTP_409_CONFLICT)
+        status_code, data = stored_response(record)
+        return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+    def perform_create(self, serializer):
+        current_location, pickup_location, dropoff_location, current_cycle_hours = self.trip_inputs(self.request.data)
+        start_time = self.request.data.get('start_time')
+        start_time = parse_utc(start_time) if start_time else timezone.now()
+
+        # Planification hors transaction : le verrou d'écriture n'est tenu que pendant les insertions
+        trip = self.routed_trip(current_location, pickup_location, dropoff_location, {
+            **serializer.validated_data,
+            'current_cycle_hours': current_cycle_hours,
+            'start_time': start_time,
+        })
+        distance_to_pickup, distance_to_dropoff = trip.distance_to_pickup, trip.distance_to_dropoff
+        # Plan mémorisé pour les mêmes entrées normalisées (voir plan_memo.py), recalé sur la date de départ ;
+        # créations simultanées du même plan (ex. : un client qui réessaie) : calculé une seule fois, les
+        # autres workers lisent le plan stocké dans le cache partagé par le premier
+        key = memo_key(trip, current_cycle_hours)
+        events = get_single_flight().run(
+            'plan', key,
+            lambda: memoized_plan(trip, current_cycle_hours, lambda: self.generate_eld_logs(
+                trip, distance_to_pickup, distance_to_dropoff, current_cycle_hours, persist=False
+            )),
+            lambda: shared_plan(key)
+        )
+        log_entries = anchor_events(events, trip)
+        if packed_mode():
+            trip.packed_logs = pack_logs(log_entries)
+        with stage('route_index'):
+            boxes = route_boxes(trip) if is_route_index_available() else None
+
+        with stage('save'):
+            serializer.instance = run_write(self._save_trip, trip, log_entries, boxes)
+
+    def _save_trip(self, trip, log_entries, boxes=None):
+        """Enregistre le trajet, ses logs (en lignes, ou déjà packés sur le trajet) et l'index de sa route
+        dans une seule transaction.
 
-    def interpolate_coords(self, route_coords, route_distances, target_distance):
-        """Interpole les coordonnées pour une distance donnée le long de la polyline.
-        
         Args:
-            route_coords (list): Liste de tuples (lat, lon) représentant les points de la polyline.
-            route_distances (list): Liste des distances cumulatives le long de la polyline.
-            target_distance (float): Distance cible en miles.
-            
+            trip (Trip): Trajet non enregistré
+            log_entries (list): LogEntry planifiées pour ce trajet
+            boxes (list): Tronçons de la route à indexer (voir route_index.route_boxes), calculés si absents
+
         Returns:
-            tuple: (latitude, longitude) interpolée, ou None si l'interpolation n'est pas possible.
+            Trip: Le trajet enregistré.
         """
-        if not route_coords or not route_distances or len(route_coords) != len(route_distances):
-            return None
-        
-        if target_distance < 0:
-            return None
-        
-        total_distance = route_distances[-1]
-        if target_distance >= total_distance:
-            return route_coords[-1]  # Retourner le dernier point si la distance dépasse
-        
-        # Trouver les deux points entre lesquels interpoler
-        for i in range(len(route_distances) - 1):
-            if route_distances[i] <= target_distance <= route_distances[i + 1]:
-                # Calculer la fraction entre les deux points
-                fraction = (target_distance - route_distances[i]) / (route_distances[i + 1] - route_distances[i])
-                # Interpoler la latitude et la longitude
-                lat = route_coords[i][0] + fraction * (route_coords[i + 1][0] - route_coords[i][0])
-                lon = route_coords[i][1] + fraction * (route_coords[i + 1][1] - route_coords[i][1])
-                return (lat, lon)
-        return None
-
-    def calculate_cumulative_distances(self, coords):
-        """Calcule les distances cumulatives le long d'une liste de coordonnées (latitude, longitude).
-        
+        with transaction.atomic():
+            trip.save()
+            if trip.packed_logs is None:
+                # Les entrées référencent le trajet : son identifiant est repris à l'insertion
+                LogEntry.objects.bulk_create(log_entries, batch_size=settings.DB_WRITES['BATCH_SIZE'])
+            index_trip(trip, boxes)
+        return trip
+
+class TripDetailView(ProfiledViewMixin, generics.RetrieveAPIView):
+    queryset = Trip.objects.all()
+    serializer_class = TripSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Trajet terminé déplacé dans l'archive (commande archive_trips) : même représentation
+            with stage('archive'):
+                data = archived_trip_data(kwargs['pk'])
+            if data is None:
+                raise
+            return Response(data)
+
+
+class TripReplanView(ProfiledViewMixin, EldLogPlannerMixin, generics.GenericAPIView):
+    """Replanifie les logs d'un trajet existant sans recalculer la route."""
+    queryset = Trip.objects.all()
+    serializer_class = TripSerializer
+
+    def post(self, request, pk):
+        """Relance la planification HOS avec une nouvelle heure de départ et/ou un nouveau cycle.
+
         Args:
-            coords (list): Liste de tuples (lat, lon) représentant les points de la polyline.
-            
+            request: Corps JSON avec 'start_time' (ISO 8601) et/ou 'current_cycle_hours',
+                     et 'persist' (booléen) pour remplacer les logs enregistrés.
+            pk (int): Identifiant du trajet
+
         Returns:
-            list: Liste des distances cumulatives en miles.
+            Response: Le trajet mis à jour si persist, sinon un aperçu des logs replanifiés.
         """
-        from geopy.distance import geodesic
-        
-        if not coords:
-            return []
-        
-        distances = [0.0]  # Distance cumulée commence à 0
-        for i in range(1, len(coords)):
-            point1 = coords[i-1]  # (lat1, lon1)
-            point2 = coords[i]    # (lat2, lon2)
-            dist = geodesic(point1, point2).miles  # Distance en miles
-            distances.append(distances[-1] + dist)  # Ajouter à la distance cumulée
-        return distances
-
-    def generate_eld_logs(self, trip, distance_to_pickup, distance_to_dropoff, current_cycle_hours):
-        current_time = trip.start_time
-        last_entry_end_time = current_time  # Suivi de la fin de la dernière entrée pour éviter les retours en arrière
-        current_distance = 0
-        
-        # Récupération des segments de route calculés par l'API OpenRouteService
-        segments_to_pickup = self.segments_to_pickup
-        segments_to_dropoff = self.segments_to_dropoff
-        
-        # Récupération des durées calculées par l'API OpenRouteService
-        duration_to_pickup = self.duration_to_pickup
-        duration_to_dropoff = self.duration_to_dropoff
-        
-        # Décoder les polylines pour obtenir les coordonnées
-        coords_to_pickup = polyline.decode(trip.route_geometry_to_pickup) if trip.route_geometry_to_pickup else []
-        coords_to_dropoff = polyline.decode(trip.route_geometry_to_dropoff)
-        
-        # Ajouter un message de débogage pour vérifier le premier point
-        if coords_to_pickup:
-            print(f"Premier point de coords_to_pickup : {coords_to_pickup[0]} (devrait être proche de {CITIES_WITH_COORDS[trip.current_location]})")
-        if coords_to_dropoff:
-            print(f"Premier point de coords_to_dropoff : {coords_to_dropoff[0]} (devrait être proche de {CITIES_WITH_COORDS[trip.pickup_location]})")
-        
-        all_coords = coords_to_pickup + coords_to_dropoff if coords_to_pickup else coords_to_dropoff
-        
-        # Calculer les distances cumulatives pour chaque partie du trajet
-        distances_to_pickup = self.calculate_cumulative_distances(coords_to_pickup)
-        distances_to_dropoff = self.calculate_cumulative_distances(coords_to_dropoff)
-        
-        # Combiner les distances cumulatives
-        if distances_to_pickup:
-            # Ajuster les distances de la deuxième partie en ajoutant la distance totale de la première partie
-            all_distances = distances_to_pickup + [d + distances_to_pickup[-1] for d in distances_to_dropoff]
-        else:
-            all_distances = distances_to_dropoff
-        
-        # Création d'une liste combinée de tous les steps du trajet pour une approche plus granulaire
-        all_steps = []
-        step_index_offset = 0
-        
-        # Ajout des steps pour aller au point de ramassage
-        for segment in segments_to_pickup:
-            for step in segment['steps']:
-                way_points = step.get('way_points', [0, 0])
-                start_idx = way_points[0] + step_index_offset
-                end_idx = way_points[1] + step_index_offset
-                all_steps.append({
-                    'distance': step['distance'],
-                    'duration': step['duration'],
-                    'instruction': step['instruction'],
-                    'name': step['name'],
-                    'phase': 'pickup',
-                    'description': f"Conduite de {trip.current_location} à {trip.pickup_location}: {step['instruction']} sur {step['name']}",
-                    'start_coords': all_coords[start_idx] if start_idx < len(all_coords) else None,
-                    'end_coords': all_coords[end_idx] if end_idx < len(all_coords) else None
-                })
-                
-        step_index_offset = len(coords_to_pickup) if coords_to_pickup else 0
-        
-        # Ajout des steps pour aller du point de ramassage à la destination
-        for segment in segments_to_dropoff:
-            for step in segment['steps']:
-                way_points = step.get('way_points', [0, 0])
-                start_idx = way_points[0] + step_index_offset
-                end_idx = way_points[1] + step_index_offset
-                all_steps.append({
-                    'distance': step['distance'],
-                    'duration': step['duration'],
-                    'instruction': step['instruction'],
-                    'name': step['name'],
-                    'phase': 'dropoff',
-                    'description': f"Conduite de {trip.pickup_location} à {trip.dropoff_location}: {step['instruction']} sur {step['name']}",
-                    'start_coords': all_coords[start_idx] if start_idx < len(all_coords) else None,
-                    'end_coords': all_coords[end_idx] if end_idx < len(all_coords) else None
-                })
-        
-        # Utilisation des steps pour une approche plus granulaire
-        total_on_duty_hours = current_cycle_hours
-        fueling_stops_made = set()
-        log_entries = []
-
-        # Ajouter un événement initial pour marquer le début du trajet
-        initial_end_time = current_time + timedelta(seconds=1)  # 15 minutes pour le départ
-        initial_coords = CITIES_WITH_COORDS[trip.current_location]  # Coordonnées de New York, NY
-        initial_latitude = initial_coords[0]  # 40.7128
-        initial_longitude = initial_coords[1]  # -74.0060
-        print(f"Adding initial entry: DRIVING from {current_time} to {initial_end_time} at 0 miles")
-        self.add_log_entry(
-            log_entries,
-            trip,
-            current_time,
-            initial_end_time,
-            'DRIVING',
-            f"Départ de {trip.current_location}",
-            0,  # Distance = 0 miles
-            initial_latitude,
-            initial_longitude
+        trip = self.get_object()
+        if trip.route_distances is None or not trip.route_geometry_to_dropoff:
+            return Response({'error': "Ce trajet n'a pas de route enregistrée, il ne peut pas être replanifié."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        start_time = request.data.get('start_time')
+        current_cycle_hours = request.data.get('current_cycle_hours', trip.current_cycle_hours)
+        try:
+            if start_time:
+                trip.start_time = parse_utc(start_time)
+            current_cycle_hours = float(current_cycle_hours)
+        except (TypeError, ValueError):
+            return Response({'error': "start_time ou current_cycle_hours invalide."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= current_cycle_hours <= MAX_CYCLE_HOURS:
+            return Response({'error': f"current_cycle_hours must be between 0 and {MAX_CYCLE_HOURS}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        trip.current_cycle_hours = current_cycle_hours
+
+        # Planification en mémoire uniquement : les logs existants restent intacts en cas d'aperçu
+        log_entries = self.generate_eld_logs(
+            trip, trip.distance_to_pickup, trip.distance_to_dropoff, current_cycle_hours, persist=False
         )
-        last_entry_end_time = initial_end_time
-        current_time = initial_end_time
-        # total_on_duty_hours += 0.25  # Ajouter 15 minutes (0.25 heures) au total des heures de service
 
-        trip_state = {"last_duty_start_time": None}
-        driving_buffer_start = None
-        driving_buffer_minutes = 0
+        if str(request.data.get('persist', '')).lower() in ('1', 'true', 'yes'):
+            with transaction.atomic():
+                save_logs(trip, log_entries)
+                trip.save(update_fields=['start_time', 'current_cycle_hours', 'packed_logs'])
+            return Response(self.get_serializer(trip).data)
 
-        total_distance = distance_to_pickup + distance_to_dropoff
-        in_initial_driving_phase = distance_to_pickup > 0
-        pickup_completed = False
-        
-        # Initialisation du compteur pour suivre la progression dans les steps
-        current_step_index = 0
-        
-        # Boucle principale utilisant les steps granulaires au lieu des segments complets
-        while current_distance < total_distance:
-            if not trip_state["last_duty_start_time"]:
-                trip_state["last_duty_start_time"] = current_time
-            
-            window_start = trip_state["last_duty_start_time"]
-            window_driving_hours = 0
-            driving_since_last_break = 0
-
-            while window_driving_hours < MAX_DRIVING_HOURS_PER_WINDOW and current_distance < total_distance:
-                time_in_window = (current_time - window_start).total_seconds() / 3600
-                if time_in_window >= MAX_DUTY_HOURS_PER_WINDOW:
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
-                                    else "Driving")
-                        # S'assurer que le start_time est >= last_entry_end_time
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
-                    # S'assurer que le start_time est >= last_entry_end_time
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: SLEEPER_BERTH from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "10h Rest after 14h Service", current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    trip_state["last_duty_start_time"] = None
-                    break
-
-                remaining_cycle_hours = MAX_CYCLE_HOURS - total_on_duty_hours
-                if remaining_cycle_hours <= 0:
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
-                                    else "Driving")
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    end_time = current_time + timedelta(hours=RESTART_HOURS)
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    total_on_duty_hours = 0
-                    trip_state["last_duty_start_time"] = None
-                    break
-
-                if in_initial_driving_phase and current_distance >= distance_to_pickup and not pickup_completed:
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', f"Conduite de {trip.current_location} à {trip.pickup_location}", current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-                        
-                    current_distance = distance_to_pickup
-
-                    pickup_end_time = current_time + timedelta(hours=1)
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Utiliser les coordonnées exactes de pickup_location (Chicago, IL) au lieu d'interpoler
-                    pickup_coords = CITIES_WITH_COORDS[trip.pickup_location]  # (41.8781, -87.6298) pour Chicago, IL
-                    latitude = pickup_coords[0]  # 41.8781
-                    longitude = pickup_coords[1]  # -87.6298
-                    print(f"Adding entry: ON_DUTY_NOT_DRIVING from {current_time} to {pickup_end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, pickup_end_time, 'ON_DUTY_NOT_DRIVING', f"Pickup at {trip.pickup_location}", current_distance, latitude, longitude)
-                    last_entry_end_time = pickup_end_time
-                    current_time = pickup_end_time
-                    total_on_duty_hours += 1
-                    pickup_completed = True
-                    in_initial_driving_phase = False
-
-                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                        end_time = current_time + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-
-                    time_in_window = (current_time - window_start).total_seconds() / 3600
-                    if time_in_window >= MAX_DUTY_HOURS_PER_WINDOW:
-                        end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: SLEEPER_BERTH from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "10h Rest after 14h Service", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        trip_state["last_duty_start_time"] = None
-                        break
-
-                    continue
-
-                if driving_since_last_break >= MAX_DRIVING_HOURS_BEFORE_BREAK:
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
-                                    else "Driving")
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    end_time = current_time + timedelta(minutes=30)
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "30min Break", current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    driving_since_last_break = 0
-                    total_on_duty_hours += 0.5
-                    
-                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                        end_time = current_time + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-                    
-                    continue
-
-                # Calcul du prochain arrêt de ravitaillement
-                next_fueling_mile = (int(current_distance // FUELING_INTERVAL) + 1) * FUELING_INTERVAL
-                print(f"Distance actuelle: {current_distance}, Prochain ravitaillement: {next_fueling_mile}, Différence: {next_fueling_mile - current_distance}")
-                if next_fueling_mile not in fueling_stops_made and current_distance + 60 >= next_fueling_mile:
-                    minutes_to_fuel = (next_fueling_mile - current_distance) / (AVERAGE_SPEED / 60)
-                    hours_to_fuel = minutes_to_fuel / 60
-                    
-                    if total_on_duty_hours + hours_to_fuel >= MAX_CYCLE_HOURS:
-                        minutes_to_cycle_limit = (MAX_CYCLE_HOURS - total_on_duty_hours) * 60
-                        if minutes_to_cycle_limit <= 0:
-                            if driving_buffer_minutes > 0:
-                                buffer_end_time = current_time
-                                location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
-                                            else "Conduite")
-                                if driving_buffer_start < last_entry_end_time:
-                                    driving_buffer_start = last_entry_end_time
-                                # Interpoler les coordonnées pour la distance actuelle
-                                coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                                latitude = coords[0] if coords else None
-                                longitude = coords[1] if coords else None
-                                print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                                self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                                last_entry_end_time = buffer_end_time
-                                driving_buffer_start = None
-                                driving_buffer_minutes = 0
-
-                            end_time = current_time + timedelta(hours=RESTART_HOURS)
-                            if current_time < last_entry_end_time:
-                                current_time = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                            last_entry_end_time = end_time
-                            current_time = end_time
-                            total_on_duty_hours = 0
-                            trip_state["last_duty_start_time"] = None
-                            break
-                        
-                        if driving_buffer_minutes > 0:
-                            buffer_end_time = current_time
-                            location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
-                                        else "Conduite")
-                            if driving_buffer_start < last_entry_end_time:
-                                driving_buffer_start = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                            last_entry_end_time = buffer_end_time
-                            driving_buffer_start = None
-                            driving_buffer_minutes = 0
-                            
-                        cycle_limit_time = current_time + timedelta(minutes=minutes_to_cycle_limit)
-                        location = (f"Conduite de {trip.current_location} à {trip.pickup_location} jusqu'à limite du cycle" if in_initial_driving_phase
-                                    else "Conduite jusqu'à limite du cycle")
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {current_time} to {cycle_limit_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, cycle_limit_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = cycle_limit_time
-                        current_time = cycle_limit_time
-                        current_distance += minutes_to_cycle_limit * (AVERAGE_SPEED / 60)
-                        window_driving_hours += minutes_to_cycle_limit / 60
-                        driving_since_last_break += minutes_to_cycle_limit / 60
-                        total_on_duty_hours = MAX_CYCLE_HOURS
-                        
-                        end_time = current_time + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-                    
-                    if window_driving_hours + hours_to_fuel > MAX_DRIVING_HOURS_PER_WINDOW:
-                        hours_to_fuel = MAX_DRIVING_HOURS_PER_WINDOW - window_driving_hours
-                        minutes_to_fuel = hours_to_fuel * 60
-
-                    if driving_since_last_break + (minutes_to_fuel / 60) > MAX_DRIVING_HOURS_BEFORE_BREAK:
-                        minutes_to_break = (MAX_DRIVING_HOURS_BEFORE_BREAK - driving_since_last_break) * 60
-                        hours_to_break = minutes_to_break / 60
-                        end_time = current_time + timedelta(minutes=minutes_to_break)
-                        
-                        if driving_buffer_minutes > 0:
-                            buffer_end_time = current_time
-                            location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
-                                        else "Conduite")
-                            if driving_buffer_start < last_entry_end_time:
-                                driving_buffer_start = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                            last_entry_end_time = buffer_end_time
-                            driving_buffer_start = None
-                            driving_buffer_minutes = 0
-
-                        location = (f"Conduite de {trip.current_location} à {trip.pickup_location} jusqu'à la pause" if in_initial_driving_phase
-                                    else "Conduite jusqu'à la pause")
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        current_distance += minutes_to_break * (AVERAGE_SPEED / 60)
-                        window_driving_hours += hours_to_break
-                        driving_since_last_break += hours_to_break
-                        total_on_duty_hours += hours_to_break
-                        
-                        if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                            end_time = current_time + timedelta(hours=RESTART_HOURS)
-                            if current_time < last_entry_end_time:
-                                current_time = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                            last_entry_end_time = end_time
-                            current_time = end_time
-                            total_on_duty_hours = 0
-                            trip_state["last_duty_start_time"] = None
-                            break
-
-                        end_time = current_time + timedelta(minutes=30)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "30min Break", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        driving_since_last_break = 0
-                        total_on_duty_hours += 0.5
-                        
-                        if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                            end_time = current_time + timedelta(hours=RESTART_HOURS)
-                            if current_time < last_entry_end_time:
-                                current_time = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                            last_entry_end_time = end_time
-                            current_time = end_time
-                            total_on_duty_hours = 0
-                            trip_state["last_duty_start_time"] = None
-                            break
-                            
-                        continue
-
-                    end_time = current_time + timedelta(minutes=minutes_to_fuel)
-                    
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
-                                    else "Driving")
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    location = (f"Driving from {trip.current_location} to {trip.pickup_location} until fuel stop" if in_initial_driving_phase
-                                else "Driving until fuel stop")
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: DRIVING from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    current_distance += minutes_to_fuel * (AVERAGE_SPEED / 60)
-                    window_driving_hours += hours_to_fuel
-                    driving_since_last_break += hours_to_fuel
-                    total_on_duty_hours += hours_to_fuel
-                    
-                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                        end_time = current_time + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-
-                    fueling_stops_made.add(next_fueling_mile)
-                    end_time = current_time + timedelta(minutes=15)
-                    fueling_location = f"Fuel Stop at {next_fueling_mile:.1f} miles"
-                    print(f"Adding fuel stop at {next_fueling_mile:.1f} miles")
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: ON_DUTY_NOT_DRIVING from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'ON_DUTY_NOT_DRIVING', fueling_location, current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    total_on_duty_hours += 0.25
-                    
-                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                        end_time = current_time + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-
-                    driving_buffer_start = None
-                    driving_buffer_minutes = 0
-                    continue
-
-                next_fueling_mile = (int(current_distance // FUELING_INTERVAL) + 1) * FUELING_INTERVAL
-                if next_fueling_mile not in fueling_stops_made and current_distance >= next_fueling_mile - 5:
-                    print(f"Fuel stop required at {next_fueling_mile} miles (current distance: {current_distance})")
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
-                                    else "Driving")
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    fueling_stops_made.add(next_fueling_mile)
-                    end_time = current_time + timedelta(minutes=15)
-                    fueling_location = f"Fuel Stop at {next_fueling_mile:.1f} miles"
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: ON_DUTY_NOT_DRIVING from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'ON_DUTY_NOT_DRIVING', fueling_location, current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    total_on_duty_hours += 0.25
-                    
-                    if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                        end_time = current_time + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-                    continue
-                
-                if current_step_index < len(all_steps):
-                    current_step = all_steps[current_step_index]
-                    
-                    max_driving_minutes = min(
-                        (MAX_DRIVING_HOURS_PER_WINDOW - window_driving_hours) * 60,
-                        (MAX_DUTY_HOURS_PER_WINDOW - time_in_window) * 60,
-                        (MAX_CYCLE_HOURS - total_on_duty_hours) * 60,
-                        (MAX_DRIVING_HOURS_BEFORE_BREAK - driving_since_last_break) * 60
-                    )
-                    
-                    step_duration_minutes = current_step['duration'] * 60
-                    driving_minutes = min(max_driving_minutes, step_duration_minutes, 60)
-                    
-                    if driving_minutes <= 0:
-                        break
-                    
-                    proportion = driving_minutes / step_duration_minutes if step_duration_minutes > 0 else 0
-                    distance_covered = current_step['distance'] * proportion
-                    
-                    end_time = current_time + timedelta(minutes=driving_minutes)
-                    current_distance += distance_covered
-                    window_driving_hours += driving_minutes / 60
-                    driving_since_last_break += driving_minutes / 60
-                    total_on_duty_hours += driving_minutes / 60
-                    
-                    if proportion >= 1 or abs(proportion - 1) < 0.001:
-                        current_step_index += 1
-                else:
-                    remaining_distance = total_distance - current_distance
-                    remaining_minutes = min(
-                        (MAX_DRIVING_HOURS_PER_WINDOW - window_driving_hours) * 60,
-                        (MAX_DUTY_HOURS_PER_WINDOW - time_in_window) * 60,
-                        remaining_distance / (AVERAGE_SPEED / 60),
-                        (MAX_CYCLE_HOURS - total_on_duty_hours) * 60,
-                        60
-                    )
-                    
-                    if remaining_minutes <= 0:
-                        break
-                    
-                    end_time = current_time + timedelta(minutes=remaining_minutes)
-                    current_distance += (AVERAGE_SPEED / 60) * remaining_minutes
-                    window_driving_hours += remaining_minutes / 60
-                    driving_since_last_break += remaining_minutes / 60
-                    total_on_duty_hours += remaining_minutes / 60
-
-                if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                    if round(total_on_duty_hours, 2) >= MAX_CYCLE_HOURS:
-                        if driving_buffer_minutes > 0:
-                            buffer_end_time = current_time + timedelta(minutes=1)
-                            location = (f"Conduite de {trip.current_location} à {trip.pickup_location}" if in_initial_driving_phase
-                                        else "Conduite")
-                            if driving_buffer_start < last_entry_end_time:
-                                driving_buffer_start = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                            last_entry_end_time = buffer_end_time
-                            driving_buffer_start = None
-                            driving_buffer_minutes = 0
-
-                        end_time = current_time + timedelta(minutes=1) + timedelta(hours=RESTART_HOURS)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: OFF_DUTY from {current_time + timedelta(minutes=1)} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time + timedelta(minutes=1), end_time, 'OFF_DUTY', "Redémarrage de 34 heures", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours = 0
-                        trip_state["last_duty_start_time"] = None
-                        break
-
-                if driving_buffer_start is None:
-                    driving_buffer_start = current_time
-                
-                if current_step_index < len(all_steps):
-                    driving_buffer_minutes += driving_minutes
-                else:
-                    driving_buffer_minutes += remaining_minutes
-                
-                if driving_buffer_minutes >= 60:
-                    buffer_end_time = end_time
-                    
-                    if current_step_index > 0 and current_step_index <= len(all_steps):
-                        step_info = all_steps[current_step_index - 1]
-                        road_name = step_info['name'] if step_info['name'] and step_info['name'] != '-' else 'route non nommée'
-                        instruction = step_info['instruction']
-                        
-                        if in_initial_driving_phase and not pickup_completed:
-                            location = f"Driving from {trip.current_location} to {trip.pickup_location}: {instruction} on {road_name}"
-                        else:
-                            location = f"Driving from {trip.pickup_location} to {trip.dropoff_location}: {instruction} on {road_name}"
-                    else:
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase and not pickup_completed
-                                    else f"Driving from {trip.pickup_location} to {trip.dropoff_location}")
-                    
-                    if driving_buffer_start < last_entry_end_time:
-                        driving_buffer_start = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                    last_entry_end_time = buffer_end_time
-                    driving_buffer_start = buffer_end_time
-                    driving_buffer_minutes = 0
-
-                current_time = end_time
-
-                if window_driving_hours >= MAX_DRIVING_HOURS_PER_WINDOW:
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        location = (f"Driving from {trip.current_location} to {trip.pickup_location}" if in_initial_driving_phase
-                                    else "Driving")
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', location, current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    time_to_window_end = MAX_DUTY_HOURS_PER_WINDOW - (current_time - window_start).total_seconds() / 3600
-                    if time_to_window_end > 0:
-                        end_time = current_time + timedelta(hours=time_to_window_end)
-                        if current_time < last_entry_end_time:
-                            current_time = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: ON_DUTY_NOT_DRIVING from {current_time} to {end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, current_time, end_time, 'ON_DUTY_NOT_DRIVING', "14h Window End", current_distance, latitude, longitude)
-                        last_entry_end_time = end_time
-                        current_time = end_time
-                        total_on_duty_hours += time_to_window_end
-                        
-                        if total_on_duty_hours >= MAX_CYCLE_HOURS:
-                            end_time = current_time + timedelta(hours=RESTART_HOURS)
-                            if current_time < last_entry_end_time:
-                                current_time = last_entry_end_time
-                            # Interpoler les coordonnées pour la distance actuelle
-                            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                            latitude = coords[0] if coords else None
-                            longitude = coords[1] if coords else None
-                            print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                            self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                            last_entry_end_time = end_time
-                            current_time = end_time
-                            total_on_duty_hours = 0
-                            trip_state["last_duty_start_time"] = None
-                            break
-                    
-                    end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: SLEEPER_BERTH from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "10h Rest after 11h Driving", current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    trip_state["last_duty_start_time"] = None
-                    break
-
-        if current_distance >= total_distance:
-            if total_on_duty_hours + 1 > MAX_CYCLE_HOURS:
-                if driving_buffer_minutes > 0:
-                    buffer_end_time = current_time
-                    if driving_buffer_start < last_entry_end_time:
-                        driving_buffer_start = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', "Conduite", current_distance, latitude, longitude)
-                    last_entry_end_time = buffer_end_time
-                    driving_buffer_start = None
-                    driving_buffer_minutes = 0
-
-                end_time = current_time + timedelta(hours=RESTART_HOURS)
-                if current_time < last_entry_end_time:
-                    current_time = last_entry_end_time
-                # Interpoler les coordonnées pour la distance actuelle
-                coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                latitude = coords[0] if coords else None
-                longitude = coords[1] if coords else None
-                print(f"Adding entry: OFF_DUTY from {current_time} to {end_time} at {current_distance} miles")
-                self.add_log_entry(log_entries, trip, current_time, end_time, 'OFF_DUTY', "34h Restart", current_distance, latitude, longitude)
-                last_entry_end_time = end_time
-                current_time = end_time
-                total_on_duty_hours = 0
-                trip_state["last_duty_start_time"] = None
-            
-            if trip_state["last_duty_start_time"]:
-                time_in_window = (current_time - trip_state["last_duty_start_time"]).total_seconds() / 3600
-                if time_in_window + 1 > MAX_DUTY_HOURS_PER_WINDOW:
-                    if driving_buffer_minutes > 0:
-                        buffer_end_time = current_time
-                        if driving_buffer_start < last_entry_end_time:
-                            driving_buffer_start = last_entry_end_time
-                        # Interpoler les coordonnées pour la distance actuelle
-                        coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                        latitude = coords[0] if coords else None
-                        longitude = coords[1] if coords else None
-                        print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                        self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', "Conduite", current_distance, latitude, longitude)
-                        last_entry_end_time = buffer_end_time
-                        driving_buffer_start = None
-                        driving_buffer_minutes = 0
-
-                    end_time = current_time + timedelta(hours=MINIMUM_REST_HOURS)
-                    if current_time < last_entry_end_time:
-                        current_time = last_entry_end_time
-                    # Interpoler les coordonnées pour la distance actuelle
-                    coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                    latitude = coords[0] if coords else None
-                    longitude = coords[1] if coords else None
-                    print(f"Adding entry: SLEEPER_BERTH from {current_time} to {end_time} at {current_distance} miles")
-                    self.add_log_entry(log_entries, trip, current_time, end_time, 'SLEEPER_BERTH', "Repos de 10h avant dépôt", current_distance, latitude, longitude)
-                    last_entry_end_time = end_time
-                    current_time = end_time
-                    trip_state["last_duty_start_time"] = None
-
-            if driving_buffer_minutes > 0:
-                buffer_end_time = current_time
-                if driving_buffer_start < last_entry_end_time:
-                    driving_buffer_start = last_entry_end_time
-                # Interpoler les coordonnées pour la distance actuelle
-                coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-                latitude = coords[0] if coords else None
-                longitude = coords[1] if coords else None
-                print(f"Adding entry: DRIVING from {driving_buffer_start} to {buffer_end_time} at {current_distance} miles")
-                self.add_log_entry(log_entries, trip, driving_buffer_start, buffer_end_time, 'DRIVING', "Conduite", current_distance, latitude, longitude)
-                last_entry_end_time = buffer_end_time
-                driving_buffer_start = None
-                driving_buffer_minutes = 0
-
-            dropoff_end_time = current_time + timedelta(hours=1)
-            if current_time < last_entry_end_time:
-                current_time = last_entry_end_time
-            # Interpoler les coordonnées pour la distance actuelle
-            coords = self.interpolate_coords(all_coords, all_distances, current_distance)
-            latitude = coords[0] if coords else None
-            longitude = coords[1] if coords else None
-            print(f"Adding entry: ON_DUTY_NOT_DRIVING from {current_time} to {dropoff_end_time} at {current_distance} miles")
-            self.add_log_entry(log_entries, trip, current_time, dropoff_end_time, 'ON_DUTY_NOT_DRIVING', f"Dropoff at {trip.dropoff_location}", current_distance, latitude, longitude)
-            last_entry_end_time = dropoff_end_time
-            total_on_duty_hours += 1
-
-        # Trier les entrées par date et heure de début pour garantir un ordre chronologique
-        log_entries.sort(key=lambda x: (x.date, x.start_time))
-        LogEntry.objects.bulk_create(log_entries)
-
-
-    def add_log_entry(self, log_entries, trip, start_time, end_time, duty_status, location, distance, latitude=None, longitude=None):
-        if start_time >= end_time:
-            return
-
-        # S'assurer que start_time et end_time sont offset-aware
-        if start_time.tzinfo is None:
-            # Si start_time est offset-naive, utiliser le fuseau horaire par défaut (UTC)
-            start_time = timezone.make_aware(start_time, timezone=timezone.utc)
-        if end_time.tzinfo is None:
-            # Si end_time est offset-naive, utiliser le fuseau horaire par défaut (UTC)
-            end_time = timezone.make_aware(end_time, timezone=timezone.utc)
-
-        location_with_distance = f"{location} ({distance:.1f} miles)"
-        current_start = start_time
-
-        while current_start < end_time:
-            # Déterminer la fin de l'entrée actuelle (minuit ou end_time)
-            next_midnight = datetime.combine(current_start.date() + timedelta(days=1), time.min, tzinfo=current_start.tzinfo)
-            current_end = min(end_time, next_midnight)
-
-            # Créer des datetime pour la nouvelle entrée, déjà offset-aware
-            new_start_dt = datetime.combine(current_start.date(), current_start.time(), tzinfo=current_start.tzinfo)
-            new_end_dt = datetime.combine(current_start.date(), current_end.time(), tzinfo=current_start.tzinfo)
-
-            # Vérifier les chevauchements
-            for entry in log_entries:
-                if entry.date == current_start.date():
-                    # Rendre les datetime des entrées existantes offset-aware en utilisant le même tzinfo
-                    entry_start_dt = datetime.combine(entry.date, entry.start_time, tzinfo=current_start.tzinfo)
-                    entry_end_dt = datetime.combine(entry.date, entry.end_time, tzinfo=current_start.tzinfo)
-                    
-                    # Vérifier que tous les datetimes sont offset-aware avant de les comparer
-                    if new_start_dt.tzinfo is None:
-                        new_start_dt = timezone.make_aware(new_start_dt, timezone=timezone.utc)
-                    if new_end_dt.tzinfo is None:
-                        new_end_dt = timezone.make_aware(new_end_dt, timezone=timezone.utc)
-                    if entry_start_dt.tzinfo is None:
-                        entry_start_dt = timezone.make_aware(entry_start_dt, timezone=timezone.utc)
-                    if entry_end_dt.tzinfo is None:
-                        entry_end_dt = timezone.make_aware(entry_end_dt, timezone=timezone.utc)
-                        
-                    if not (new_end_dt <= entry_start_dt or new_start_dt >= entry_end_dt):
-                        print(f"Chevauchement détecté : {duty_status} ({new_start_dt} - {new_end_dt}) vs {entry.duty_status} ({entry_start_dt} - {entry_end_dt})")
-                        return  # Ignorer l'ajout en cas de chevauchement
-                    
-            # Ajuster end_time uniquement pour la sauvegarde dans la base de données
-            adjusted_end_time = current_end.time()
-            if adjusted_end_time == time.min and current_end != end_time:
-                adjusted_end_time = time(23, 59, 59, 999999)
-
-            log_entries.append(LogEntry(
-                trip=trip,
-                date=current_start.date(),
-                duty_status=duty_status,
-                start_time=current_start.time(),
-                end_time=adjusted_end_time,
-                location=location_with_distance,
-                latitude=latitude,
-                longitude=longitude
-            ))
-
-            current_start = current_end
+        return Response({
+            'id': trip.id,
+            'start_time': trip.start_time,
+            'current_cycle_hours': current_cycle_hours,
+            'logs': LogEntrySerializer(log_entries, many=True).data,
+            'summary': summarize_logs(log_entries, trip.start_time.tzinfo),
+        })
 
-    
-class TripDetailView(generics.RetrieveAPIView):
+
+class TripPositionView(ProfiledViewMixin, EldLogPlannerMixin, generics.GenericAPIView):
+    """Replanifie la fin d'un trajet à partir d'une position du conducteur en cours de route."""
     queryset = Trip.objects.all()
-    serializer_class = TripSerializer
\ No newline at end of file
+    serializer_class = TripSerializer
+
+    def post(self, request, pk):
+        """Conserve les logs déjà écoulés et remplace uniquement les logs futurs.
+
+        Args:
+            request: Corps JSON avec 'timestamp' (ISO 8601, défaut : maintenant), la position
+                     ('distance' en miles depuis le départ, ou 'latitude'/'longitude' projetées sur la route),
+                     'cycle_hours' (heures du cycle de 70h consommées), et optionnellement
+                     'window_start' (début de la fenêtre de 14h), 'window_driving_hours', 'driving_since_break'.
+            pk (int): Identifiant du trajet
+
+        Returns:
+            Response: Le trajet avec ses logs mis à jour.
+        """
+        trip = self.get_object()
+        if trip.route_distances is None or not trip.route_geometry_to_dropoff:
+            return Response({'error': "Ce trajet n'a pas de route enregistrée, il ne peut pas être replanifié."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data = request.data
+        try:
+            timestamp = parse_utc(data['timestamp']) if data.get('timestamp') else timezone.now()
+            window_start = parse_utc(data['window_start']) if data.get('window_start') else None
+            cycle_hours = float(data.get('cycle_hours', trip.current_cycle_hours))
+            window_driving_hours = float(data.get('window_driving_hours', 0))
+            driving_since_break = float(data.get('driving_since_break', 0))
+            distance = float(data['distance']) if data.get('distance') is not None else None
+            latitude, longitude = data.get('latitude'), data.get('longitude')
+            if distance is None and (latitude is None or longitude is None):
+                raise ValueError("distance ou latitude/longitude requis")
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return Response({'error': "Position invalide : timestamp, distance ou latitude/longitude, cycle_hours attendus."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= cycle_hours <= MAX_CYCLE_HOURS:
+            return Response({'error': f"cycle_hours must be between 0 and {MAX_CYCLE_HOURS}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if timestamp < trip.start_time:
+            return Response({'error': "Le timestamp précède le départ du trajet."}, status=status.HTTP_400_BAD_REQUEST)
+
+        date, clock = timestamp.date(), timestamp.time()
+        with transaction.atomic():
+            lock_for_write(Trip, trip.pk)
+            # Trajet aux logs packés : remis en lignes le temps de la mise à jour, puis de nouveau packé
+            thaw_logs(trip)
+            # Logs déjà écoulés : conservés, celui en cours est tronqué à l'instant de la position
+            elapsed = trip.logs.filter(date__lt=date) | trip.logs.filter(date=date, start_time__lt=clock)
+            latest = list(elapsed.order_by('-date', '-start_time')[:2])
+            last_elapsed = latest[0] if latest else None
+            cut_short = last_elapsed is not None and last_elapsed.date == date and last_elapsed.end_time > clock
+            pickup_completed = elapsed.filter(location__startswith='Pickup at').exists()
+
+            artifact = get_route_artifact(trip)
+            if distance is None:
+                # La distance d'une entrée est celle de sa fin : l'entrée en cours n'est pas atteinte, la
+                # projection part de la dernière entrée terminée (le camion peut être en retard sur le plan)
+                completed = latest[1:] if cut_short else latest
+                from_distance = completed[0].distance if completed and completed[0].distance else 0
+                distance = self.snap_to_route(
+                    artifact.coords, artifact.distances, float(latitude), float(longitude), from_distance=from_distance
+                )
+            distance = min(max(distance, 0), trip.distance_to_pickup + trip.distance_to_dropoff)
+
+            log_entries = self.generate_eld_logs(
+                trip, trip.distance_to_pickup, trip.distance_to_dropoff, cycle_hours, persist=False,
+                resume={
+                    'time': timestamp,
+                    'distance': distance,
+                    'window_start': window_start,
+                    'window_driving_hours': window_driving_hours,
+                    'driving_since_break': driving_since_break,
+                    'pickup_completed': pickup_completed,
+                }
+            )
+
+            trip.logs.exclude(pk__in=elapsed.values('pk')).delete()
+            if cut_short:
+                # L'entrée en cours se termine à la position signalée, pas à celle prévue par le plan
+                coords = self.interpolate_coords(artifact.coords, artifact.distances, distance)
+                last_elapsed.end_time = clock
+                last_elapsed.distance = distance
+                last_elapsed.location = f"{last_elapsed.location.rsplit(' (', 1)[0]} ({distance:.1f} miles)"
+                if coords:
+                    last_elapsed.latitude, last_elapsed.longitude = coords
+                    last_elapsed.place = get_reverse_geocoder().nearest(*coords)[0] or ''
+                last_elapsed.save(update_fields=['end_time', 'distance', 'location', 'latitude', 'longitude',
+                                                 'place', 'cell'])
+            LogEntry.objects.bulk_create(log_entries, batch_size=settings.DB_WRITES['BATCH_SIZE'])
+            freeze_logs(trip)
+
+        return Response(self.get_serializer(trip).data)
+
+
+class TripDeparturesView(ProfiledViewMixin, UpstreamCaptureMixin, TripRoutingMixin, EldLogPlannerMixin, APIView):
+    """Heures de départ d'un trajet : arrivée de chaque départ candidat d'une fenêtre (voir trips/departures.py)."""
+
+    MAX_WINDOW_HOURS = 7 * 24
+    MAX_CANDIDATES = 4032
+
+    def post(self, request):
+        """Évalue les départs d'une fenêtre, toutes les step_minutes, sur la route du trajet.
+
+        Args:
+            request: Corps JSON avec current_location, pickup_location, dropoff_location,
+                current_cycle_hours (heures de cycle utilisées au début de la fenêtre), window_start
+                (maintenant par défaut), window_hours (24), step_minutes (5) et best (5).
+
+        Returns:
+            Response: La courbe des arrivées (un candidat par départ) et les meilleurs départs
+                      (arrivée la plus tôt, puis trajet le plus court).
+        """
+        try:
+            current_location, pickup_location, dropoff_location, current_cycle_hours = self.trip_inputs(request.data)
+            window_start = request.data.get('window_start')
+            window_start = parse_utc(window_start) if window_start else timezone.now()
+            window_hours = float(request.data.get('window_hours', 24))
+            step_minutes = float(request.data.get('step_minutes', 5))
+            best = int(request.data.get('best', 5))
+            if not 0 < window_hours <= self.MAX_WINDOW_HOURS:
+                raise ValueError(f"window_hours must be greater than 0 and at most {self.MAX_WINDOW_HOURS}.")
+            if step_minutes < 1:
+                raise ValueError("step_minutes must be at least 1.")
+        except (TypeError, ValueError, AttributeError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        count = int(window_hours * 60 // step_minutes) + 1
+        if count > self.MAX_CANDIDATES:
+            return Response({'error': f"At most {self.MAX_CANDIDATES} departures can be evaluated."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        departures = [window_start + timedelta(minutes=step_minutes * k) for k in range(count)]
+
+        try:
+            trip = self.routed_trip(current_location, pickup_location, dropoff_location, {
+                'current_cycle_hours': current_cycle_hours,
+                'start_time': window_start,
+            })
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        with stage('departures'):
+            candidates, plans = evaluate_departures(self, trip, departures)
+
+        return Response({
+            'current_location': current_location,
+            'pickup_location': pickup_location,
+            'dropoff_location': dropoff_location,
+            'distance': trip.distance,
+            'window_start': departures[0],
+            'window_end': departures[-1],
+            'step_minutes': step_minutes,
+            'plans': plans,
+            'best': best_departures(candidates, best),
+            'candidates': candidates,
+        })
+
+
+class TripCorridorView(APIView):
+    """Trajets dont la route traverse une zone (intempéries, fermeture de route...)."""
+
+    def get(self, request):
+        """Zone rectangulaire : paramètres min_lat, min_lon, max_lat, max_lon."""
+        try:
+            bbox = [float(request.query_params[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        except (KeyError, ValueError):
+            return Response({'error': "min_lat, min_lon, max_lat and max_lon are required numbers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return self.corridor_response(bbox_polygon(*bbox))
+
+    def post(self, request):
+        """Zone polygonale : corps JSON {'polygon': [[lat, lon], ...]} (au moins 3 sommets)."""
+        try:
+            polygon = [(float(lat), float(lon)) for lat, lon in request.data.get('polygon') or []]
+        except (TypeError, ValueError):
+            polygon = []
+        if len(polygon) < 3:
+            return Response({'error': "polygon must be a list of at least 3 [lat, lon] points."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return self.corridor_response(polygon)
+
+    def corridor_response(self, polygon):
+        """Trajets concernés, avec les portions de route (miles) et les entrées de log dans la zone.
+
+        L'index R*Tree des tronçons de route fournit les candidats ; seuls leurs segments
+        sont ensuite testés exactement contre la zone.
+        """
+        if not is_route_index_available():
+            return Response({'error': "The route index requires SQLite with R*Tree support."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        crossing = trips_crossing(polygon)
+        windows = log_windows(crossing)
+        trips = Trip.objects.filter(id__in=list(crossing)).only(
+            'id', 'current_location', 'pickup_location', 'dropoff_location', 'start_time'
+        ).order_by('id')
+        return Response([
+            {
+                'id': trip.id,
+                'current_location': trip.current_location,
+                'pickup_location': trip.pickup_location,
+                'dropoff_location': trip.dropoff_location,
+                'start_time': trip.start_time,
+                'route_intervals': [{'from_distance': start, 'to_distance': end} for start, end in crossing[trip.id]],
+                'logs': LogEntrySerializer(windows.get(trip.id, []), many=True).data,
+            }
+            for trip in trips
+        ])
+
+
+class LogEntryNearbyView(APIView):
+    """Entrées de log de tous les trajets à proximité d'un point (ex. repos de 10h à moins de 20 miles de X)."""
+
+    MAX_RADIUS_MILES = 500
+
+    def get(self, request):
+        """Entrées dans un rayon autour d'un point, les plus proches d'abord.
+
+        Args:
+            request: Paramètres 'latitude', 'longitude', 'radius' (miles, 20 par défaut),
+                     'duty_status' (statuts séparés par des virgules), 'date_from' / 'date_to'
+                     (AAAA-MM-JJ, inclus) et 'limit' (100 par défaut, 1000 au plus)
+
+        Returns:
+            Response: Liste des entrées avec 'trip' et 'distance_from_point' (miles)
+        """
+        params = request.query_params
+        try:
+            latitude, longitude = float(params['latitude']), float(params['longitude'])
+            radius = float(params.get('radius', 20))
+            limit = min(max(int(params.get('limit', 100)), 1), 1000)
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius <= self.MAX_RADIUS_MILES):
+                raise ValueError
+        except (KeyError, ValueError):
+            return Response({'error': "latitude and longitude are required numbers, radius at most "
+                                      f"{self.MAX_RADIUS_MILES} miles."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        duty_statuses = [value for value in params.get('duty_status', '').split(',') if value]
+        unknown = set(duty_statuses) - {choice for choice, _ in LogEntry.STATUS_CHOICES}
+        if unknown:
+            return Response({'error': f"Unknown duty_status: {', '.join(sorted(unknown))}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        dates = {}
+        for key in ('date_from', 'date_to'):
+            if params.get(key):
+                dates[key] = parse_date(params[key])
+                if dates[key] is None:
+                    return Response({'error': f"{key} must be a date (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = entries_near(latitude, longitude, radius, duty_statuses, limit=limit, **dates)
+        return Response([
+            {'trip': entry.trip_id, 'distance_from_point': round(miles, 2), **LogEntrySerializer(entry).data}
+            for miles, entry in found
+        ])
+
+
+class PlaceAutocompleteView(APIView):
+    """Autocomplétion des lieux du gazetteer pour les champs de localisation."""
+
+    def get(self, request):
+        """Lieux commençant par 'q' (les plus peuplés d'abord), complétés par une recherche approximative.
+
+        Args:
+            request: Paramètres 'q' (texte saisi) et 'limit' (10 par défaut, 50 au plus)
+
+        Returns:
+            Response: Liste de {'name', 'latitude', 'longitude'}
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        gazetteer = get_gazetteer()
+        if gazetteer is None or not query.strip():
+            return Response([])
+
+        places = gazetteer.prefix(query, limit)
+        if len(places) < limit:
+            names = {place.name for place in places}
+            places += [place for _, place in gazetteer.search(query, limit) if place.name not in names][:limit - len(places)]
+        return Response([
+            {'name': place.name, 'latitude': place.latitude, 'longitude': place.longitude} for place in places
+        ])
+
+
+class ProfileListView(APIView):
+    """Profils de requêtes enregistrés (voir trips/profiling.py), du plus récent au plus ancien."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list_profiles())
+
+
+class ProfileDownloadView(APIView):
+    """Téléchargement d'un profil (format pstats), ou résumé texte avec ?summary=1."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        path = profile_path(name)
+        if path is None:
+            return Response({'error': f"Unknown profile '{name}'."}, status=status.HTTP_404_NOT_FOUND)
+        if request.query_params.get('summary') == '1':
+            return HttpResponse(profile_summary(path), content_type='text/plain; charset=utf-8')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+
+class RoutingQuotaView(APIView):
+    """Quota OpenRouteService restant (partagé entre workers) et état du disjoncteur."""
+
+    def get(self, request):
+        return Response({
+            'quota': get_rate_limiter('openrouteservice').remaining(),
+            'circuit_breaker': get_breaker('openrouteservice').state,
+        })
@@ -0,0 +1,138 @@
+"""Préchauffage des workers : paie les coûts de démarrage uniques avant la première requête plutôt que pendant.
+
+Django importe la configuration d'URL (et avec elle les vues, les sérialiseurs, le planificateur,
+le client de routage et geopy) à la première requête, et les jeux de données partagés
+(gazetteer, graphe routier, géocodeur inverse, relais routiers) sont chargés à la première
+utilisation. Avec settings.WARMUP_ENABLED, TripsConfig.ready() appelle `warm_up`, qui fait
+tout cela au démarrage :
+
+    imports      la configuration d'URL et les modules qu'elle importe, chronométrés un à un
+    datasets     gazetteer, graphe routier, géocodeur inverse, relais routiers (ready() mappe la matrice des trajets)
+    routing      cache d'itinéraires, disjoncteur et stockage des quotas d'OpenRouteService
+    plan         une planification en mémoire sur le graphe routier (distances géodésiques, boucle HOS, placement des arrêts)
+    database     une connexion ouverte (pragmas SQLite de settings.DATABASES), puis fermée pour qu'aucune
+                 connexion ne soit partagée avec les workers forkés
+
+Chaque étape est chronométrée : les durées sont loguées en INFO et exportées sur /metrics dans
+l'histogramme warmup_seconds. Une étape en échec est loguée et sautée ; elle n'empêche jamais
+le worker de démarrer.
+"""
+import importlib
+import logging
+import time
+
+import polyline
+
+logger = logging.getLogger(__name__)
+
+# Modules importés par la première requête ; la configuration d'URL les importe presque tous
+IMPORTS = ['requests', 'geopy.distance', 'polyline', 'rest_framework.views', 'trips.planner', 'trips.routing',
+           'trips.serializers', 'trips.views', 'trip_planner.urls']
+SAMPLE_LANE = ('Dallas, TX', 'Houston, TX')
+
+
+def warm_imports():
+    """Importe les modules d'IMPORTS ; retourne {module: secondes} (0 pour les modules déjà importés)."""
+    timings = {}
+    for module in IMPORTS:
+        started = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = time.perf_counter() - started
+    # Résolution des routes : compile les motifs d'URL
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    return timings
+
+
+def warm_datasets():
+    from .gazetteer import get_gazetteer
+    from .geocoding import get_reverse_geocoder
+    from .road_graph import get_road_graph
+    from .truck_stops import get_truck_stops
+
+    get_gazetteer()
+    get_road_graph()
+    get_reverse_geocoder()
+    get_truck_stops()
+
+
+def warm_routing():
+    from django.core.cache import caches
+
+    from .circuit_breaker import get_breaker
+    from .rate_limiter import get_rate_limiter
+
+    caches['routes'].get('warmup')
+    get_breaker('openrouteservice').state
+    get_rate_limiter('openrouteservice').remaining()
+
+
+def warm_plan():
+    """Planifie un trajet court en mémoire sur le graphe routier, par le même code que la création de trajet."""
+    from django.utils import timezone
+
+    from .gazetteer import location_coords
+    from .models import Trip
+    from .planner import EldLogPlannerMixin, pack_floats
+    from .road_graph import get_road_graph
+
+    pickup, dropoff = SAMPLE_LANE
+    route = get_road_graph().route(location_coords(pickup), location_coords(dropoff))
+    if not route:
+        return
+    distance, duration, geometry, segments = route
+    planner = EldLogPlannerMixin()
+    distances = planner.calculate_route_distances([], polyline.decode(geometry), 0, distance)
+    trip = Trip(current_location=pickup, pickup_location=pickup, dropoff_location=dropoff, current_cycle_hours=0,
+                start_time=timezone.now(), distance=distance, estimated_duration=duration,
+                route_geometry_to_dropoff=geometry, distance_to_pickup=0, distance_to_dropoff=distance,
+                route_segments_to_pickup=[], route_segments_to_dropoff=segments,
+                route_distances=pack_floats(distances))
+    planner.generate_eld_logs(trip, 0, distance, 0, persist=False)
+
+
+def warm_database():
+    from django.db import connection
+
+    # Pas de requête : Django déconseille d'interroger la base pendant AppConfig.ready()
+    try:
+        connection.ensure_connection()
+    finally:
+        connection.close()
+
+
+STEPS = [('datasets', warm_datasets), ('routing', warm_routing), ('plan', warm_plan), ('database', warm_database)]
+
+
+def warm_up():
+    """Exécute les étapes du préchauffage ; retourne {étape: secondes} des étapes réussies."""
+    from .metrics import flush, observe
+
+    started = time.perf_counter()
+    timings = {}
+    try:
+        imports = warm_imports()
+        timings['imports'] = sum(imports.values())
+        logger.info("Warm-up imports: %s", ', '.join(f"{module} {seconds * 1000:.0f} ms"
+                                                      for module, seconds in imports.items()))
+    except Exception:
+        logger.exception("Warm-up step 'imports' failed")
+    for name, step in STEPS:
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step '%s' failed", name)
+            continue
+        timings[name] = time.perf_counter() - step_started
+
+    for name, seconds in timings.items():
+        observe('warmup_seconds', seconds, {'step': name}, "Duration of the worker warm-up steps.")
+    # Publié tout de suite : lancé dans le processus maître (--preload), dont les workers forkés repartent de zéro
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not publish the warm-up metrics")
+    logger.info("Warm-up done in %.0f ms (%s)", (time.perf_counter() - started) * 1000,
+                ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+    return timings
@@ -0,0 +1,66 @@
+"""File d'écriture du processus : écritures en base exécutées une à une par un seul thread.
+
+SQLite n'accepte qu'un écrivain à la fois. Quand les requêtes d'un worker écrivent en même
+temps, elles attendent le verrou de la base (jusqu'au busy timeout de settings.DATABASES) et
+réessaient dans le busy handler de SQLite, ce qui ajoute de la latence et bloque sous charge.
+Avec settings.DB_WRITES['QUEUE'] activé, `run_write` confie l'écriture au thread écrivain du
+processus : les écritures d'un même processus attendent leur tour en Python, et seuls les
+écrivains de processus différents se disputent encore le verrou.
+
+Sans la file, `run_write` appelle simplement la fonction dans le thread courant.
+
+Les transactions sont différées (comportement par défaut de SQLite) : celle qui lit avant
+d'écrire prend le verrou d'écriture à sa première écriture, et échoue aussitôt si un autre
+écrivain a validé entre-temps. Les quelques transactions qui lisent puis écrivent appellent
+d'abord `lock_for_write`.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import F
+
+from .metrics import record
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        return _executor
+
+
+def run_write(func, *args, **kwargs):
+    """Exécute func(*args, **kwargs) dans le thread écrivain si la file est activée, et retourne son résultat.
+
+    Les exceptions levées par func sont relevées chez l'appelant. Le temps d'attente dans
+    la file est enregistré comme étape 'write_queue' de la requête.
+    """
+    if not settings.DB_WRITES['QUEUE']:
+        return func(*args, **kwargs)
+
+    submitted = time.perf_counter()
+
+    def job():
+        waited = time.perf_counter() - submitted
+        return waited, func(*args, **kwargs)
+
+    waited, result = _get_executor().submit(job).result()
+    record('write_queue', waited)
+    return result
+
+
+def lock_for_write(model, pk):
+    """Prend le verrou d'écriture de la base dans la transaction courante.
+
+    SQLite n'a pas de SELECT ... FOR UPDATE : un UPDATE neutre de la ligne fait de la
+    transaction un écrivain dès sa première instruction ; elle attend donc le verrou
+    (busy timeout) et ses lectures suivantes voient le dernier état validé.
+    """
+    name = model._meta.pk.name
+    model.objects.filter(pk=pk).update(**{name: F(name)})